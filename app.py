@@ -1,172 +1,63 @@
-from flask import Flask, request, jsonify, render_template
+if __name__ == '__main__':
+    # Serve through main.py so this file is only ever loaded as the `app`
+    # module: spawned chart workers re-import __main__, and must not re-run
+    # the start-up below. run_path swaps main.py in as __main__ while it runs.
+    import os
+    import runpy
+    runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'), run_name='__main__')
+    raise SystemExit(0)
+
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from flask_cors import CORS
 import requests
+import json
 import os
 import re
-from datetime import datetime
+import functools
+import hmac
+import threading
+import time
+from datetime import date, datetime
 import uuid
-from kerykeion import AstrologicalSubject, NatalAspects
+from charts import chart_cache, warm_chart_stack
+from chart_engine import ChartEngine, compute_record, parse_birth_record
+from jobs import JobQueue
+from storage import open_store
+from history import HistoryManager, estimate_tokens
+from response_cache import ResponseCache, normalize_question
+from transits import chart_with_transits, natal_from_text, shared_transit_engine
+import chart_model
+import synastry
+from minimax_client import MiniMaxClient, CircuitBreaker, UpstreamError, UpstreamStatusError
+from llm_router import Router, load_backends
+from cohorts import PlacementIndex, keep_synced
+from transfer import encode_records, export_records, import_records, parse_cursor, read_lines
+from speculation import Speculator
+from warmup import Warmup
+from limits import AdmissionController, RateLimited, RateLimiter, SingleFlight, TurnGate, open_limits
+from log import log, log_stats
+from payloads import FastJSONProvider, compress_response, make_etag, not_modified, tagged, dumps as encode_json
+from metrics import registry, time_stage, stage_seconds, http_request_seconds, http_responses, fallbacks, \
+    upstream_timeouts, llm_inflight, rate_limited
 
 app = Flask(__name__)
 app.secret_key = 'oracool-hackathon-secret-key-2024'
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
 CORS(app)
 
-users = {}
-conversations = {}
-
-SIGN_FULL_NAMES = {
-    'Ari': 'Aries', 'Tau': 'Taurus', 'Gem': 'Gemini', 'Can': 'Cancer',
-    'Leo': 'Leo', 'Vir': 'Virgo', 'Lib': 'Libra', 'Sco': 'Scorpio',
-    'Sag': 'Sagittarius', 'Cap': 'Capricorn', 'Aqu': 'Aquarius', 'Pis': 'Pisces'
-}
-
-HOUSE_NUMBERS = {
-    'First_House': '1st', 'Second_House': '2nd', 'Third_House': '3rd',
-    'Fourth_House': '4th', 'Fifth_House': '5th', 'Sixth_House': '6th',
-    'Seventh_House': '7th', 'Eighth_House': '8th', 'Ninth_House': '9th',
-    'Tenth_House': '10th', 'Eleventh_House': '11th', 'Twelfth_House': '12th'
-}
-
-
-def format_position(degrees):
-    d = int(degrees)
-    m = int((degrees - d) * 60)
-    return f"{d}°{m:02d}'"
-
-
-SIGN_SYMBOLS = {
-    'Aries': '\u2648', 'Taurus': '\u2649', 'Gemini': '\u264a', 'Cancer': '\u264b',
-    'Leo': '\u264c', 'Virgo': '\u264d', 'Libra': '\u264e', 'Scorpio': '\u264f',
-    'Sagittarius': '\u2650', 'Capricorn': '\u2651', 'Aquarius': '\u2652', 'Pisces': '\u2653'
-}
-
-PLANET_SYMBOLS = {
-    'Sun': '\u2609', 'Moon': '\u263d', 'Mercury': '\u263f', 'Venus': '\u2640',
-    'Mars': '\u2642', 'Jupiter': '\u2643', 'Saturn': '\u2644', 'Uranus': '\u2645',
-    'Neptune': '\u2646', 'Pluto': '\u2647'
-}
+store = open_store(os.environ.get('STORE_BACKEND', 'sqlite'), os.environ.get('STORE_PATH', 'oracool.db'))
 
-PLANET_MEANINGS = {
-    'Sun': 'Core identity & ego',
-    'Moon': 'Emotions & inner self',
-    'Mercury': 'Communication & thinking',
-    'Venus': 'Love & values',
-    'Mars': 'Drive & action',
-    'Jupiter': 'Growth & expansion',
-    'Saturn': 'Discipline & lessons',
-    'Uranus': 'Change & innovation',
-    'Neptune': 'Dreams & intuition',
-    'Pluto': 'Transformation & power'
-}
 
-
-def compute_chart(name, year, month, day, hour, minute, city, nation=''):
+def run_blocking(fn, *args):
+    """Run CPU-bound work off the event loop when serving under gevent."""
     try:
-        if nation:
-            subject = AstrologicalSubject(name, year, month, day, hour, minute, city=city, nation=nation)
-        else:
-            subject = AstrologicalSubject(name, year, month, day, hour, minute, city=city)
-
-        planet_names = ['sun', 'moon', 'mercury', 'venus', 'mars', 'jupiter', 'saturn', 'uranus', 'neptune', 'pluto']
-        planets = []
-        for pname in planet_names:
-            p = getattr(subject, pname)
-            sign = SIGN_FULL_NAMES.get(p.sign, p.sign)
-            house = HOUSE_NUMBERS.get(p.house, p.house)
-            pos = format_position(p.position)
-            planets.append({
-                'name': p.name, 'sign': sign, 'position': pos,
-                'house': house, 'retrograde': p.retrograde,
-                'abs_pos': p.abs_pos,
-                'symbol': PLANET_SYMBOLS.get(p.name, ''),
-                'sign_symbol': SIGN_SYMBOLS.get(sign, ''),
-                'meaning': PLANET_MEANINGS.get(p.name, '')
-            })
-
-        nn = subject.true_north_lunar_node
-        nn_sign = SIGN_FULL_NAMES.get(nn.sign, nn.sign)
-        nn_house = HOUSE_NUMBERS.get(nn.house, nn.house)
-        nn_pos = format_position(nn.position)
-
-        asc = subject.first_house
-        mc = subject.tenth_house
-        asc_sign = SIGN_FULL_NAMES.get(asc.sign, asc.sign)
-        mc_sign = SIGN_FULL_NAMES.get(mc.sign, mc.sign)
-
-        aspects_obj = NatalAspects(subject)
-        aspect_list_text = []
-        aspect_list_json = []
-        for a in aspects_obj.relevant_aspects:
-            if a.p1_name in ['Sun','Moon','Mercury','Venus','Mars','Jupiter','Saturn','Uranus','Neptune','Pluto'] and \
-               a.p2_name in ['Sun','Moon','Mercury','Venus','Mars','Jupiter','Saturn','Uranus','Neptune','Pluto']:
-                p1_data = next((p for p in planets if p['name'] == a.p1_name), None)
-                p2_data = next((p for p in planets if p['name'] == a.p2_name), None)
-                aspect_name = a.aspect.replace('_', ' ')
-                orbit_str = f"{a.orbit:.1f}"
-                detail = ""
-                if p1_data and p2_data:
-                    detail = f" ({p1_data['house']} House / {p2_data['house']} House)"
-                aspect_list_text.append(f"- {a.p1_name} {aspect_name} {a.p2_name}{detail}, orb {orbit_str}°")
-                aspect_list_json.append({
-                    'planet1': a.p1_name,
-                    'planet2': a.p2_name,
-                    'aspect': aspect_name,
-                    'orb': round(a.orbit, 1)
-                })
-
-        lines = []
-        lines.append(f"BIRTH CHART FOR: {name}")
-        lines.append(f"Born: {month}/{day}/{year} at {hour:02d}:{minute:02d}")
-        lines.append(f"Location: {city}")
-        lines.append("")
-        lines.append("PLANETARY PLACEMENTS:")
-        lines.append("")
-        for p in planets:
-            retro_str = ' Retrograde' if p['retrograde'] else ''
-            lines.append(f"{p['name']} in {p['sign']} ({p['position']}) in {p['house']} House{retro_str}")
-        lines.append(f"North Node in {nn_sign} ({nn_pos}) in {nn_house} House")
-        lines.append("")
-        lines.append(f"Rising Sign / Ascendant: {asc_sign} ({format_position(asc.position)})")
-        lines.append(f"Midheaven (MC): {mc_sign} ({format_position(mc.position)}) — 10th House")
-        lines.append("")
-        lines.append("KEY ASPECTS:")
-        for asp in aspect_list_text[:15]:
-            lines.append(asp)
-
-        house_groups = {}
-        for p in planets:
-            h = p['house']
-            if h not in house_groups:
-                house_groups[h] = []
-            house_groups[h].append(p['name'])
-        stelliums = {h: ps for h, ps in house_groups.items() if len(ps) >= 3}
-        if stelliums:
-            lines.append("")
-            lines.append("HOUSE EMPHASIS:")
-            for h, ps in stelliums.items():
-                lines.append(f"- Stellium in {h} House ({', '.join(ps)}): Multiple planets concentrate energy here")
-            for h, ps in house_groups.items():
-                if len(ps) == 2:
-                    lines.append(f"- {h} House ({', '.join(ps)}): Significant focus area")
-
-        chart_text = "\n".join(lines)
-
-        chart_json = {
-            'planets': [{k: v for k, v in p.items() if k != 'abs_pos'} for p in planets],
-            'northNode': {'sign': nn_sign, 'position': nn_pos, 'house': nn_house},
-            'ascendant': {'sign': asc_sign, 'position': format_position(asc.position), 'symbol': SIGN_SYMBOLS.get(asc_sign, '')},
-            'midheaven': {'sign': mc_sign, 'position': format_position(mc.position), 'symbol': SIGN_SYMBOLS.get(mc_sign, '')},
-            'aspects': aspect_list_json[:15],
-        }
-
-        print(f"Chart computed successfully for {name}: {len(chart_text)} chars, {len(aspect_list_text)} aspects")
-        return chart_text, chart_json
-
-    except Exception as e:
-        print(f"Error computing chart: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return None, None
+        from gevent import monkey, get_hub
+    except ImportError:
+        return fn(*args)
+    if not monkey.is_module_patched('socket'):
+        return fn(*args)
+    return get_hub().threadpool.apply(fn, args)
 
 
 SAMPLE_CHARTS = {
@@ -298,8 +189,8 @@ CURRENT TRANSITS (2025-2026):
 DEFAULT_CHART = SAMPLE_CHARTS["sarah"]
 
 
-def get_minimax_response(user_message, chart_data, conversation_history):
-    system_prompt = f"""You are Oracool, an expert astrologer and mental wellness guide. You deliver deep, structured astrological analyses combined with psychological insight.
+def build_system_prompt(chart_data):
+    return f"""You are Oracool, an expert astrologer and mental wellness guide. You deliver deep, structured astrological analyses combined with psychological insight.
 
 USER'S BIRTH CHART DATA:
 {chart_data}
@@ -349,6 +240,7 @@ RULES FOR ANALYSIS:
    - Aspect interpretations showing how planets interact
 
 4. Include a TIMING section using their current transits
+   - Use only the CURRENT TRANSITS and UPCOMING ACTIVATION WINDOWS listed in their chart data; do not invent dates
    - Break into time windows (e.g., "Nov 2025 – Feb 2026")
    - Describe what each window activates
    - Give concrete examples of what may unfold
@@ -380,49 +272,361 @@ RESPONSE LENGTH:
 - Use all relevant placements from their chart
 - Do not cut corners — the user wants DEPTH"""
 
-    messages = [{"role": "system", "content": system_prompt}]
 
-    for msg in conversation_history:
-        messages.append(msg)
+TRANSIT_LOOKAHEAD_DAYS = int(os.environ.get('TRANSIT_LOOKAHEAD_DAYS', '180'))
 
-    messages.append({"role": "user", "content": user_message})
+# The transit table and Kerykeion load here in the background (or on first
+# use), so the process answers /health/live without waiting for them.
+warmup = Warmup([
+    ('transits', lambda: run_blocking(shared_transit_engine, TRANSIT_LOOKAHEAD_DAYS)),
+    ('charts', lambda: run_blocking(warm_chart_stack)),
+], mode=os.environ.get('WARMUP', 'background'))
 
-    try:
-        print(f"Calling MiniMax API for question: {user_message[:50]}...")
-
-        response = requests.post(
-            "https://api.minimax.io/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {os.environ.get('MINIMAX_API_KEY')}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "MiniMax-M2.1",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 4096,
-                "top_p": 0.95
-            },
-            timeout=120
+
+SYSTEM_PROMPT_CACHE_SIZE = int(os.environ.get('SYSTEM_PROMPT_CACHE_SIZE', '10000'))
+
+
+def user_chart_text(user):
+    """The user's chart text: rendered from the stored record, or the profile's sample chart."""
+    if user.get('chart'):
+        return chart_model.chart_text(user['chart'])
+    # Users stored before charts were kept as records still carry the text.
+    return user.get('chartData') or SAMPLE_CHARTS.get(user.get('profile'), DEFAULT_CHART)
+
+
+def user_chart_visual(user):
+    if user.get('chart'):
+        return chart_model.chart_json(user['chart'])
+    return user.get('chartVisual')
+
+
+def user_natal(user):
+    """Stored natal positions, or ones parsed from the chart text for sample charts."""
+    if user.get('chart'):
+        return chart_model.decode(user['chart']).natal()
+    return (user.get('chartVisual') or {}).get('natal') or natal_from_text(user_chart_text(user))
+
+
+def user_system_prompt(user):
+    """The user's rendered system prompt and its token estimate.
+
+    Built once per chart per day: the transit section only changes with the
+    date, so every turn within a day shares the same prompt bytes.
+    """
+    return system_prompt_for(user.get('chart') or user_chart_text(user), date.today())
+
+
+@functools.lru_cache(maxsize=SYSTEM_PROMPT_CACHE_SIZE)
+def system_prompt_for(chart, today):
+    """Prompt for an encoded chart record, or plain chart text for sample charts, on a given day."""
+    if chart_model.is_encoded(chart):
+        chart_text, natal = chart_model.chart_text(chart), chart_model.decode(chart).natal()
+    else:
+        chart_text, natal = chart, None
+    with time_stage('transits'):
+        chart_text = chart_with_transits(chart_text, natal, shared_transit_engine(TRANSIT_LOOKAHEAD_DAYS), today,
+                                         TRANSIT_LOOKAHEAD_DAYS)
+    with time_stage('prompt_build'):
+        system_prompt = build_system_prompt(chart_text)
+    return system_prompt, estimate_tokens(system_prompt)
+
+
+@functools.lru_cache(maxsize=2048)
+def encoded_system_message(system_prompt):
+    return json.dumps({"role": "system", "content": system_prompt}).encode()
+
+
+MINIMAX_API_URL = os.environ.get('MINIMAX_API_URL', "https://api.minimax.io/v1/chat/completions")
+MINIMAX_MODEL = os.environ.get('MINIMAX_MODEL', 'MiniMax-M2.1')
+
+LLM_MAX_INFLIGHT = int(os.environ.get('LLM_MAX_INFLIGHT', '64'))
+LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', '30'))
+LLM_MAX_QUEUE = int(os.environ.get('LLM_MAX_QUEUE', str(LLM_MAX_INFLIGHT)))
+admission = AdmissionController(LLM_MAX_INFLIGHT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT, gauge=llm_inflight)
+
+
+def make_upstream_client(url):
+    return MiniMaxClient(
+        url,
+        pool_size=int(os.environ.get('MINIMAX_POOL_SIZE', str(LLM_MAX_INFLIGHT))),
+        max_retries=int(os.environ.get('MINIMAX_MAX_RETRIES', '2')),
+        read_timeout=float(os.environ.get('MINIMAX_READ_TIMEOUT', '120')),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get('MINIMAX_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.environ.get('MINIMAX_BREAKER_RESET', '30'))
         )
+    )
+
+
+llm_router = Router(
+    load_backends(os.environ.get('LLM_BACKENDS'),
+                  {'name': 'minimax', 'url': MINIMAX_API_URL, 'model': MINIMAX_MODEL, 'apiKeyEnv': 'MINIMAX_API_KEY'},
+                  make_upstream_client),
+    hedging=os.environ.get('LLM_HEDGE', '1') == '1',
+    initial_hedge_delay=float(os.environ.get('LLM_HEDGE_INITIAL_DELAY', '10')),
+    min_hedge_delay=float(os.environ.get('LLM_HEDGE_MIN_DELAY', '0.25')),
+    max_hedge_ratio=float(os.environ.get('LLM_HEDGE_MAX_RATIO', '0.1')),
+    admission=admission
+)
+
+
+def minimax_request_body(messages, stream=False, model=MINIMAX_MODEL):
+    body = {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 4096,
+        "top_p": 0.95
+    }
+    if stream:
+        body["stream"] = True
+    return body
 
-        data = response.json()
-        if response.status_code == 200 and 'choices' in data:
-            ai_response = data['choices'][0]['message']['content']
-            ai_response = re.sub(r'<think>.*?</think>\s*', '', ai_response, flags=re.DOTALL)
-            print(f"MiniMax response received: {len(ai_response)} characters")
-            return ai_response
+
+def encode_chat_request(system_prompt, user_message, conversation_history, stream=False, model=MINIMAX_MODEL):
+    """Chat request body as bytes, reusing the serialized system message.
+
+    The system message is always first and byte-identical across a user's
+    turns, so the provider can serve it from its prefix/KV cache.
+    """
+    with time_stage('prompt_build'):
+        rest = list(conversation_history) + [{"role": "user", "content": user_message}]
+        options = minimax_request_body(None, stream, model)
+        del options['messages']
+        return (b'{"messages": [' + encoded_system_message(system_prompt) + b', '
+                + json.dumps(rest)[1:-1].encode() + b'], ' + json.dumps(options)[1:].encode())
+
+
+def get_minimax_response(user_message, chart_data, conversation_history, system_prompt=None):
+    # Raises RateLimited (a 429) when no upstream slot frees up in time.
+    admission.acquire()
+    started = time.monotonic()
+    try:
+        return request_minimax_response(user_message, chart_data, conversation_history, system_prompt)
+    finally:
+        admission.release(time.monotonic() - started)
+
+
+def request_minimax_response(user_message, chart_data, conversation_history, system_prompt=None):
+    # Streamed upstream even though the caller wants the whole reply, so a slow
+    # first token can be hedged and the losing attempt closed mid-generation.
+    parts = list(request_minimax_stream(user_message, chart_data, conversation_history, system_prompt))
+    ai_response = ''.join(parts)
+    log.info(f"MiniMax response received: {len(ai_response)} characters")
+    return FallbackReply(ai_response) if reply_failed(parts) else ai_response
+
+
+class ThinkTagStripper:
+    """Incrementally removes <think>...</think> blocks from streamed text.
+
+    Tags may be split across chunk boundaries, so any trailing text that could
+    be the start of a tag is held back until the next chunk arrives.
+    """
+
+    OPEN = '<think>'
+    CLOSE = '</think>'
+
+    def __init__(self):
+        self.buffer = ''
+        self.in_think = False
+        self.skip_whitespace = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        out = []
+        while self.buffer:
+            if self.in_think:
+                end = self.buffer.find(self.CLOSE)
+                if end == -1:
+                    self.buffer = self.buffer[-(len(self.CLOSE) - 1):]
+                    break
+                self.buffer = self.buffer[end + len(self.CLOSE):]
+                self.in_think = False
+                self.skip_whitespace = True
+                continue
+
+            if self.skip_whitespace:
+                self.buffer = self.buffer.lstrip()
+                if not self.buffer:
+                    break
+                self.skip_whitespace = False
+
+            start = self.buffer.find(self.OPEN)
+            if start != -1:
+                out.append(self.buffer[:start])
+                self.buffer = self.buffer[start + len(self.OPEN):]
+                self.in_think = True
+                continue
+
+            keep = self._partial_tag_length(self.buffer)
+            out.append(self.buffer[:len(self.buffer) - keep])
+            self.buffer = self.buffer[len(self.buffer) - keep:]
+            break
+        return ''.join(out)
+
+    def flush(self):
+        if self.in_think:
+            rest = ''
         else:
-            print(f"MiniMax API error: {response.status_code}")
-            print(f"Response: {response.text}")
-            return get_fallback_response(chart_data)
+            rest = self.buffer
+        self.buffer = ''
+        return rest
+
+    def _partial_tag_length(self, text):
+        for size in range(min(len(self.OPEN) - 1, len(text)), 0, -1):
+            if self.OPEN.startswith(text[-size:]):
+                return size
+        return 0
+
+
+def stream_minimax_response(user_message, chart_data, conversation_history, system_prompt=None, hedge=True):
+    admission.acquire()
+    started = time.monotonic()
+    try:
+        yield from request_minimax_stream(user_message, chart_data, conversation_history, system_prompt, hedge)
+    finally:
+        admission.release(time.monotonic() - started)
+
 
+def request_minimax_stream(user_message, chart_data, conversation_history, system_prompt=None, hedge=True):
+    system_prompt = system_prompt or build_system_prompt(chart_data)
+    stream = llm_router.stream(
+        lambda backend: encode_chat_request(system_prompt, user_message, conversation_history, stream=True,
+                                            model=backend.model),
+        hedge=hedge
+    )
+    stripper = ThinkTagStripper()
+
+    try:
+        log.info(f"Streaming MiniMax API for question: {user_message[:50]}...")
+
+        started = time.perf_counter()
+        produced = False
+        ttfb_observed = False
+        strip_seconds = 0.0
+        for payload in stream:
+            if not ttfb_observed:
+                stage_seconds.observe(stream.ttfb, stage='upstream_ttfb')
+                ttfb_observed = True
+            if payload == '[DONE]':
+                break
+            try:
+                chunk = json.loads(payload)
+            except ValueError:
+                continue
+            choices = chunk.get('choices') or []
+            if not choices:
+                continue
+            delta = choices[0].get('delta') or {}
+            strip_started = time.perf_counter()
+            text = stripper.feed(delta.get('content') or '')
+            strip_seconds += time.perf_counter() - strip_started
+            if text:
+                if not produced:
+                    stage_seconds.observe(time.perf_counter() - started, stage='upstream_first_token')
+                produced = True
+                yield text
+
+        tail = stripper.flush()
+        stage_seconds.observe(time.perf_counter() - started, stage='upstream_total')
+        stage_seconds.observe(strip_seconds, stage='think_strip')
+        if tail:
+            produced = True
+            yield tail
+
+        if not produced:
+            log.warning("MiniMax stream ended without content")
+            yield fallback_response(chart_data, 'empty_stream')
+
+    except UpstreamStatusError as e:
+        log.warning(f"MiniMax API error: {e.status}")
+        log.debug(f"Response: {e.text}")
+        yield fallback_response(chart_data, 'http_error')
+    except UpstreamError as e:
+        log.warning(f"MiniMax unavailable: {str(e)}")
+        yield fallback_response(chart_data, 'breaker_open')
     except requests.exceptions.Timeout:
-        print("MiniMax API timeout")
-        return get_fallback_response(chart_data)
+        log.warning("MiniMax API timeout")
+        upstream_timeouts.inc()
+        yield fallback_response(chart_data, 'timeout')
     except Exception as e:
-        print(f"Error calling MiniMax: {str(e)}")
-        return get_fallback_response(chart_data)
+        log.error(f"Error streaming MiniMax: {str(e)}")
+        yield fallback_response(chart_data, 'error')
+    finally:
+        stream.close()
+
+
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of an astrology reading conversation.
+Merge the previous summary with the new messages into at most 200 words.
+Keep the user's questions, concerns and life context, and the key placements,
+themes and timing windows already discussed. Plain sentences, no headings."""
+
+
+def summarize_conversation(previous_summary, messages):
+    transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    if previous_summary:
+        transcript = f"PREVIOUS SUMMARY:\n{previous_summary}\n\nNEW MESSAGES:\n{transcript}"
+
+    def summary_body(backend):
+        body = minimax_request_body([
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": transcript}
+        ], model=backend.model)
+        body['max_tokens'] = 1024
+        body['temperature'] = 0.3
+        return body
+
+    try:
+        admission.acquire()
+        started = time.monotonic()
+        try:
+            response = llm_router.post(summary_body)
+        finally:
+            admission.release(time.monotonic() - started)
+        data = response.json()
+        if response.status_code == 200 and 'choices' in data:
+            summary = data['choices'][0]['message']['content']
+            return re.sub(r'<think>.*?</think>\s*', '', summary, flags=re.DOTALL).strip()
+        log.warning(f"MiniMax summary error: {response.status_code}")
+    except Exception as e:
+        log.error(f"Error summarizing with MiniMax: {str(e)}")
+    return None
+
+
+history_manager = HistoryManager(
+    summarize_conversation,
+    token_budget=int(os.environ.get('HISTORY_TOKEN_BUDGET', '6000')),
+    keep_turns=int(os.environ.get('HISTORY_KEEP_TURNS', '3'))
+)
+
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', str(7 * 86400))),
+    similarity=float(os.environ.get('RESPONSE_CACHE_SIMILARITY', '0')),
+    disk_path=os.environ.get('RESPONSE_CACHE_PATH') or None
+)
+
+
+def remember_response(system_prompt, message, first_turn, ai_response):
+    if ai_response and not isinstance(ai_response, FallbackReply):
+        response_cache.put(system_prompt, message, first_turn, ai_response)
+
+
+class FallbackReply(str):
+    """Reply text (or a streamed chunk) produced because the upstream call failed.
+
+    A stream that breaks after some tokens ends with one of these, so the
+    joined reply is partial; such replies are shown but never cached or stored.
+    """
+
+
+def reply_failed(parts):
+    return any(isinstance(part, FallbackReply) for part in parts)
+
+
+def fallback_response(chart_data, reason):
+    fallbacks.inc(reason=reason)
+    return FallbackReply(get_fallback_response(chart_data))
 
 
 def get_fallback_response(chart_data):
@@ -441,6 +645,111 @@ Here are some practices that align with your astrological profile:
 Let's try your question again - I'd love to give you more personalized guidance! Ask me anything about anxiety, career, relationships, or life purpose."""
 
 
+# Suggestion chips shown under a new chart, most tapped first.
+SUGGESTED_QUESTIONS = (
+    "What does my chart say about my love life?",
+    "What career path suits me best?",
+    "What should I focus on this month?",
+    "What are my biggest strengths and challenges?",
+)
+
+SPECULATIVE_PREGEN = os.environ.get('SPECULATIVE_PREGEN') == '1'
+SPECULATIVE_QUESTIONS = int(os.environ.get('SPECULATIVE_QUESTIONS', '2'))
+SPECULATIVE_WAIT = float(os.environ.get('SPECULATIVE_WAIT', '120'))
+
+
+def speculative_reading(chart_data, system_prompt, question, cancelled):
+    """Stream a first reading, stopping (and closing the upstream stream) as soon as it is cancelled."""
+    parts = []
+    # Never hedged: speculation already spends tokens nobody may read.
+    stream = stream_minimax_response(question, chart_data, [], system_prompt, hedge=False)
+    try:
+        for text in stream:
+            if cancelled.is_set():
+                return None, estimate_tokens(''.join(parts))
+            parts.append(text)
+    except RateLimited:
+        return None, 0
+    finally:
+        stream.close()
+    if reply_failed(parts):
+        return None, estimate_tokens(''.join(p for p in parts if not isinstance(p, FallbackReply)))
+    answer = ''.join(parts)
+    return answer, estimate_tokens(answer)
+
+
+def speculation_has_capacity():
+    # Only speculate while at least half the upstream slots are idle.
+    return admission.running + admission.waiting < admission.max_inflight // 2
+
+
+speculator = Speculator(
+    speculative_reading, speculation_has_capacity,
+    workers=int(os.environ.get('SPECULATIVE_WORKERS', '2')),
+    token_budget=int(os.environ.get('SPECULATIVE_TOKEN_BUDGET', '200000')),
+    ttl=float(os.environ.get('SPECULATIVE_TTL', '3600'))
+) if SPECULATIVE_PREGEN else None
+
+
+def speculate_first_readings(user_id, user):
+    if speculator is not None:
+        system_prompt, _ = user_system_prompt(user)
+        speculator.schedule(user_id, user_chart_text(user), system_prompt, SUGGESTED_QUESTIONS[:SPECULATIVE_QUESTIONS])
+
+
+def ready_answer(user_id, system_prompt, message, first_turn):
+    """(answer, source) from the response cache or a speculative first reading; (None, None) if neither."""
+    answer = response_cache.get(system_prompt, message, first_turn)
+    if answer is not None:
+        if first_turn and speculator is not None:
+            speculator.discard(user_id)
+        return answer, 'cache'
+    if first_turn and speculator is not None:
+        answer = speculator.take(user_id, message, SPECULATIVE_WAIT)
+        if answer is not None:
+            remember_response(system_prompt, message, first_turn, answer)
+            return answer, 'speculative'
+    return None, None
+
+
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED') == '1'
+rate_buckets, turn_locks = open_limits(
+    RATE_LIMIT_BACKEND, os.environ.get('RATE_LIMIT_PATH', os.environ.get('STORE_PATH', 'oracool.db'))
+)
+user_limiter = RateLimiter(rate_buckets, 'user', float(os.environ.get('USER_RATE_PER_MINUTE', '20')),
+                           int(os.environ.get('USER_RATE_BURST', '5')))
+ip_limiter = RateLimiter(rate_buckets, 'ip', float(os.environ.get('IP_RATE_PER_MINUTE', '120')),
+                         int(os.environ.get('IP_RATE_BURST', '30')))
+# A user's next turn waits this long for the previous one to finish; the
+# lease frees the lock if a worker dies mid-turn.
+turn_gate = TurnGate(turn_locks, wait=float(os.environ.get('USER_TURN_WAIT', '60')),
+                     lease=float(os.environ.get('USER_TURN_LEASE', '180')))
+chat_flights = SingleFlight()
+
+
+def client_ip():
+    if RATE_LIMIT_TRUST_FORWARDED and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+
+def ip_rate_limited(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        ip_limiter.check(client_ip())
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.errorhandler(RateLimited)
+def too_many_requests(e):
+    rate_limited.inc(reason=e.reason)
+    log.info(f"Rate limited ({e.reason}), retry after {e.retry_after}s")
+    return jsonify({'error': 'Too many requests', 'reason': e.reason, 'retryAfter': e.retry_after}), 429, \
+        {'Retry-After': str(e.retry_after)}
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -469,6 +778,7 @@ def map_quiz_to_profile(quiz_answers):
 
 
 @app.route('/api/create-user', methods=['POST'])
+@ip_rate_limited
 def create_user():
     data = request.json
 
@@ -478,126 +788,717 @@ def create_user():
     birth_time = data.get('birthTime', '12:00')
     birth_city = data.get('birthCity', '')
 
-    print(f"Creating user: {user_id}")
-    print(f"   Birth: {birth_date} at {birth_time}")
-    print(f"   Location: {birth_city}")
+    log.info(f"Creating user: {user_id}")
+    log.debug(f"   Birth: {birth_date} at {birth_time}")
+    log.debug(f"   Location: {birth_city}")
 
     quiz_answers = data.get('quizAnswers', {})
     if not quiz_answers:
-        print(f"   No quiz answers provided, using default profile")
+        log.debug("   No quiz answers provided, using default profile")
     profile_key = map_quiz_to_profile(quiz_answers)
 
-    chart_data = None
-    chart_visual = None
+    chart_record = None
     if birth_date and birth_city:
+        chart_record = {'id': user_id, 'name': f"User_{user_id[:8]}", 'birthDate': birth_date,
+                        'birthTime': birth_time, 'birthCity': birth_city}
+        for key in ('nation', 'lat', 'lng', 'tz'):
+            if data.get(key) is not None:
+                chart_record[key] = data[key]
         try:
-            parts = birth_date.split('-')
-            year, month, day = int(parts[0]), int(parts[1]), int(parts[2])
-            time_parts = birth_time.split(':')
-            hour, minute = int(time_parts[0]), int(time_parts[1])
+            parse_birth_record(chart_record)
+        except (ValueError, TypeError, AttributeError) as e:
+            log.warning(f"   Invalid birth data: {str(e)}")
+            chart_record = None
+
+    # The sample profile chart is used until the real one is computed by
+    # the job queue, then swapped in by handle_job.
+    log.debug(f"   Using sample chart for profile: {profile_key}")
+    chart_data = SAMPLE_CHARTS.get(profile_key, DEFAULT_CHART)
+    chart_status = 'pending' if chart_record else 'sample'
+
+    log.debug(f"   Quiz answers: {quiz_answers}")
+    log.debug(f"   Matched profile: {profile_key}")
+
+    user = store_user(user_id, birth_date, birth_time, birth_city, profile_key, None, chart_status)
+    if chart_record:
+        job_queue.enqueue('chart', user_id, chart_record)
+        log.debug("   Chart computation queued")
+    else:
+        speculate_first_readings(user_id, user)
+
+    log.info(f"User created successfully: {user_id}")
+
+    return jsonify({
+        'userId': user_id,
+        'chartData': chart_data,
+        'chartVisual': None,
+        'chartStatus': chart_status,
+        'chartUrl': f"/api/users/{user_id}/chart",
+        'suggestions': list(SUGGESTED_QUESTIONS)
+    })
+
+
+def handle_job(kind, payload):
+    if kind != 'chart':
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    user_id = payload['id']
+    chart, error = run_blocking(compute_record, payload)
+
+    user = store.get_user(user_id)
+    if user is None:
+        log.warning(f"Chart job for unknown user {user_id[:8]}, skipping")
+        return {'skipped': 'unknown user'}
+
+    if error:
+        log.warning(f"Chart computation failed for {user_id[:8]}: {error}, keeping sample chart")
+        mark_chart_failed(user_id, user, error)
+        return {'error': error}
+
+    updated = dict(user, chart=chart, chartStatus='ready')
+    for legacy in ('chartData', 'chartVisual', 'systemPrompt', 'systemPromptTokens', 'systemPromptDate'):
+        updated.pop(legacy, None)
+    user_system_prompt(updated)
+    store.update_user(user_id, updated)
+    cohort_index.add(user_id, chart)
+    log.info(f"Chart ready for {user_id[:8]}")
+    # A user who already chatted on the sample chart will never take a
+    # pre-generated first reading.
+    if store.count_messages(user_id) == 0:
+        speculate_first_readings(user_id, updated)
+    return {'chartStatus': 'ready'}
+
+
+# Placement bitmap index for cohort queries. This worker's new charts are
+# added as they are computed; the sync thread builds the index from the
+# store and then polls it for charts written by other workers.
+cohort_index = PlacementIndex()
+threading.Thread(target=keep_synced, name='cohort-sync', daemon=True, args=(
+    cohort_index, store, float(os.environ.get('COHORT_SYNC_INTERVAL', '10'))), kwargs={'run': run_blocking}).start()
+COHORT_QUERY_MAX_LIMIT = int(os.environ.get('COHORT_QUERY_MAX_LIMIT', '1000'))
+
 
-            user_name = f"User_{user_id[:8]}"
-            chart_data, chart_visual = compute_chart(user_name, year, month, day, hour, minute, birth_city)
-        except Exception as e:
-            print(f"   Chart computation failed: {str(e)}")
+def mark_chart_failed(user_id, user, error):
+    updated = dict(user, chartStatus='failed', chartError=error)
+    store.update_user(user_id, updated)
+    return updated
 
-    if not chart_data:
-        print(f"   Falling back to sample chart for profile: {profile_key}")
-        chart_data = SAMPLE_CHARTS.get(profile_key, DEFAULT_CHART)
 
-    print(f"   Quiz answers: {quiz_answers}")
-    print(f"   Matched profile: {profile_key}")
+def chart_job_failed(kind, payload, error):
+    """Every attempt at a chart job raised: stop clients polling a chart that will never come."""
+    user = store.get_user(payload['id'])
+    if user is not None and user.get('chartStatus') == 'pending':
+        log.warning(f"Chart job for {payload['id'][:8]} failed for good: {error}, keeping sample chart")
+        mark_chart_failed(payload['id'], user, error)
 
-    users[user_id] = {
+
+def settle_chart_status(user_id, user):
+    """The user, marked failed if it is still pending but its latest chart job has failed."""
+    if user.get('chartStatus') != 'pending':
+        return user
+    job = job_queue.latest(user_id)
+    if job is None or job['status'] != 'failed':
+        return user
+    return mark_chart_failed(user_id, user, job['error'] or 'Chart computation failed')
+
+
+job_queue = JobQueue(
+    os.environ.get('JOBS_PATH', os.environ.get('STORE_PATH', 'oracool.db')),
+    handle_job,
+    workers=int(os.environ.get('CHART_JOB_WORKERS', '2')),
+    on_failed=chart_job_failed
+)
+
+CHART_EVENTS_TIMEOUT = float(os.environ.get('CHART_EVENTS_TIMEOUT', '300'))
+CHART_READY_CACHE_CONTROL = 'private, max-age=86400'
+
+
+def chart_status_payload(user_id, user):
+    payload = {
+        'userId': user_id,
+        'status': user.get('chartStatus', 'ready'),
+        'chartData': user_chart_text(user),
+        'chartVisual': user_chart_visual(user)
+    }
+    if user.get('chartError'):
+        payload['error'] = user['chartError']
+    return payload
+
+
+@app.route('/api/users/<user_id>/chart', methods=['GET'])
+def user_chart(user_id):
+    user = store.get_user(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    user = settle_chart_status(user_id, user)
+
+    wants_events = request.args.get('stream') == '1' or \
+        request.accept_mimetypes.best == 'text/event-stream'
+    if not wants_events:
+        status = user.get('chartStatus', 'ready')
+        # A ready chart never changes; anything else is revalidated on every load.
+        cache_control = CHART_READY_CACHE_CONTROL if status == 'ready' else 'private, no-cache'
+        etag = make_etag(user_id, status, user.get('chart') or user_chart_text(user), user.get('chartError'))
+        return not_modified(etag, cache_control) or \
+            tagged(jsonify(chart_status_payload(user_id, user)), etag, cache_control)
+
+    def generate():
+        current = user
+        deadline = time.monotonic() + CHART_EVENTS_TIMEOUT
+        while current.get('chartStatus') == 'pending' and time.monotonic() < deadline:
+            yield ": waiting\n\n"
+            job_queue.wait(user_id, timeout=15)
+            current = settle_chart_status(user_id, store.get_user(user_id) or current)
+        yield sse_event(chart_status_payload(user_id, current), event='chart')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def store_user(user_id, birth_date, birth_time, birth_city, profile_key, chart, chart_status='ready'):
+    """Store a user; chart is an encoded chart record, or None while the profile's sample chart stands in."""
+    user = {
         'birthDate': birth_date,
         'birthTime': birth_time,
         'birthCity': birth_city,
         'profile': profile_key,
-        'chartData': chart_data,
-        'chartVisual': chart_visual,
+        'chart': chart,
+        'chartStatus': chart_status,
         'createdAt': datetime.now().isoformat()
     }
+    user_system_prompt(user)
+    store.create_user(user_id, user)
+    return user
+
+
+def conversation_history_for(user_id, message, system_tokens):
+    history, stats = history_manager.prepare(user_id, lambda after: store.get_messages(user_id, after=after))
+    stats['promptTokens'] = system_tokens + stats['historyTokens'] + estimate_tokens(message)
+    log.debug(f"Prompt tokens: ~{stats['promptTokens']} "
+              f"(history {stats['historyTokens']}, {stats['verbatimMessages']} of "
+              f"{stats['loadedMessages']} loaded messages verbatim, "
+              f"{stats['unsummarizedMessages']} awaiting summary)")
+    return history, stats
+
+
+chart_engine = None
+chart_engine_lock = threading.Lock()
+
+
+def get_chart_engine():
+    global chart_engine
+    with chart_engine_lock:
+        if chart_engine is None:
+            workers = int(os.environ.get('CHART_ENGINE_WORKERS', '0')) or None
+            chart_engine = ChartEngine(workers=workers)
+            log.info(f"Chart engine started with {chart_engine.workers} worker processes")
+        return chart_engine
+
+
+@app.route('/api/charts/batch', methods=['POST'])
+@ip_rate_limited
+def charts_batch():
+    data = request.json or {}
+    records = data.get('records')
+    if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+        return jsonify({'error': 'records must be a non-empty list of objects'}), 400
+
+    create_users = bool(data.get('createUsers'))
+    user_ids = [str(uuid.uuid4()) for _ in records] if create_users else None
+    if create_users:
+        records = [dict(r, name=f"User_{uid[:8]}") for r, uid in zip(records, user_ids)]
+
+    log.info(f"Batch chart request: {len(records)} records, createUsers={create_users}")
+    engine = get_chart_engine()
+
+    def generate():
+        for index, chart, error in engine.map_unordered(records):
+            record = records[index]
+            item = {'index': index, 'id': record.get('id')}
+            if error:
+                item['error'] = error
+            else:
+                item['chartData'] = chart_model.chart_text(chart)
+                item['chartVisual'] = chart_model.chart_json(chart)
+                if create_users:
+                    profile_key = map_quiz_to_profile(record.get('quizAnswers') or {})
+                    store_user(user_ids[index], record.get('birthDate', ''), record.get('birthTime', '12:00'),
+                               record.get('birthCity', ''), profile_key, chart)
+                    item['userId'] = user_ids[index]
+            yield encode_json(item) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+SYNASTRY_MAX_BATCH = int(os.environ.get('SYNASTRY_MAX_BATCH', '5000'))
+
+
+@app.route('/api/synastry', methods=['POST'])
+@ip_rate_limited
+def synastry_endpoint():
+    """Compare two users' charts, or score one user against many (otherUserIds)."""
+    data = request.json or {}
+    user = store.get_user(data.get('userId'))
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    natal = user_natal(user)
+    if not natal:
+        return jsonify({'error': 'Chart has no placements to compare'}), 422
+
+    if 'otherUserIds' in data:
+        other_ids = data['otherUserIds']
+        if not isinstance(other_ids, list) or not other_ids:
+            return jsonify({'error': 'otherUserIds must be a non-empty list'}), 400
+        if len(other_ids) > SYNASTRY_MAX_BATCH:
+            return jsonify({'error': f'At most {SYNASTRY_MAX_BATCH} users per request'}), 400
+
+        found, natals, missing = [], [], []
+        for other_id in other_ids:
+            other = store.get_user(other_id)
+            other_natal = user_natal(other) if other else None
+            if other_natal:
+                found.append(other_id)
+                natals.append(other_natal)
+            else:
+                missing.append(other_id)
+
+        with time_stage('synastry'):
+            scores, harmony, tension = synastry.score_many(natal, synastry.stack(natals))
+        results = [
+            {'userId': other_id, 'score': round(s, 1), 'harmony': round(h, 3), 'tension': round(t, 3)}
+            for other_id, s, h, t in zip(found, scores.tolist(), harmony.tolist(), tension.tolist())
+        ]
+        results.sort(key=lambda r: r['score'], reverse=True)
+        return jsonify({'userId': data['userId'], 'results': results, 'missing': missing})
+
+    other = store.get_user(data.get('otherUserId'))
+    if not other:
+        return jsonify({'error': 'Other user not found'}), 404
+    other_natal = user_natal(other)
+    if not other_natal:
+        return jsonify({'error': 'Other chart has no placements to compare'}), 422
+
+    with time_stage('synastry'):
+        report = synastry.compare(natal, other_natal)
+    return jsonify(dict(report, userId=data['userId'], otherUserId=data['otherUserId']))
+
+
+def chat_turn(user_id, user, message):
+    """One non-streaming turn, run while holding the user's turn lock so history stays in order."""
+    token = turn_gate.acquire(user_id, admission.retry_after())
+    try:
+        chart_data = user_chart_text(user)
+        system_prompt, system_tokens = user_system_prompt(user)
+
+        conversation_history, prompt_stats = conversation_history_for(user_id, message, system_tokens)
+        first_turn = not conversation_history
+
+        ai_response, source = ready_answer(user_id, system_prompt, message, first_turn)
+        cached = ai_response is not None
+        if not cached:
+            ai_response = get_minimax_response(message, chart_data, conversation_history, system_prompt)
+            remember_response(system_prompt, message, first_turn, ai_response)
+
+        failed = isinstance(ai_response, FallbackReply)
+        if not failed:
+            store.append_messages(user_id, [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": ai_response}
+            ])
+    finally:
+        turn_gate.release(user_id, token)
+
+    log.info(f"Response sent to user: {len(ai_response)} characters{f' ({source})' if cached else ''}")
+    return {
+        'response': ai_response,
+        'promptTokens': prompt_stats['promptTokens'],
+        'cached': cached,
+        'speculative': source == 'speculative',
+        'failed': failed
+    }
 
-    conversations[user_id] = []
 
-    print(f"User created successfully: {user_id}")
+@app.route('/api/chat', methods=['POST'])
+@ip_rate_limited
+def chat():
+    data = request.json
+    user_id = data.get('userId')
+    message = data.get('message')
+
+    user = store.get_user(user_id) if user_id else None
+    if not user:
+        log.warning(f"Invalid user ID: {user_id}")
+        return jsonify({'error': 'Invalid user ID'}), 400
+
+    if not message or not message.strip():
+        log.warning(f"Empty message from user: {user_id}")
+        return jsonify({'error': 'Message is required'}), 400
+
+    user_limiter.check(user_id)
+    log.info(f"User {user_id[:8]}... asked: {message[:50]}...")
+
+    # A resubmitted message (double click, client retry) joins the turn
+    # already answering it instead of asking and storing it twice.
+    result, shared = chat_flights.do((user_id, normalize_question(message)),
+                                     lambda: chat_turn(user_id, user, message))
+    return jsonify(dict(result, coalesced=shared))
 
+
+@app.route('/api/cohorts/query', methods=['POST'])
+@ip_rate_limited
+def cohort_query():
+    data = request.json or {}
+    try:
+        limit = int(data.get('limit', 100))
+        count, user_ids = cohort_index.query(data.get('query'), max(0, min(limit, COHORT_QUERY_MAX_LIMIT)))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f"Invalid cohort query: {str(e)}"}), 400
+    stats = cohort_index.stats()
     return jsonify({
-        'userId': user_id,
-        'chartData': chart_data,
-        'chartVisual': chart_visual
+        'count': count,
+        'userIds': user_ids,
+        'indexedUsers': stats['users'],
+        'complete': stats['complete']
     })
 
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
+def sse_event(data, event=None):
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {encode_json(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+@ip_rate_limited
+def chat_stream():
     data = request.json
     user_id = data.get('userId')
     message = data.get('message')
 
-    if not user_id or user_id not in users:
-        print(f"Invalid user ID: {user_id}")
+    user = store.get_user(user_id) if user_id else None
+    if not user:
+        log.warning(f"Invalid user ID: {user_id}")
         return jsonify({'error': 'Invalid user ID'}), 400
 
     if not message or not message.strip():
-        print(f"Empty message from user: {user_id}")
+        log.warning(f"Empty message from user: {user_id}")
         return jsonify({'error': 'Message is required'}), 400
 
-    print(f"User {user_id[:8]}... asked: {message[:50]}...")
+    user_limiter.check(user_id)
+    log.info(f"User {user_id[:8]}... asked (stream): {message[:50]}...")
 
-    user = users[user_id]
-    chart_data = user['chartData']
+    token = turn_gate.acquire(user_id, admission.retry_after())
+    released = []
+    slot = []
 
-    conversation_history = conversations[user_id]
+    def release_turn():
+        if slot:
+            admission.release(time.monotonic() - slot.pop())
+        if not released:
+            released.append(True)
+            turn_gate.release(user_id, token)
 
-    ai_response = get_minimax_response(message, chart_data, conversation_history)
-
-    conversations[user_id].append({"role": "user", "content": message})
-    conversations[user_id].append({"role": "assistant", "content": ai_response})
+    try:
+        chart_data = user_chart_text(user)
+        system_prompt, system_tokens = user_system_prompt(user)
+        conversation_history, prompt_stats = conversation_history_for(user_id, message, system_tokens)
+        first_turn = not conversation_history
+        cached_response, source = ready_answer(user_id, system_prompt, message, first_turn)
+        if cached_response is None:
+            # Taken before the response starts, so a full queue is still a 429.
+            admission.acquire()
+            slot.append(time.monotonic())
+    except Exception:
+        release_turn()
+        raise
+
+    def generate():
+        failed = False
+        try:
+            if cached_response is not None:
+                ai_response = cached_response
+                yield sse_event({'token': ai_response})
+            else:
+                parts = []
+                for text in request_minimax_stream(message, chart_data, conversation_history, system_prompt):
+                    parts.append(text)
+                    yield sse_event({'token': text})
+                failed = reply_failed(parts)
+                ai_response = FallbackReply(''.join(parts)) if failed else ''.join(parts)
+                remember_response(system_prompt, message, first_turn, ai_response)
+
+            # A failed turn is not kept, so the next one retries it with clean history.
+            if not failed:
+                store.append_messages(user_id, [
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": ai_response}
+                ])
+        finally:
+            release_turn()
+
+        log.info(f"Streamed response to user: {len(ai_response)} characters")
+        yield sse_event({
+            'response': ai_response,
+            'promptTokens': prompt_stats['promptTokens'],
+            'cached': cached_response is not None,
+            'speculative': source == 'speculative',
+            'failed': failed
+        }, event='done')
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Also covers clients that disconnect before the generator starts.
+    response.call_on_close(release_turn)
+    return response
 
-    print(f"Response sent to user: {len(ai_response)} characters")
 
-    return jsonify({
-        'response': ai_response
-    })
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
 
 
 @app.route('/api/messages/<user_id>', methods=['GET'])
 def get_messages(user_id):
-    if user_id not in conversations:
-        return jsonify({'messages': []})
+    try:
+        limit = min(max(int(request.args.get('limit', MESSAGES_PAGE_SIZE)), 1), MESSAGES_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    before = request.args.get('before')
+    if before is not None:
+        # Parsed by hand: type=int would turn a bad cursor into None and serve the newest page.
+        try:
+            before = int(before)
+        except ValueError:
+            return jsonify({'error': 'before must be an integer message id'}), 400
+
+    messages = store.get_messages(user_id, limit=limit + 1, before=before)
+    has_more = len(messages) > limit
+    messages = messages[-limit:]
+
+    # Messages are append-only, so a page ending before a cursor never
+    # changes; the latest page is revalidated against its message ids.
+    cache_control = 'private, max-age=31536000, immutable' if before is not None else 'private, no-cache'
+    etag = make_etag(user_id, limit, before, has_more, *(m['id'] for m in messages))
+    return not_modified(etag, cache_control) or tagged(jsonify({
+        'messages': messages,
+        'nextCursor': messages[0]['id'] if has_more and messages else None
+    }), etag, cache_control)
+
+
+HEALTH_MAX_JOB_BACKLOG = int(os.environ.get('HEALTH_MAX_JOB_BACKLOG', '1000'))
+HEALTH_MAX_PENDING_WRITES = int(os.environ.get('HEALTH_MAX_PENDING_WRITES', '1000'))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = getattr(g, 'request_started', None)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    if started is not None:
+        http_request_seconds.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    http_responses.inc(endpoint=endpoint, status=str(response.status_code))
+    return response
+
+
+def readiness_checks():
+    # Busy LLM slots are reported but never fail a check: admission control
+    # already answers 429 for them, and failing probes at peak load would take
+    # healthy instances out of rotation.
+    breakers = {backend.name: backend.client.breaker.state for backend in llm_router.backends}
+    in_flight = llm_inflight.value()
+    job_depth = job_queue.depth()
+    pending_writes = store.pending_writes()
+    return {
+        'upstream': {'ok': llm_router.available(), 'breakers': breakers},
+        'llmSlots': {'saturated': in_flight >= LLM_MAX_INFLIGHT, 'inFlight': in_flight, 'max': LLM_MAX_INFLIGHT,
+                     'queued': admission.waiting, 'maxQueue': LLM_MAX_QUEUE},
+        'jobQueue': {'ok': job_depth <= HEALTH_MAX_JOB_BACKLOG, 'depth': job_depth},
+        'storeWrites': {'ok': pending_writes <= HEALTH_MAX_PENDING_WRITES, 'pending': pending_writes},
+        'warmup': dict(warmup.stats(), ok=warmup.ready())
+    }
 
-    return jsonify({
-        'messages': conversations[user_id]
-    })
+
+def health_report():
+    checks = readiness_checks()
+    ready = all(check.get('ok', True) for check in checks.values())
+    return ready, {
+        'status': 'ready' if ready else 'degraded',
+        'saturated': checks['llmSlots']['saturated'],
+        'timestamp': datetime.now().isoformat(),
+        'checks': checks
+    }
 
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'totalUsers': len(users),
-        'activeConversations': len(conversations)
-    })
+    # Always 200, so platform health checks never restart a busy instance.
+    _, report = health_report()
+    return jsonify(report)
+
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    ready, report = health_report()
+    return jsonify(report), 200 if ready else 503
+
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    # Liveness only: answers while the warm-up is still loading the chart stack.
+    return jsonify({'status': 'alive', 'timestamp': datetime.now().isoformat()})
+
+
+def register_collectors():
+    def lookups(stats, results):
+        return {(label,): stats[key] for key, label in results}
+
+    registry.collect('chart_cache_lookups_total', 'counter', 'Chart cache lookups by result.',
+                     lambda: lookups(chart_cache.stats(), [('hits', 'hit'), ('diskHits', 'disk_hit'), ('misses', 'miss')]),
+                     labels=('result',))
+    registry.collect('chart_cache_entries', 'gauge', 'Charts held in memory.', lambda: chart_cache.stats()['size'])
+    registry.collect('response_cache_lookups_total', 'counter', 'Response cache lookups by result.',
+                     lambda: lookups(response_cache.stats(), [('hits', 'hit'), ('nearHits', 'near_hit'),
+                                                              ('diskHits', 'disk_hit'), ('misses', 'miss')]),
+                     labels=('result',))
+    registry.collect('response_cache_entries', 'gauge', 'Cached responses held in memory.',
+                     lambda: response_cache.stats()['size'])
+    registry.collect('system_prompt_cache_lookups_total', 'counter', 'Serialized system message cache lookups.',
+                     lambda: {('hit',): encoded_system_message.cache_info().hits,
+                              ('miss',): encoded_system_message.cache_info().misses}, labels=('result',))
+    registry.collect('rendered_prompt_cache_lookups_total', 'counter', 'Rendered system prompt cache lookups.',
+                     lambda: {('hit',): system_prompt_for.cache_info().hits,
+                              ('miss',): system_prompt_for.cache_info().misses}, labels=('result',))
+    registry.collect('chart_render_cache_lookups_total', 'counter', 'Chart record decode/render cache lookups.',
+                     lambda: {(kind, label): info[key] for kind, info in chart_model.render_stats().items()
+                              for key, label in (('hits', 'hit'), ('misses', 'miss'))}, labels=('kind', 'result'))
+    registry.collect('upstream_events_total', 'counter', 'LLM client requests, attempts, retries and outcomes.',
+                     lambda: {(backend.name, name): value for backend in llm_router.backends
+                              for name, value in backend.client.stats()['counters'].items()},
+                     labels=('backend', 'event'))
+    registry.collect('upstream_breaker_state', 'gauge', 'Circuit breaker state (1 for the current state).',
+                     lambda: {(backend.name, state): int(backend.client.breaker.state == state)
+                              for backend in llm_router.backends for state in ('closed', 'open', 'half_open')},
+                     labels=('backend', 'state'))
+    registry.collect('upstream_first_event_ewma_seconds', 'gauge', 'EWMA seconds to the first streamed event.',
+                     lambda: {(backend.name,): backend.first_event_ewma or 0.0 for backend in llm_router.backends},
+                     labels=('backend',))
+    registry.collect('upstream_error_rate', 'gauge', 'EWMA share of attempts failing before a first event.',
+                     lambda: {(backend.name,): backend.error_ewma for backend in llm_router.backends},
+                     labels=('backend',))
+    registry.collect('llm_routing_events_total', 'counter', 'Routed requests, hedges fired, skipped and won, failovers.',
+                     lambda: {(name,): value for name, value in llm_router.stats()['counters'].items()},
+                     labels=('event',))
+    registry.collect('jobs', 'gauge', 'Background jobs by status.',
+                     lambda: {(status,): job_queue.stats()[status] for status in ('pending', 'running', 'done', 'failed')},
+                     labels=('status',))
+    registry.collect('llm_queued', 'gauge', 'Requests waiting for a MiniMax in-flight slot.', lambda: admission.waiting)
+    registry.collect('chat_coalesced_total', 'counter', 'Duplicate chat turns answered by a turn already in flight.',
+                     lambda: chat_flights.coalesced)
+    if speculator is not None:
+        registry.collect('speculation_events_total', 'counter', 'Speculative first readings by outcome.',
+                         lambda: {(name,): value for name, value in speculator.stats().items()
+                                  if name in speculator.counters}, labels=('event',))
+        registry.collect('speculation_tokens_total', 'counter', 'Speculative completion tokens generated and served.',
+                         lambda: {(kind,): value for kind, value in speculator.stats()['tokens'].items()},
+                         labels=('kind',))
+        registry.collect('speculation_hit_rate', 'gauge', 'Completed speculative readings that were served.',
+                         lambda: speculator.stats()['hitRate'])
+        registry.collect('speculation_wasted_token_ratio', 'gauge', 'Share of speculative tokens never served.',
+                         lambda: speculator.stats()['wastedTokenRatio'])
+    registry.collect('store_pending_writes', 'gauge', 'Writes waiting for the store writer.', store.pending_writes)
+    registry.collect('history_summaries', 'gauge', 'Conversation summaries held in memory.',
+                     lambda: history_manager.stats()['summaries'])
+    registry.collect('warmup_ready', 'gauge', 'Whether the chart stack warm-up has finished.',
+                     lambda: int(warmup.ready()))
+    registry.collect('cohort_index_users', 'gauge', 'Charts in the placement bitmap index.',
+                     lambda: cohort_index.stats()['users'])
+    registry.collect('cohort_index_bytes', 'gauge', 'Memory held by the placement bitmap index.',
+                     lambda: cohort_index.stats()['bytes'])
+    registry.collect('log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full.',
+                     lambda: log_stats()['dropped'])
+
+
+register_collectors()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '1000'))
+
+
+def admin_only(view):
+    """Bearer ADMIN_TOKEN required; without ADMIN_TOKEN set the route does not exist."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.route('/api/admin/export', methods=['GET'])
+@admin_only
+def admin_export():
+    """Stream every user and message as gzip NDJSON (?format=ndjson for plain), resumable with ?cursor=."""
+    cursor = request.args.get('cursor')
+    try:
+        parse_cursor(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    compress = request.args.get('format') != 'ndjson'
+    records = export_records(store, cursor, request.args.get('charts') == '1', EXPORT_CHUNK_SIZE)
+    log.info(f"Export started after {cursor or 'the beginning'}")
+
+    def generate():
+        started = time.perf_counter()
+        yield from encode_records(records, compress=compress)
+        log.info(f"Export finished in {time.perf_counter() - started:.1f}s")
+
+    filename = 'oracool-export.ndjson' + ('.gz' if compress else '')
+    return Response(stream_with_context(generate()), mimetype='application/gzip' if compress else 'application/x-ndjson',
+                    headers={'Content-Disposition': f"attachment; filename={filename}"})
+
+
+@app.route('/api/admin/import', methods=['POST'])
+@admin_only
+def admin_import():
+    """Load an export (gzip or plain NDJSON request body) into this instance's store; ?overwrite=1 replaces users."""
+    started = time.perf_counter()
+    try:
+        stats = import_records(store, read_lines(request.stream), EXPORT_CHUNK_SIZE,
+                               overwrite=request.args.get('overwrite') == '1')
+    except (UnicodeDecodeError, OSError, EOFError, ValueError) as e:
+        log.warning(f"Import stopped: {str(e)}")
+        return jsonify({'error': f"Import stopped: {str(e)}"}), 400
+    log.info(f"Imported {stats['users']} users and {stats['messages']} messages "
+             f"in {time.perf_counter() - started:.1f}s")
+    return jsonify(stats)
 
 
 @app.route('/api/debug/<user_id>', methods=['GET'])
 def debug_user(user_id):
-    if user_id not in users:
+    user = store.get_user(user_id)
+    if not user:
         return jsonify({'error': 'User not found'}), 404
 
     return jsonify({
-        'user': users[user_id],
-        'messageCount': len(conversations.get(user_id, []))
+        'user': user,
+        'messageCount': store.count_messages(user_id)
     })
 
-
-if __name__ == '__main__':
-    print("=" * 50)
-    print("ORACOOL BACKEND STARTING...")
-    print("=" * 50)
-    print(f"Flask app initialized")
-    print(f"MiniMax API key: {'SET' if os.environ.get('MINIMAX_API_KEY') else 'MISSING!'}")
-    print("=" * 50)
-    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('REPL_SLUG') is not None)
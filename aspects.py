@@ -0,0 +1,70 @@
+import numpy as np
+
+# (name, exact angle, orb) — same defaults Kerykeion's NatalAspects uses.
+DEFAULT_ASPECTS = (
+    ('conjunction', 0.0, 10.0),
+    ('opposition', 180.0, 10.0),
+    ('trine', 120.0, 8.0),
+    ('sextile', 60.0, 6.0),
+    ('square', 90.0, 5.0),
+    ('quintile', 72.0, 1.0),
+)
+
+PLANET_BODIES = ('Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto')
+BODIES = PLANET_BODIES + ('True_North_Lunar_Node', 'Ascendant', 'Medium_Coeli')
+
+
+def angular_distance(a, b):
+    """Shortest arc between longitudes, broadcasting over any shapes."""
+    d = np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) % 360.0
+    return np.minimum(d, 360.0 - d)
+
+
+class AspectEngine:
+    """Classifies every body pair of one or many charts in a single pass.
+
+    Positions are absolute ecliptic longitudes shaped (bodies,) for one chart
+    or (charts, bodies) for a batch. Results are returned as arrays of aspect
+    index (-1 for none) and orb, shaped (..., bodies, bodies).
+    """
+
+    def __init__(self, aspects=DEFAULT_ASPECTS):
+        self.names = [name for name, _, _ in aspects]
+        self.angles = np.array([angle for _, angle, _ in aspects], dtype=np.float64)
+        self.orbs = np.array([orb for _, _, orb in aspects], dtype=np.float64)
+
+    def classify_distances(self, distances):
+        deviation = np.abs(distances[..., None] - self.angles)
+        within = deviation <= self.orbs
+        kind = np.argmax(within, axis=-1)
+        orb = np.take_along_axis(deviation, kind[..., None], axis=-1)[..., 0]
+        kind = np.where(within.any(axis=-1), kind, -1)
+        return kind, orb
+
+    def matrix(self, positions):
+        positions = np.asarray(positions, dtype=np.float64)
+        return self.classify_distances(angular_distance(positions[..., :, None], positions[..., None, :]))
+
+    def cross_matrix(self, positions_a, positions_b):
+        """Inter-chart aspects: (..., bodies_a) against (..., bodies_b)."""
+        positions_a = np.asarray(positions_a, dtype=np.float64)
+        positions_b = np.asarray(positions_b, dtype=np.float64)
+        return self.classify_distances(angular_distance(positions_a[..., :, None], positions_b[..., None, :]))
+
+    def batch(self, positions):
+        """Aspect rows (chart, i, j, aspect, orb) for the upper triangle of a (charts, bodies) batch."""
+        kind, orb = self.matrix(np.atleast_2d(positions))
+        upper = np.triu(np.ones(kind.shape[-2:], dtype=bool), k=1)
+        chart, i, j = np.nonzero((kind >= 0) & upper)
+        return chart, i, j, kind[chart, i, j], orb[chart, i, j]
+
+    def find(self, positions, names=BODIES):
+        """Aspect dicts for one chart, ordered like Kerykeion (by first body, then second)."""
+        _, i, j, kind, orb = self.batch(positions)
+        return [
+            {'p1': names[a], 'p2': names[b], 'aspect': self.names[k], 'orb': float(o)}
+            for a, b, k, o in zip(i.tolist(), j.tolist(), kind.tolist(), orb.tolist())
+        ]
+
+
+aspect_engine = AspectEngine()
@@ -0,0 +1,64 @@
+"""NumPy AspectEngine versus Kerykeion NatalAspects, single and batched.
+
+    python benchmarks/aspects_vs_kerykeion.py --charts 500
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kerykeion import AstrologicalSubject, NatalAspects
+
+from aspects import BODIES, PLANET_BODIES, aspect_engine
+
+BODY_ATTRS = ('sun', 'moon', 'mercury', 'venus', 'mars', 'jupiter', 'saturn', 'uranus', 'neptune', 'pluto',
+              'true_north_lunar_node', 'first_house', 'tenth_house')
+
+
+def make_subjects(count):
+    start = datetime(1970, 1, 1)
+    subjects = []
+    for i in range(count):
+        moment = start + timedelta(minutes=10007 * i)
+        subjects.append(AstrologicalSubject("Bench", moment.year, moment.month, moment.day, moment.hour, moment.minute,
+                                            lng=-74.006, lat=40.7143, tz_str='America/New_York', online=False))
+    return subjects
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--charts', type=int, default=500)
+    args = parser.parse_args()
+
+    subjects = make_subjects(args.charts)
+    positions = np.array([[getattr(s, attr).abs_pos for attr in BODY_ATTRS] for s in subjects])
+    planet_set = set(PLANET_BODIES)
+
+    mismatches = 0
+    for subject, row in zip(subjects, positions):
+        expected = [(a.p1_name, a.p2_name, a.aspect) for a in NatalAspects(subject).relevant_aspects
+                    if a.p1_name in planet_set and a.p2_name in planet_set]
+        got = [(a['p1'], a['p2'], a['aspect']) for a in aspect_engine.find(row[:10], names=PLANET_BODIES)]
+        mismatches += expected != got
+    print(f"planet aspect lists differing from Kerykeion: {mismatches}/{args.charts}")
+
+    kery_elapsed, _ = timed(lambda: [NatalAspects(s).relevant_aspects for s in subjects])
+    single_elapsed, _ = timed(lambda: [aspect_engine.find(row, names=BODIES) for row in positions])
+    batch_elapsed, rows = timed(lambda: aspect_engine.batch(positions))
+
+    per = lambda elapsed: elapsed / args.charts * 1e6
+    print(f"kerykeion NatalAspects  {per(kery_elapsed):10.1f} us/chart")
+    print(f"AspectEngine.find       {per(single_elapsed):10.1f} us/chart  ({kery_elapsed / single_elapsed:.0f}x)")
+    print(f"AspectEngine.batch      {per(batch_elapsed):10.1f} us/chart  ({kery_elapsed / batch_elapsed:.0f}x, "
+          f"{len(rows[0])} aspects across {args.charts} charts)")
@@ -0,0 +1,60 @@
+"""Charts/sec for inline compute_chart versus the process-pool ChartEngine.
+
+    python benchmarks/chart_batch.py --records 2000 --workers 4
+
+Records carry explicit coordinates so the run measures ephemeris and aspect
+work only, and every record has a distinct birth minute so the chart cache
+never hits.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_engine import ChartEngine, compute_record
+
+
+def make_records(count):
+    start = datetime(1980, 1, 1, 0, 0)
+    records = []
+    for i in range(count):
+        moment = start + timedelta(minutes=7919 * i)
+        records.append({
+            'id': f"r{i}",
+            'birthDate': moment.strftime('%Y-%m-%d'),
+            'birthTime': moment.strftime('%H:%M'),
+            'birthCity': 'New York',
+            'lat': 40.7143, 'lng': -74.006, 'tz': 'America/New_York'
+        })
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    inline_records = make_records(args.records * 2)[args.records:]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        compute_record(inline_records[0])
+        start = time.perf_counter()
+        for record in inline_records[1:]:
+            compute_record(record)
+        inline_elapsed = time.perf_counter() - start
+    print(f"inline          {(len(inline_records) - 1) / inline_elapsed:8.1f} charts/s")
+
+    engine = ChartEngine(workers=args.workers)
+    list(engine.map_unordered(make_records(args.workers)))
+    start = time.perf_counter()
+    errors = sum(1 for *_, error in engine.map_unordered(records) if error)
+    engine_elapsed = time.perf_counter() - start
+    engine.shutdown()
+    print(f"engine ({args.workers} procs) {len(records) / engine_elapsed:8.1f} charts/s  errors {errors}")
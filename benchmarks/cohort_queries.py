@@ -0,0 +1,109 @@
+"""Cohort queries on the placement bitmap index versus scanning decoded charts.
+
+    python benchmarks/cohort_queries.py --users 1000000 --scan 20000
+
+Builds an index of synthetic charts, times each query against it, and
+checks the counts against a plain scan over the first --scan charts.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart_model
+from aspects import PLANET_BODIES, aspect_engine
+from cohorts import PlacementIndex
+
+QUERIES = [
+    ('moon cancer', {'planet': 'Moon', 'sign': 'Cancer'}),
+    ('moon cancer and 12th', {'and': [{'planet': 'Moon', 'sign': 'Cancer'}, {'planet': 'Moon', 'house': 12}]}),
+    ('sun square moon', {'aspect': 'square', 'planets': ['Sun', 'Moon']}),
+    ('12th stellium or not mercury rx', {'or': [{'stellium': {'house': 12}}, {'not': {'retrograde': 'Mercury'}}]}),
+    ('venus-mars any aspect, libra asc', {'and': [{'planets': ['Venus', 'Mars']},
+                                                  {'planet': 'Ascendant', 'sign': 'Libra'}]}),
+]
+
+
+def make_charts(count, seed=7):
+    rng = np.random.default_rng(seed)
+    longitudes = rng.uniform(0.0, 360.0, size=(count, len(chart_model.BODIES)))
+    ascendants = rng.uniform(0.0, 360.0, size=count)
+    houses = rng.integers(1, 13, size=(count, len(chart_model.BODIES)), dtype=np.uint8)
+    retrograde = rng.integers(0, 1 << len(PLANET_BODIES), size=count)
+    for i in range(count):
+        cusps = [(ascendants[i] + 30.0 * k) % 360.0 for k in range(12)]
+        yield f"user-{i}", chart_model.Chart(f"User_{i}", 'Nowhere', (1990, 1, 1, 12, 0), longitudes[i].tolist(),
+                                             cusps, houses[i].tobytes(), int(retrograde[i])).encode()
+
+
+def scan_matches(chart, query):
+    """Reference evaluation of a query tree against one decoded chart."""
+    if 'and' in query:
+        return all(scan_matches(chart, part) for part in query['and'])
+    if 'or' in query:
+        return any(scan_matches(chart, part) for part in query['or'])
+    if 'not' in query:
+        return not scan_matches(chart, query['not'])
+    planets = chart.longitudes[:len(PLANET_BODIES)]
+    if 'planets' in query:
+        a, b = sorted(PLANET_BODIES.index(p) for p in query['planets'])
+        _, i, j, kind, _ = aspect_engine.batch(planets)
+        found = {(x, y, aspect_engine.names[k]) for x, y, k in zip(i.tolist(), j.tolist(), kind.tolist())}
+        return any(x == a and y == b and query.get('aspect', name) == name for x, y, name in found)
+    if 'stellium' in query:
+        houses = [chart.houses[i] for i in range(len(PLANET_BODIES))]
+        return houses.count(query['stellium']['house']) >= 3
+    if 'retrograde' in query:
+        return bool(chart.retrograde >> PLANET_BODIES.index(query['retrograde']) & 1)
+    body = query['planet']
+    if body == 'Ascendant':
+        longitude = chart.cusps[0]
+    else:
+        longitude = chart.longitudes[chart_model.BODIES.index(body)]
+    ok = 'sign' not in query or chart_model.sign_of(longitude) == query['sign']
+    return ok and ('house' not in query or chart.houses[chart_model.BODIES.index(body)] == query['house'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--scan', type=int, default=20000, help='charts to check with a plain scan')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    index = PlacementIndex()
+    started = time.perf_counter()
+    chunk = []
+    scanned = []
+    for user_id, encoded in make_charts(args.users):
+        chunk.append((user_id, encoded))
+        if len(scanned) < args.scan:
+            scanned.append(chart_model.decode.__wrapped__(encoded))
+        if len(chunk) == 8192:
+            index.add_many(chunk)
+            chunk = []
+    index.add_many(chunk)
+    build = time.perf_counter() - started
+    stats = index.stats()
+    print(f"indexed {stats['users']:,} charts in {build:.1f}s "
+          f"({build / stats['users'] * 1e6:.1f} us/chart), {stats['bytes'] / 2**20:.0f} MiB")
+
+    check = PlacementIndex()
+    check.add_many([(f"user-{i}", chart.encode()) for i, chart in enumerate(scanned)])
+    for name, query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            count, _ = index.query(query)
+            timings.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        expected = sum(scan_matches(chart, query) for chart in scanned)
+        scan = (time.perf_counter() - started) / len(scanned) * args.users
+        indexed, _ = check.query(query)
+        status = 'ok' if indexed == expected else f"MISMATCH {indexed} != {expected}"
+        print(f"{name:34s} {count:9,d} users  index {min(timings) * 1e3:7.2f} ms  "
+              f"scan (extrapolated) {scan:7.1f} s  [{status}]")
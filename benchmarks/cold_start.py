@@ -0,0 +1,86 @@
+"""Cold start: seconds from process launch until the app first answers, and until it is ready.
+
+    python benchmarks/cold_start.py --runs 5
+    WARMUP=eager python benchmarks/cold_start.py --server gunicorn --output cold.json
+
+Each run starts a fresh app (as benchmarks/e2e.py does, with the stub as
+upstream) and polls /health/ready: the first response of any status is the
+import-to-first-response time, the first 200 is readiness. A last phase
+times the first birth-data /api/create-user, which pays for whatever the
+warm-up has not loaded yet. Set WARMUP and GUNICORN_PRELOAD_CHARTS in the
+environment to compare modes.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from e2e import free_port, start_app, wait_ready
+from stub_minimax import make_server
+
+BIRTH_USER = {'quizAnswers': {'q1': 'career_pressure'}, 'birthDate': '1990-06-15', 'birthTime': '08:30',
+              'birthCity': 'New York', 'lat': 40.7143, 'lng': -74.006, 'tz': 'America/New_York'}
+
+
+def one_run(args, stub_url):
+    workdir = tempfile.mkdtemp(prefix='oracool-cold-')
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = start_app(args, port, stub_url, workdir)
+    try:
+        live_s, ready_s = wait_ready(base_url, process, args.startup_timeout)
+        start = time.perf_counter()
+        response = requests.post(f"{base_url}/api/create-user", json=BIRTH_USER, timeout=120)
+        response.raise_for_status()
+        first_chart_s = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait(timeout=15)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'first_response_s': live_s, 'ready_s': ready_s, 'first_chart_s': first_chart_s}
+
+
+def summarize(runs, key):
+    values = [run[key] for run in runs]
+    return {'median_s': round(statistics.median(values), 3), 'min_s': round(min(values), 3),
+            'max_s': round(max(values), 3)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='flask')
+    parser.add_argument('--startup-timeout', type=float, default=120.0)
+    parser.add_argument('--output', help='write the JSON report here as well as stdout')
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = make_server(stub_port, 0.0)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{stub_port}/v1/chat/completions"
+
+    runs = [one_run(args, stub_url) for _ in range(args.runs)]
+    stub.shutdown()
+
+    report = {
+        'benchmark': 'cold_start',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': dict(vars(args), warmup=os.environ.get('WARMUP', 'background'),
+                       preload_charts=os.environ.get('GUNICORN_PRELOAD_CHARTS', '0')),
+        'results': {key: summarize(runs, key) for key in ('first_response_s', 'ready_s', 'first_chart_s')},
+        'runs': runs,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
@@ -0,0 +1,410 @@
+"""End-to-end benchmark: the app against a local MiniMax stub, driven by multi-turn users.
+
+    python benchmarks/e2e.py --users 100 --concurrency 20 --turns 3 --output run.json
+    python benchmarks/e2e.py --latency 2 --jitter 1 --distribution lognormal --rate-limit-rate 0.05
+    python benchmarks/e2e.py --baseline run.json     # exit 1 on a regression beyond --tolerance
+    python benchmarks/e2e.py --backends 2 --jitter 2 --distribution lognormal   # LLM routing and hedging
+
+The stub runs in this process and the app is started as a subprocess
+(gunicorn with the repo's gunicorn.conf.py, or --server flask) on a
+throwaway store. Each simulated user creates a profile (a quiz-only sample
+chart, or real birth data for --birth-share of users), asks --turns
+questions through /api/chat or /api/chat/stream, and pages its history
+from /api/messages. The report is JSON: per-endpoint p50/p95/p99, overall
+throughput, stream time-to-first-token, the app's peak RSS (process tree),
+fallback counts scraped from /metrics and the stub's request counters.
+With --backends N, N identically configured stubs are registered as
+LLM_BACKENDS and the report adds the app's routing counters.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_chat import percentile
+from stub_minimax import add_arguments, make_server, server_options
+
+QUIZ_ANSWERS = (
+    {'q1': 'career_pressure', 'q2': 'overwork', 'q3': 'rest'},
+    {'q1': 'emotional_overwhelm', 'q2': 'withdraw', 'q3': 'expression'},
+    {'q1': 'direction_confusion', 'q2': 'overthink', 'q3': 'clarity'},
+    {'q1': 'career_pressure', 'q2': 'withdraw', 'q3': 'clarity'},
+)
+
+FOLLOW_UPS = (
+    "Why do I keep overworking even when I'm exhausted?",
+    "How can I handle anxiety before big meetings?",
+    "What does my Saturn placement mean for relationships?",
+    "When is a good time to change jobs?",
+    "How do I stop people-pleasing?",
+    "What should I focus on this month?",
+)
+
+# Lower is better for everything compared except throughput.
+HIGHER_IS_BETTER = ('requests_per_s', 'users_per_s')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid):
+    pids = [pid]
+    for p in pids:
+        try:
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def tree_rss(pid):
+    """Resident bytes of pid and its descendants (Linux /proc)."""
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RSSSampler(threading.Thread):
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            self.last = tree_rss(self.pid)
+            self.peak = max(self.peak, self.last)
+            self.stop.wait(self.interval)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def add(self, endpoint, seconds, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            key = f"{endpoint} {status}"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self):
+        return {endpoint: latency_summary(values, self.errors.get(endpoint, 0))
+                for endpoint, values in sorted(self.samples.items())}
+
+
+def latency_summary(values, errors=0):
+    return {
+        'count': len(values),
+        'errors': errors,
+        'mean_s': round(sum(values) / len(values), 4) if values else 0.0,
+        'p50_s': round(percentile(values, 50), 4),
+        'p95_s': round(percentile(values, 95), 4),
+        'p99_s': round(percentile(values, 99), 4),
+        'max_s': round(max(values), 4) if values else 0.0,
+    }
+
+
+def timed(recorder, endpoint, fn):
+    start = time.perf_counter()
+    try:
+        response = fn()
+        status = response.status_code
+    except requests.RequestException:
+        response, status = None, 599
+    recorder.add(endpoint, time.perf_counter() - start, status)
+    return response
+
+
+def read_stream(response, start):
+    """Seconds from start to the first token event, and whether a done event arrived."""
+    first_token = None
+    done = False
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            if event == 'done':
+                done = True
+            elif first_token is None:
+                first_token = time.perf_counter() - start
+            event = None
+    return first_token, done
+
+
+def run_user(base_url, args, recorder, ttfts, index):
+    rng = random.Random(args.seed + index)
+    session = requests.Session()
+    body = {'quizAnswers': rng.choice(QUIZ_ANSWERS)}
+    if rng.random() < args.birth_share:
+        moment = 1960 + rng.randrange(50), 1 + rng.randrange(12), 1 + rng.randrange(28)
+        body.update(birthDate=f"{moment[0]}-{moment[1]:02d}-{moment[2]:02d}",
+                    birthTime=f"{rng.randrange(24):02d}:{rng.randrange(60):02d}",
+                    birthCity='New York', lat=40.7143, lng=-74.006, tz='America/New_York')
+    response = timed(recorder, 'create_user',
+                     lambda: session.post(f"{base_url}/api/create-user", json=body, timeout=60))
+    if response is None or response.status_code != 200:
+        return
+    created = response.json()
+    user_id = created['userId']
+
+    questions = [rng.choice(created.get('suggestions') or FOLLOW_UPS)]
+    questions += rng.sample(FOLLOW_UPS, min(len(FOLLOW_UPS), args.turns - 1))
+    for question in questions[:args.turns]:
+        if args.think_time:
+            time.sleep(rng.uniform(0, 2 * args.think_time))
+        payload = {'userId': user_id, 'message': question}
+        if rng.random() < args.stream_share:
+            start = time.perf_counter()
+            try:
+                with session.post(f"{base_url}/api/chat/stream", json=payload, stream=True,
+                                  timeout=args.timeout) as response:
+                    status = response.status_code
+                    first_token, done = read_stream(response, start) if status == 200 else (None, False)
+                    if status == 200 and not done:
+                        status = 599
+            except requests.RequestException:
+                status, first_token = 599, None
+            recorder.add('chat_stream', time.perf_counter() - start, status)
+            if first_token is not None:
+                with recorder.lock:
+                    ttfts.append(first_token)
+        else:
+            timed(recorder, 'chat', lambda: session.post(f"{base_url}/api/chat", json=payload, timeout=args.timeout))
+
+    response = timed(recorder, 'messages', lambda: session.get(f"{base_url}/api/messages/{user_id}", timeout=60))
+    if response is not None and response.status_code == 200:
+        etag = response.headers.get('ETag')
+        if etag:
+            timed(recorder, 'messages_revalidate', lambda: session.get(
+                f"{base_url}/api/messages/{user_id}", headers={'If-None-Match': etag}, timeout=60))
+
+
+def start_app(args, port, stub_url, workdir, backend_urls=()):
+    env = dict(os.environ, MINIMAX_API_URL=stub_url, MINIMAX_API_KEY='stub', PORT=str(port),
+               STORE_PATH=os.path.join(workdir, 'oracool.db'), JOBS_PATH=os.path.join(workdir, 'jobs.db'),
+               LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'),
+               USER_RATE_PER_MINUTE=os.environ.get('USER_RATE_PER_MINUTE', '0'),
+               IP_RATE_PER_MINUTE=os.environ.get('IP_RATE_PER_MINUTE', '0'))
+    if len(backend_urls) > 1:
+        env['LLM_BACKENDS'] = json.dumps([{'name': f"stub{i}", 'url': url} for i, url in enumerate(backend_urls)])
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f"127.0.0.1:{port}", 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log = open(os.path.join(workdir, 'app.log'), 'w')
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(base_url, process, timeout):
+    """Seconds from launch until /health/ready answers (liveness), then until it reports ready."""
+    start = time.perf_counter()
+    live = None
+    while time.perf_counter() - start < timeout:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"app exited with status {process.returncode}")
+        try:
+            response = requests.get(f"{base_url}/health/ready", timeout=5)
+            if live is None:
+                live = time.perf_counter() - start
+            if response.status_code == 200:
+                return live, time.perf_counter() - start
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    raise SystemExit(f"app not ready after {timeout}s")
+
+
+def scrape_counters(base_url, prefix):
+    counts = {}
+    try:
+        text = requests.get(f"{base_url}/metrics", timeout=10).text
+    except requests.RequestException:
+        return counts
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            name, value = line.rsplit(' ', 1)
+            counts[name[len(prefix):] or 'total'] = float(value)
+    return counts
+
+
+def flatten(report, prefix=''):
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[prefix + key] = value
+    return values
+
+
+def compare(report, baseline, tolerance, min_delta):
+    """Regressions of latency, RSS and throughput figures beyond tolerance (a fraction).
+
+    Latency changes smaller than min_delta seconds are ignored, so
+    millisecond endpoints do not flag on scheduler noise.
+    """
+    watched = ('_s', '_mb', '_per_s')
+    for key, value in sorted(baseline.get('config', {}).items()):
+        if report['config'].get(key, value) != value:
+            print(f"note: {key} was {value!r}, now {report['config'][key]!r}", file=sys.stderr)
+    current, previous = flatten(report['results']), flatten(baseline['results'])
+    regressions = []
+    for key, old in sorted(previous.items()):
+        new = current.get(key)
+        if new is None or not key.endswith(watched) or old <= 0 or key.endswith('max_s'):
+            continue
+        change = (new - old) / old
+        worse = change < -tolerance if key.endswith(HIGHER_IS_BETTER) else change > tolerance
+        if key.endswith('_s') and not key.endswith('_per_s') and new - old < min_delta:
+            worse = False
+        print(f"{key:45} {old:>10.4g} -> {new:>10.4g}  {change:+7.1%}{'  REGRESSION' if worse else ''}",
+              file=sys.stderr)
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='oracool-e2e-')
+    stubs, stub_bases = [], []
+    for i in range(args.backends):
+        stub_port = (args.stub_port + i if args.stub_port else 0) or free_port()
+        stubs.append(make_server(stub_port, args.latency, **server_options(args)))
+        threading.Thread(target=stubs[-1].serve_forever, daemon=True).start()
+        stub_bases.append(f"http://127.0.0.1:{stub_port}")
+    stub_base = stub_bases[0]
+
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = start_app(args, port, f"{stub_base}/v1/chat/completions", workdir,
+                            [f"{base}/v1/chat/completions" for base in stub_bases])
+    try:
+        live_s, ready_s = wait_ready(base_url, process, args.startup_timeout)
+        sampler = RSSSampler(process.pid if process else args.pid) if (process or args.pid) else None
+        if sampler:
+            sampler.start()
+            idle_rss = tree_rss(sampler.pid)
+
+        recorder, ttfts = Recorder(), []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda i: run_user(base_url, args, recorder, ttfts, i), range(args.users)))
+        elapsed = time.perf_counter() - start
+
+        if sampler:
+            sampler.stop.set()
+            sampler.join()
+        endpoints = recorder.summary()
+        requests_total = sum(e['count'] for e in endpoints.values())
+        chats = [v for name in ('chat', 'chat_stream') for v in recorder.samples.get(name, [])]
+        results = {
+            'startup': {'live_s': round(live_s, 3), 'ready_s': round(ready_s, 3)},
+            'elapsed_s': round(elapsed, 3),
+            'throughput': {
+                'requests_per_s': round(requests_total / elapsed, 2),
+                'users_per_s': round(args.users / elapsed, 2),
+            },
+            'endpoints': endpoints,
+            'chat_all': latency_summary(chats),
+            'stream_first_token': latency_summary(ttfts),
+            'rss': {'idle_mb': round(idle_rss / 2 ** 20, 1), 'peak_mb': round(sampler.peak / 2 ** 20, 1),
+                    'end_mb': round(sampler.last / 2 ** 20, 1)} if sampler else None,
+            'statuses': recorder.statuses,
+            'fallbacks': scrape_counters(base_url, 'oracool_fallback_responses_total'),
+            'upstream': requests.get(f"{stub_base}/stats", timeout=5).json() if len(stubs) == 1 else
+                        {f"stub{i}": requests.get(f"{base}/stats", timeout=5).json() for i, base in enumerate(stub_bases)},
+            'routing': scrape_counters(base_url, 'oracool_llm_routing_events_total'),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for stub in stubs:
+            stub.shutdown()
+
+    return {
+        'benchmark': 'e2e',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results,
+        'log': os.path.join(workdir, 'app.log'),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--turns', type=int, default=3, help='questions per user')
+    parser.add_argument('--stream-share', type=float, default=0.5, help='share of turns sent to /api/chat/stream')
+    parser.add_argument('--birth-share', type=float, default=0.3, help='share of users with real birth data')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds between a user\'s turns')
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--base-url', help='benchmark an app already running instead (point it at --stub-port)')
+    parser.add_argument('--stub-port', type=int, default=0, help='stub port (default: any free port)')
+    parser.add_argument('--backends', type=int, default=1, help='stub servers registered as LLM backends')
+    parser.add_argument('--pid', type=int, help='with --base-url, the app process to sample RSS from')
+    parser.add_argument('--startup-timeout', type=float, default=120.0)
+    parser.add_argument('--output', help='write the JSON report here as well as stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative regression')
+    parser.add_argument('--min-delta', type=float, default=0.005, help='ignore latency changes below this (s)')
+    add_arguments(parser)
+    parser.set_defaults(latency=0.5)
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}", file=sys.stderr)
+            sys.exit(1)
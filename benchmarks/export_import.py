@@ -0,0 +1,100 @@
+"""Bulk import and streaming export throughput, and export memory against dataset size.
+
+    python benchmarks/export_import.py --users 50000 --messages 8
+
+Imports synthetic users (encoded chart records) and conversations into a
+throwaway SQLite store, exports them back as gzip NDJSON, and checks the
+round trip. Export peak memory (tracemalloc, measured in a second pass) is
+reported for the full store and for its first tenth; it should not grow with
+the dataset.
+"""
+import argparse
+import gzip
+import io
+import itertools
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cohort_queries import make_charts
+from payloads import dumps
+from storage import SQLiteStore
+from transfer import encode_records, export_records, format_cursor, import_records, read_lines
+
+
+def synthetic_export(users, messages_per_user):
+    yield dumps({'type': 'export', 'version': 1, 'backend': 'sqlite', 'startedAt': datetime.now().isoformat()})
+    message_id = 0
+    for user_id, chart in make_charts(users):
+        yield dumps({'type': 'user', 'id': user_id, 'user': {
+            'birthDate': '1990-01-01', 'birthTime': '12:00', 'birthCity': 'Nowhere', 'profile': 'sarah',
+            'chart': chart, 'chartStatus': 'ready', 'createdAt': datetime.now().isoformat()}})
+    for i in range(users):
+        for turn in range(messages_per_user):
+            message_id += 1
+            role, content = ('user', 'What does my Saturn return mean for work?') if turn % 2 == 0 else \
+                ('assistant', 'Your Saturn in the 10th House asks for structure ... ' * 12)
+            yield dumps({'type': 'message', 'id': message_id, 'userId': f"user-{i}", 'role': role,
+                         'content': content, 'createdAt': f"2026-01-01T00:00:{message_id:08d}"})
+
+
+def export_bytes(store, cursor=None, stop_after=None):
+    """(records, compressed bytes) for an export, optionally stopping after stop_after records."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in itertools.islice(export_records(store, cursor), stop_after):
+            count += 1
+            yield record
+
+    size = sum(len(chunk) for chunk in encode_records(counted()))
+    return count, size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--messages', type=int, default=8, help='messages per user')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    store = SQLiteStore(os.path.join(tempfile.mkdtemp(), 'export.db'))
+    total = args.users * (1 + args.messages)
+
+    started = time.perf_counter()
+    stats = import_records(store, synthetic_export(args.users, args.messages), args.chunk_size)
+    elapsed = time.perf_counter() - started
+    print(f"import  {stats['users']:,} users, {stats['messages']:,} messages in {elapsed:.1f}s "
+          f"({total / elapsed:,.0f} records/s, {stats['chunks']} transactions)")
+
+    started = time.perf_counter()
+    body = b''.join(encode_records(export_records(store, chunk_size=args.chunk_size)))
+    elapsed = time.perf_counter() - started
+    print(f"export  {total:,} records in {elapsed:.1f}s ({total / elapsed:,.0f} records/s), "
+          f"{len(body) / 2 ** 20:.1f} MiB gzip")
+
+    check = SQLiteStore(os.path.join(tempfile.mkdtemp(), 'check.db'))
+    reloaded = import_records(check, read_lines(io.BytesIO(body)), args.chunk_size)
+    again = gzip.decompress(b''.join(encode_records(export_records(check)))).splitlines()
+    original = gzip.decompress(body).splitlines()
+    same = [line for line in original if b'"startedAt"' not in line] == \
+        [line for line in again if b'"startedAt"' not in line]
+    print(f"round trip {'identical' if same else 'DIFFERS'}: {reloaded['users']:,} users, "
+          f"{reloaded['messages']:,} messages, final cursor {reloaded['cursor']}")
+    del body
+
+    for label, limit in (('first tenth', total // 10), ('full store', None)):
+        tracemalloc.start()
+        records, size = export_bytes(store, stop_after=limit)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"export peak memory, {label:11s} {peak / 2 ** 20:6.2f} MiB for {records:,} records")
+    print(f"resume from {format_cursor(args.users, args.users * args.messages // 2)}: "
+          f"{export_bytes(store, format_cursor(args.users, args.users * args.messages // 2))[0]:,} records")
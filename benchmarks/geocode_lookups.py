@@ -0,0 +1,79 @@
+"""Lookups/sec for the offline geocoding index.
+
+    python benchmarks/geocode_lookups.py --index data/geonames.idx
+
+Without --index a synthetic GeoNames-style dump is generated and indexed first.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geocoding import Geocoder, build_index, normalize_name
+
+TIMEZONES = ['America/New_York', 'America/Chicago', 'America/Los_Angeles', 'Europe/Paris', 'Asia/Tokyo']
+
+
+def synthetic_dump(path, count):
+    rng = random.Random(7)
+    names = []
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            name = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12))).title()
+            names.append(name)
+            cols = [''] * 19
+            cols[0] = str(i)
+            cols[1] = cols[2] = name
+            cols[4] = f"{rng.uniform(-60, 70):.5f}"
+            cols[5] = f"{rng.uniform(-180, 180):.5f}"
+            cols[6] = 'P'
+            cols[8] = 'US'
+            cols[10] = 'CA'
+            cols[14] = str(rng.randint(1000, 5_000_000))
+            cols[17] = rng.choice(TIMEZONES)
+            f.write('\t'.join(cols) + '\n')
+    return names
+
+
+def measure(label, fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {len(queries) / elapsed:>12,.0f} lookups/s  {elapsed / len(queries) * 1e6:8.1f} us/lookup")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--index')
+    parser.add_argument('--places', type=int, default=30000, help='synthetic dump size')
+    parser.add_argument('--queries', type=int, default=20000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    if args.index:
+        geocoder = Geocoder(args.index)
+        names = [geocoder.key_entry(random.randrange(geocoder.key_count))[0].decode() for _ in range(1000)]
+    else:
+        dump = os.path.join(workdir, 'cities.txt')
+        names = synthetic_dump(dump, args.places)
+        index_path = os.path.join(workdir, 'geonames.idx')
+        start = time.perf_counter()
+        build_index(dump, index_path)
+        print(f"built index for {args.places} places in {time.perf_counter() - start:.2f}s "
+              f"({os.path.getsize(index_path) / 1024:.0f} KiB)")
+        geocoder = Geocoder(index_path)
+
+    rng = random.Random(1)
+    exact = [rng.choice(names) for _ in range(args.queries)]
+    prefixes = [normalize_name(n)[:3] for n in exact]
+    typos = [n[:2] + n[3:] for n in exact[:max(1, args.queries // 20)]]
+
+    measure('exact', geocoder.lookup, exact)
+    measure('prefix', geocoder.prefix, prefixes)
+    measure('fuzzy', geocoder.lookup, typos)
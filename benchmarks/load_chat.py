@@ -0,0 +1,107 @@
+"""Concurrent /api/chat load test against a running Oracool server.
+
+Start the stub upstream and the app first, with the per-user and per-IP
+rate limits off (every simulated user comes from this one IP), e.g.:
+    python benchmarks/stub_minimax.py --latency 2.0 &
+    MINIMAX_API_URL=http://127.0.0.1:8765/v1/chat/completions \
+        IP_RATE_PER_MINUTE=0 USER_RATE_PER_MINUTE=0 gunicorn app:app &
+    python benchmarks/load_chat.py --base-url http://127.0.0.1:5000 --levels 10 100 500
+
+429s are reported as rate_limited, apart from other errors; at high levels
+they also come from LLM admission control (LLM_MAX_INFLIGHT, LLM_MAX_QUEUE).
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def create_users(base_url, count):
+    """(user ids, 429 count); a refused create-user is counted, not retried."""
+    session = requests.Session()
+    user_ids = []
+    rate_limited = 0
+    for _ in range(count):
+        response = session.post(f"{base_url}/api/create-user", json={'quizAnswers': {'q1': 'overwork'}})
+        if response.status_code == 429:
+            rate_limited += 1
+            continue
+        response.raise_for_status()
+        user_ids.append(response.json()['userId'])
+    return user_ids, rate_limited
+
+
+def send_chat(base_url, user_id):
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/api/chat", json={
+        'userId': user_id,
+        'message': 'What does my chart say about my career?'
+    }, timeout=600)
+    return time.perf_counter() - start, response.status_code
+
+
+def probe_health(base_url, stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            requests.get(f"{base_url}/health", timeout=30)
+            samples.append(time.perf_counter() - start)
+        except requests.RequestException:
+            samples.append(30.0)
+        time.sleep(0.1)
+
+
+def run_level(base_url, concurrency):
+    user_ids, create_limited = create_users(base_url, concurrency)
+
+    stop = threading.Event()
+    health_samples = []
+    prober = threading.Thread(target=probe_health, args=(base_url, stop, health_samples), daemon=True)
+    prober.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda uid: send_chat(base_url, uid), user_ids))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    prober.join()
+
+    latencies = [latency for latency, _ in results]
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': sum(1 for _, status in results if status not in (200, 429)),
+        'rate_limited': sum(1 for _, status in results if status == 429),
+        'create_rate_limited': create_limited,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(len(results) / elapsed, 2) if results else 0.0,
+        'p50_s': round(percentile(latencies, 50), 3),
+        'p99_s': round(percentile(latencies, 99), 3),
+        'health_p99_s': round(percentile(health_samples, 99), 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--levels', type=int, nargs='+', default=[10, 100, 500])
+    args = parser.parse_args()
+
+    report = [run_level(args.base_url, level) for level in args.levels]
+    for row in report:
+        print(f"c={row['concurrency']:>4}  {row['requests_per_s']:>8} req/s  "
+              f"p50 {row['p50_s']}s  p99 {row['p99_s']}s  health p99 {row['health_p99_s']}s  "
+              f"errors {row['errors']}  rate limited {row['rate_limited'] + row['create_rate_limited']}")
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,128 @@
+"""Micro-benchmarks for the per-request hot paths, reported as JSON.
+
+    python benchmarks/micro.py --seconds 1 --output micro.json
+    python benchmarks/micro.py --only compute_chart --baseline micro.json
+
+Each case runs for about --seconds (at least --min-runs calls) and reports
+calls per second with p50/p95/p99 per call in microseconds. Cached paths
+are timed through their uncached functions (lru_cache __wrapped__) unless
+the case name says otherwise.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('STORE_BACKEND', 'memory')
+os.environ.setdefault('JOBS_PATH', os.path.join(tempfile.mkdtemp(), 'jobs.db'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import chart_model
+from app import (SAMPLE_CHARTS, build_system_prompt, encode_chat_request, map_quiz_to_profile,
+                 system_prompt_for)
+from charts import compute_chart, compute_chart_body
+from load_chat import percentile
+
+NEW_YORK = (40.7143, -74.006, 'America/New_York')
+
+HISTORY = [
+    {'role': 'user', 'content': 'What does my chart say about my career?'},
+    {'role': 'assistant', 'content': 'Your Saturn in the 10th House ... ' * 40},
+    {'role': 'user', 'content': 'Why do I keep overworking?'},
+    {'role': 'assistant', 'content': 'Your Virgo Sun in the 6th House ... ' * 40},
+]
+
+
+def birth_moments(count):
+    start = date(1960, 1, 1)
+    for i in range(count):
+        day = start + timedelta(days=97 * i)
+        yield day.year, day.month, day.day, (7 * i) % 24, (13 * i) % 60
+
+
+def cases():
+    moments = list(birth_moments(64))
+    charts = [compute_chart_body(*m, *NEW_YORK).renamed('Bench', 'New York').encode() for m in moments[:16]]
+    prompt = system_prompt_for(charts[0], date.today())[0]
+    quizzes = [{'q1': 'career_pressure', 'q2': 'withdraw', 'q3': 'clarity'},
+               {'q1': 'emotional_overwhelm', 'q2': 'expression', 'q3': 'rest'}, {}]
+    today = date.today()
+    counter = iter(range(1 << 62))
+
+    return {
+        'compute_chart': lambda: compute_chart_body(*moments[next(counter) % len(moments)], *NEW_YORK),
+        'compute_chart_cached': lambda: compute_chart('Bench', *moments[0], 'New York', location=NEW_YORK),
+        'map_quiz_to_profile': lambda: map_quiz_to_profile(quizzes[next(counter) % len(quizzes)]),
+        'chart_text': lambda: chart_model.chart_text.__wrapped__(charts[next(counter) % len(charts)]),
+        'system_prompt': lambda: system_prompt_for.__wrapped__(charts[next(counter) % len(charts)], today),
+        'system_prompt_sample': lambda: system_prompt_for.__wrapped__(SAMPLE_CHARTS['sarah'], today),
+        'system_prompt_cached': lambda: system_prompt_for(charts[0], today),
+        'build_system_prompt': lambda: build_system_prompt(SAMPLE_CHARTS['alex']),
+        'encode_chat_request': lambda: encode_chat_request(prompt, 'How do I stop people-pleasing?', HISTORY),
+    }
+
+
+def measure(fn, seconds, min_runs):
+    fn()
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < min_runs or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    return {
+        'runs': len(samples),
+        'per_s': round(len(samples) / total, 1),
+        'mean_us': round(total / len(samples) * 1e6, 2),
+        'p50_us': round(percentile(samples, 50) * 1e6, 2),
+        'p95_us': round(percentile(samples, 95) * 1e6, 2),
+        'p99_us': round(percentile(samples, 99) * 1e6, 2),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=1.0, help='time budget per case')
+    parser.add_argument('--min-runs', type=int, default=20)
+    parser.add_argument('--only', nargs='+', help='case names to run')
+    parser.add_argument('--output', help='write the JSON report here as well as stdout')
+    parser.add_argument('--baseline', help='earlier JSON report to compare p50 against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn in cases().items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(fn, args.seconds, args.min_runs)
+        print(f"{name:22} {results[name]['per_s']:>12,.1f}/s  p50 {results[name]['p50_us']:>10.1f} us  "
+              f"p99 {results[name]['p99_us']:>10.1f} us", file=sys.stderr)
+
+    report = {'benchmark': 'micro', 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': sys.version.split()[0], 'results': results}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        slower = []
+        for name, result in results.items():
+            if name in baseline:
+                change = result['p50_us'] / baseline[name]['p50_us'] - 1
+                flag = change > args.tolerance
+                print(f"{name:22} p50 {change:+7.1%}{'  REGRESSION' if flag else ''}", file=sys.stderr)
+                if flag:
+                    slower.append(name)
+        if slower:
+            sys.exit(1)
@@ -0,0 +1,243 @@
+"""Local stand-in for the MiniMax /v1/chat/completions API.
+
+Usage:
+    python benchmarks/stub_minimax.py --port 8765 --latency 2.0
+    python benchmarks/stub_minimax.py --latency 2.0 --jitter 0.8 --distribution lognormal \
+        --ttft 0.4 --error-rate 0.02 --rate-limit-rate 0.05 --think-words 40
+
+Point the app at it with MINIMAX_API_URL=http://127.0.0.1:8765/v1/chat/completions
+
+Latency is drawn per request from the chosen distribution (mean --latency,
+spread --jitter). Streams send the first token after --ttft seconds (drawn
+the same way when --ttft-jitter is set) and spread the rest over the
+remaining time. A share of requests can be failed with a 500 or refused
+with a 429 + Retry-After. GET /stats returns request counters as JSON;
+POST /stats/reset clears them.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+THINK = "Looking at the placements the user asked about before answering."
+
+READING = """1️⃣ Core Identity
+Core themes
+Depth · Intuition · Duty · Transformation
+
+Sun in Pisces (24°52') in the 8th House
+You process the world through feeling first.
+
+● You absorb other people's moods.
+● You need solitude to reset.
+● You are not wired for lukewarm situations.
+
+So in short:
+Your sensitivity is your instrument, not your weakness."""
+
+DISTRIBUTIONS = ('fixed', 'normal', 'lognormal', 'exponential')
+
+
+def sample_latency(distribution, mean, jitter):
+    if mean <= 0:
+        return 0.0
+    if distribution == 'fixed' or (jitter <= 0 and distribution != 'exponential'):
+        return mean
+    if distribution == 'normal':
+        return max(0.0, random.gauss(mean, jitter))
+    if distribution == 'lognormal':
+        # Parameters chosen so the samples have the requested mean and standard deviation.
+        sigma2 = math.log(1 + (jitter / mean) ** 2)
+        return random.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+    return random.expovariate(1.0 / mean)
+
+
+def reading_text(think_words):
+    if think_words <= 0:
+        return READING
+    words = THINK.split(' ')
+    think = ' '.join(words[i % len(words)] for i in range(think_words))
+    return f"<think>\n{think}\n</think>\n\n{READING}"
+
+
+class StubStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {'requests': 0, 'streams': 0, 'completed': 0, 'errors': 0, 'rate_limited': 0,
+                           'disconnects': 0}
+            self.inflight = 0
+            self.max_inflight = 0
+
+    def add(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def enter(self):
+        with self.lock:
+            self.counts['requests'] += 1
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+
+    def leave(self):
+        with self.lock:
+            self.inflight -= 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts, inflight=self.inflight, max_inflight=self.max_inflight)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 1.0
+    jitter = 0.0
+    distribution = 'normal'
+    ttft = 0.0
+    ttft_jitter = 0.0
+    error_rate = 0.0
+    rate_limit_rate = 0.0
+    retry_after = 1
+    think_words = 12
+    stats = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, self.stats.snapshot())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.path == '/stats/reset':
+            self.stats.reset()
+            self.send_json(200, {'ok': True})
+            return
+
+        self.stats.enter()
+        try:
+            self.complete(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.stats.add('disconnects')
+        finally:
+            self.stats.leave()
+
+    def complete(self, body):
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.stats.add('rate_limited')
+            self.send_json(429, {'error': {'message': 'rate limit exceeded'}},
+                           {'Retry-After': str(self.retry_after)})
+            return
+        delay = sample_latency(self.distribution, self.latency, self.jitter)
+        if roll < self.rate_limit_rate + self.error_rate:
+            time.sleep(min(delay, self.ttft or delay))
+            self.stats.add('errors')
+            self.send_json(500, {'error': {'message': 'injected upstream error'}})
+            return
+
+        text = reading_text(self.think_words)
+        words = text.split(' ')
+        usage = {'prompt_tokens': sum(len(m.get('content') or '') for m in body.get('messages', [])) // 4,
+                 'completion_tokens': len(words)}
+
+        if body.get('stream'):
+            self.stats.add('streams')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            first = sample_latency(self.distribution, self.ttft, self.ttft_jitter) if self.ttft else 0.0
+            step = max(0.0, delay - first) / max(len(words) - 1, 1)
+            time.sleep(first)
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(step)
+                piece = word if i == 0 else ' ' + word
+                self.write_chunk('data: ' + json.dumps({'choices': [{'delta': {'content': piece}}]}) + '\n\n')
+            self.write_chunk('data: ' + json.dumps({'choices': [], 'usage': usage}) + '\n\n')
+            self.write_chunk('data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+            self.stats.add('completed')
+            return
+
+        time.sleep(delay)
+        self.send_json(200, {
+            'choices': [{'message': {'role': 'assistant', 'content': text}}],
+            'usage': usage
+        })
+        self.stats.add('completed')
+
+    def send_json(self, status, obj, headers=None):
+        payload = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled keep-alive connections is expected noise.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def make_server(port, latency, jitter=0.0, distribution='normal', ttft=0.0, ttft_jitter=0.0, error_rate=0.0,
+                rate_limit_rate=0.0, retry_after=1, think_words=12):
+    handler = type('ConfiguredStubHandler', (StubHandler,), {
+        'latency': latency, 'jitter': jitter, 'distribution': distribution, 'ttft': ttft, 'ttft_jitter': ttft_jitter,
+        'error_rate': error_rate, 'rate_limit_rate': rate_limit_rate, 'retry_after': retry_after,
+        'think_words': think_words, 'stats': StubStats()
+    })
+    return StubServer(('127.0.0.1', port), handler)
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=1.0, help='mean seconds per completion')
+    parser.add_argument('--jitter', type=float, default=0.0, help='stddev of latency in seconds')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='normal')
+    parser.add_argument('--ttft', type=float, default=0.0, help='seconds to the first streamed token')
+    parser.add_argument('--ttft-jitter', type=float, default=0.0, help='stddev of --ttft in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failed with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of requests refused with a 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--think-words', type=int, default=12, help='words in the <think> block (0 for none)')
+
+
+def server_options(args):
+    return {'jitter': args.jitter, 'distribution': args.distribution, 'ttft': args.ttft, 'ttft_jitter': args.ttft_jitter,
+            'error_rate': args.error_rate, 'rate_limit_rate': args.rate_limit_rate,
+            'retry_after': args.retry_after, 'think_words': args.think_words}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    print(f"Stub MiniMax listening on http://127.0.0.1:{args.port}/v1/chat/completions")
+    make_server(args.port, args.latency, **server_options(args)).serve_forever()
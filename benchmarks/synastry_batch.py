@@ -0,0 +1,53 @@
+"""Pairwise synastry reports versus batched one-against-many scoring.
+
+    python benchmarks/synastry_batch.py --charts 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synastry
+from transits import whole_sign_cusps
+
+
+def make_natals(count, seed=7):
+    rng = np.random.default_rng(seed)
+    natals = []
+    for row in rng.uniform(0.0, 360.0, size=(count, len(synastry.POINTS))):
+        positions = dict(zip(synastry.POINTS, row.tolist()))
+        natals.append({'positions': positions, 'cusps': whole_sign_cusps(positions['Ascendant'])})
+    return natals
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--charts', type=int, default=10000)
+    parser.add_argument('--pairs', type=int, default=1000, help='full compare() reports to time')
+    args = parser.parse_args()
+
+    natals = make_natals(args.charts + 1)
+    subject, others = natals[0], natals[1:]
+
+    stack_elapsed, stacked = timed(lambda: synastry.stack(others))
+    batch_elapsed, (scores, _, _) = timed(lambda: synastry.score_many(subject, stacked))
+    pairs = others[:args.pairs]
+    pair_elapsed, reports = timed(lambda: [synastry.compare(subject, other) for other in pairs])
+
+    drift = max(abs(report['score'] - round(float(score), 1)) for report, score in zip(reports, scores))
+    print(f"max score difference batch vs compare(): {drift:.2f}")
+    print(f"compare() full report   {pair_elapsed / len(pairs) * 1e6:10.1f} us/pair  "
+          f"({len(pairs) / pair_elapsed:,.0f} pairs/s)")
+    print(f"stack natal vectors     {stack_elapsed / args.charts * 1e6:10.1f} us/chart")
+    print(f"score_many              {batch_elapsed / args.charts * 1e6:10.1f} us/pair  "
+          f"({args.charts / batch_elapsed:,.0f} pairs/s)")
@@ -0,0 +1,103 @@
+"""Resident memory per stored user: legacy text/dict charts versus encoded chart records.
+
+    python benchmarks/user_memory.py --users 20000 --charts 200
+
+Users are built the way a store holds them after loading from SQLite (one
+json.loads per user, so nothing is shared between users), and the total is
+projected to --project users.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('STORE_BACKEND', 'memory')
+os.environ.setdefault('JOBS_PATH', os.path.join(tempfile.mkdtemp(), 'jobs.db'))
+
+import chart_model
+from app import build_system_prompt, chart_with_transits, estimate_tokens, transit_engine
+from chart_engine import compute_record
+
+
+def make_charts(count):
+    start = datetime(1960, 1, 1)
+    charts = []
+    for i in range(count):
+        moment = start + timedelta(minutes=104729 * i)
+        chart, error = compute_record({
+            'id': uuid.uuid4().hex, 'birthDate': moment.strftime('%Y-%m-%d'), 'birthTime': moment.strftime('%H:%M'),
+            'birthCity': 'New York', 'lat': 40.7143, 'lng': -74.006, 'tz': 'America/New_York'
+        })
+        if error is None:
+            charts.append(chart)
+    return charts
+
+
+def base_user():
+    return {'birthDate': '1990-01-01', 'birthTime': '12:00', 'birthCity': 'New York', 'profile': 'sarah',
+            'chartStatus': 'ready', 'createdAt': datetime.now().isoformat()}
+
+
+def legacy_user(user_id, chart):
+    """A user as stored before chart records: chart text, chartVisual dicts and the rendered prompt."""
+    decoded = chart_model.decode(chart)
+    text = chart_model.chart_text(decoded.renamed(f"User_{user_id[:8]}", decoded.city).encode())
+    prompt = build_system_prompt(chart_with_transits(text, decoded.natal(), transit_engine, date.today()))
+    return dict(base_user(), chartData=text, chartVisual=chart_model.chart_json(chart),
+                systemPrompt=prompt, systemPromptTokens=estimate_tokens(prompt),
+                systemPromptDate=date.today().isoformat())
+
+
+def compact_user(user_id, chart):
+    decoded = chart_model.decode(chart)
+    return dict(base_user(), chart=decoded.renamed(f"User_{user_id[:8]}", decoded.city).encode())
+
+
+def measure(make, charts, count):
+    # Serialized templates are built first so only the loaded users are counted.
+    templates = []
+    for i in range(len(charts)):
+        user_id = str(uuid.uuid4())
+        templates.append(json.dumps(make(user_id, charts[i])))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    users = {}
+    for i in range(count):
+        users[i] = json.loads(templates[i % len(templates)])
+    elapsed = time.perf_counter() - started
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count, elapsed / count, users
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--charts', type=int, default=200)
+    parser.add_argument('--project', type=int, default=1000000)
+    args = parser.parse_args()
+
+    charts = make_charts(args.charts)
+    results = {}
+    for name, make in (('legacy', legacy_user), ('compact', compact_user)):
+        per_user, load_time, users = measure(make, charts, args.users)
+        results[name] = per_user
+        print(f"{name:8} {per_user:9,.0f} B/user  {per_user * args.project / 2 ** 30:7.2f} GiB per "
+              f"{args.project:,} users  json.loads {load_time * 1e6:6.1f} us/user")
+        del users
+
+    print(f"reduction {results['legacy'] / results['compact']:.1f}x")
+
+    started = time.perf_counter()
+    for chart in charts:
+        chart_model.body_text(chart_model.decode(chart))
+    render = (time.perf_counter() - started) / len(charts)
+    print(f"render chart text from record (uncached) {render * 1e6:.1f} us")
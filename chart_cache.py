@@ -0,0 +1,78 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_VERSION = 3
+
+
+def make_chart_key(year, month, day, hour, minute, lat, lng, tz_str):
+    """Content address for a natal chart: birth minute plus resolved location."""
+    raw = f"v{CACHE_VERSION}|{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}|{lat:.4f}|{lng:.4f}|{tz_str}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ChartCache:
+    """LRU cache of encoded chart records with an optional SQLite disk tier.
+
+    Entries hold the name-independent record (see chart_model) so identical
+    birth data can be shared between users.
+    """
+
+    def __init__(self, max_entries=4096, disk_path=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats_counts = {'hits': 0, 'diskHits': 0, 'misses': 0, 'evictions': 0}
+        self.db = None
+        if disk_path:
+            self.db = sqlite3.connect(disk_path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS chart_records (key TEXT PRIMARY KEY, record TEXT NOT NULL)'
+            )
+            self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats_counts['hits'] += 1
+                return entry
+
+            if self.db is not None:
+                row = self.db.execute('SELECT record FROM chart_records WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    entry = row[0]
+                    self.remember(key, entry)
+                    self.stats_counts['diskHits'] += 1
+                    return entry
+
+            self.stats_counts['misses'] += 1
+            return None
+
+    def put(self, key, entry):
+        with self.lock:
+            self.remember(key, entry)
+            if self.db is not None:
+                self.db.execute('INSERT OR REPLACE INTO chart_records (key, record) VALUES (?, ?)', (key, entry))
+                self.db.commit()
+        return entry
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats_counts['evictions'] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.stats_counts)
+            stats['size'] = len(self.entries)
+            stats['maxEntries'] = self.max_entries
+            stats['diskEnabled'] = self.db is not None
+        lookups = stats['hits'] + stats['diskHits'] + stats['misses']
+        stats['hitRate'] = round((stats['hits'] + stats['diskHits']) / lookups, 4) if lookups else 0.0
+        return stats
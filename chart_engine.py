@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+WARMUP_RECORD = {'birthDate': '2000-01-01', 'birthTime': '12:00', 'birthCity': 'Greenwich',
+                 'lat': 51.4769, 'lng': 0.0005, 'tz': 'Europe/London'}
+
+
+def parse_birth_record(record):
+    """Turn a create-user style record into compute_chart arguments."""
+    year, month, day = (int(p) for p in record['birthDate'].split('-'))
+    hour, minute = (int(p) for p in record.get('birthTime', '12:00').split(':')[:2])
+    location = None
+    if record.get('lat') is not None and record.get('lng') is not None and record.get('tz'):
+        location = (round(float(record['lat']), 4), round(float(record['lng']), 4), record['tz'])
+    return year, month, day, hour, minute, record.get('birthCity', ''), record.get('nation', ''), location
+
+
+def compute_record(record):
+    from charts import compute_chart
+
+    try:
+        year, month, day, hour, minute, city, nation, location = parse_birth_record(record)
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        return None, f"Invalid birth data: {str(e)}"
+    name = record.get('name') or f"User_{str(record.get('id', ''))[:8]}"
+    chart = compute_chart(name, year, month, day, hour, minute, city, nation, location=location)
+    if chart is None:
+        return None, 'Chart computation failed'
+    return chart.encode(), None
+
+
+def warm_worker():
+    # Importing Kerykeion and computing one chart loads the Swiss Ephemeris
+    # files so the first real record does not pay for it.
+    compute_record(WARMUP_RECORD)
+
+
+def compute_chunk(chunk):
+    return [(index, *compute_record(record)) for index, record in chunk]
+
+
+class ChartEngine:
+    """Computes charts in a pool of warm worker processes.
+
+    map_unordered streams (index, encoded chart, error) tuples in
+    completion order while keeping only a bounded number of chunks in flight,
+    so arbitrarily large imports run in constant memory.
+    """
+
+    def __init__(self, workers=None, chunk_size=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=warm_worker
+        )
+
+    def map_unordered(self, records):
+        max_in_flight = self.workers * 4
+        pending = set()
+        chunk = []
+
+        def drain():
+            nonlocal pending
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+        for index, record in enumerate(records):
+            chunk.append((index, record))
+            if len(chunk) < self.chunk_size:
+                continue
+            pending.add(self.executor.submit(compute_chunk, chunk))
+            chunk = []
+            while len(pending) >= max_in_flight:
+                yield from drain()
+
+        if chunk:
+            pending.add(self.executor.submit(compute_chunk, chunk))
+        while pending:
+            yield from drain()
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,205 @@
+"""Compact natal chart: one packed record per chart, text and JSON rendered on demand.
+
+A chart is stored as a short ASCII string ("c1:" + base64 of a fixed
+layout record): birth minute, float64 longitudes of the planets and North
+Node, the twelve house cusps (Ascendant and Midheaven are cusps 1 and 10),
+small-int house codes and a retrograde bitmask, followed by the name and
+city. Signs and in-sign degrees are derived from the longitudes. The
+prompt text and the chartVisual JSON are rendered from the record and kept
+in bounded LRUs, so stored users carry a few hundred bytes instead of
+several kilobytes of text and nested dicts.
+"""
+import base64
+import functools
+import os
+import struct
+
+from aspects import PLANET_BODIES, aspect_engine
+from metrics import time_stage
+from transits import HOUSE_NAMES, SIGNS
+
+PREFIX = 'c1:'
+BODIES = PLANET_BODIES + ('North Node',)
+RECORD = struct.Struct(f'<HBBBB{len(BODIES)}d12d{len(BODIES)}BH')
+RENDER_CACHE_SIZE = int(os.environ.get('CHART_RENDER_CACHE_SIZE', '4096'))
+
+SIGN_SYMBOLS = {
+    'Aries': '\u2648', 'Taurus': '\u2649', 'Gemini': '\u264a', 'Cancer': '\u264b',
+    'Leo': '\u264c', 'Virgo': '\u264d', 'Libra': '\u264e', 'Scorpio': '\u264f',
+    'Sagittarius': '\u2650', 'Capricorn': '\u2651', 'Aquarius': '\u2652', 'Pisces': '\u2653'
+}
+
+PLANET_SYMBOLS = {
+    'Sun': '\u2609', 'Moon': '\u263d', 'Mercury': '\u263f', 'Venus': '\u2640',
+    'Mars': '\u2642', 'Jupiter': '\u2643', 'Saturn': '\u2644', 'Uranus': '\u2645',
+    'Neptune': '\u2646', 'Pluto': '\u2647'
+}
+
+PLANET_MEANINGS = {
+    'Sun': 'Core identity & ego',
+    'Moon': 'Emotions & inner self',
+    'Mercury': 'Communication & thinking',
+    'Venus': 'Love & values',
+    'Mars': 'Drive & action',
+    'Jupiter': 'Growth & expansion',
+    'Saturn': 'Discipline & lessons',
+    'Uranus': 'Change & innovation',
+    'Neptune': 'Dreams & intuition',
+    'Pluto': 'Transformation & power'
+}
+
+
+def format_position(degrees):
+    d = int(degrees)
+    m = int((degrees - d) * 60)
+    return f"{d}°{m:02d}'"
+
+
+def sign_of(longitude):
+    return SIGNS[int(longitude // 30.0) % 12]
+
+
+class Chart:
+    """Decoded chart record. Instances may be shared through the caches and must not be mutated."""
+
+    __slots__ = ('name', 'city', 'birth', 'longitudes', 'cusps', 'houses', 'retrograde')
+
+    def __init__(self, name, city, birth, longitudes, cusps, houses, retrograde):
+        self.name = name
+        self.city = city
+        self.birth = tuple(birth)
+        self.longitudes = tuple(longitudes)
+        self.cusps = tuple(cusps)
+        self.houses = bytes(houses)
+        self.retrograde = retrograde
+
+    def renamed(self, name, city):
+        return Chart(name, city, self.birth, self.longitudes, self.cusps, self.houses, self.retrograde)
+
+    def encode(self):
+        record = RECORD.pack(*self.birth, *self.longitudes, *self.cusps, *self.houses, self.retrograde)
+        tail = f"{self.name}\0{self.city}".encode()
+        return PREFIX + base64.b64encode(record + tail).decode('ascii')
+
+    def natal(self):
+        """Longitudes and cusps in the form transits and synastry take."""
+        positions = {name: round(lon, 4) for name, lon in zip(PLANET_BODIES, self.longitudes)}
+        positions['Ascendant'] = round(self.cusps[0], 4)
+        positions['Medium_Coeli'] = round(self.cusps[9], 4)
+        return {'positions': positions, 'cusps': [round(c, 4) for c in self.cusps]}
+
+
+def is_encoded(value):
+    return isinstance(value, str) and value.startswith(PREFIX)
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def decode(encoded):
+    raw = base64.b64decode(encoded[len(PREFIX):])
+    fields = RECORD.unpack_from(raw)
+    count = len(BODIES)
+    name, city = raw[RECORD.size:].decode().split('\0', 1)
+    return Chart(name, city, fields[:5], fields[5:5 + count], fields[5 + count:17 + count],
+                 fields[17 + count:17 + 2 * count], fields[-1])
+
+
+def planet_rows(chart):
+    rows = []
+    for i, name in enumerate(PLANET_BODIES):
+        longitude = chart.longitudes[i]
+        sign = sign_of(longitude)
+        rows.append({
+            'name': name, 'sign': sign, 'position': format_position(longitude % 30.0),
+            'house': HOUSE_NAMES[chart.houses[i] - 1], 'retrograde': bool(chart.retrograde >> i & 1),
+            'symbol': PLANET_SYMBOLS.get(name, ''),
+            'sign_symbol': SIGN_SYMBOLS.get(sign, ''),
+            'meaning': PLANET_MEANINGS.get(name, '')
+        })
+    return rows
+
+
+def angle(longitude):
+    sign = sign_of(longitude)
+    return {'sign': sign, 'position': format_position(longitude % 30.0), 'symbol': SIGN_SYMBOLS.get(sign, '')}
+
+
+def chart_aspects(chart, planets):
+    with time_stage('aspects'):
+        found = aspect_engine.find(chart.longitudes[:len(PLANET_BODIES)], names=PLANET_BODIES)
+    houses = {p['name']: p['house'] for p in planets}
+    return [(a['p1'], a['aspect'].replace('_', ' '), a['p2'], a['orb'], houses[a['p1']], houses[a['p2']])
+            for a in found]
+
+
+def body_text(chart):
+    """Chart text without the name/location header."""
+    planets = planet_rows(chart)
+    node = chart.longitudes[len(PLANET_BODIES)]
+    ascendant, midheaven = angle(chart.cusps[0]), angle(chart.cusps[9])
+
+    lines = []
+    lines.append("PLANETARY PLACEMENTS:")
+    lines.append("")
+    for p in planets:
+        retro_str = ' Retrograde' if p['retrograde'] else ''
+        lines.append(f"{p['name']} in {p['sign']} ({p['position']}) in {p['house']} House{retro_str}")
+    lines.append(f"North Node in {sign_of(node)} ({format_position(node % 30.0)}) in "
+                 f"{HOUSE_NAMES[chart.houses[len(PLANET_BODIES)] - 1]} House")
+    lines.append("")
+    lines.append(f"Rising Sign / Ascendant: {ascendant['sign']} ({ascendant['position']})")
+    lines.append(f"Midheaven (MC): {midheaven['sign']} ({midheaven['position']}) — 10th House")
+    lines.append("")
+    lines.append("KEY ASPECTS:")
+    for p1, aspect, p2, orb, house1, house2 in chart_aspects(chart, planets)[:15]:
+        lines.append(f"- {p1} {aspect} {p2} ({house1} House / {house2} House), orb {orb:.1f}°")
+
+    house_groups = {}
+    for p in planets:
+        house_groups.setdefault(p['house'], []).append(p['name'])
+    stelliums = {h: ps for h, ps in house_groups.items() if len(ps) >= 3}
+    if stelliums:
+        lines.append("")
+        lines.append("HOUSE EMPHASIS:")
+        for h, ps in stelliums.items():
+            lines.append(f"- Stellium in {h} House ({', '.join(ps)}): Multiple planets concentrate energy here")
+        for h, ps in house_groups.items():
+            if len(ps) == 2:
+                lines.append(f"- {h} House ({', '.join(ps)}): Significant focus area")
+    return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def chart_text(encoded):
+    """Prompt text for an encoded chart."""
+    chart = decode(encoded)
+    year, month, day, hour, minute = chart.birth
+    return "\n".join([
+        f"BIRTH CHART FOR: {chart.name}",
+        f"Born: {month}/{day}/{year} at {hour:02d}:{minute:02d}",
+        f"Location: {chart.city}",
+        "",
+        body_text(chart)
+    ])
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def chart_json(encoded):
+    """chartVisual JSON for an encoded chart; shared between callers, treat as read-only."""
+    chart = decode(encoded)
+    planets = planet_rows(chart)
+    node = chart.longitudes[len(PLANET_BODIES)]
+    return {
+        'planets': planets,
+        'northNode': {'sign': sign_of(node), 'position': format_position(node % 30.0),
+                      'house': HOUSE_NAMES[chart.houses[len(PLANET_BODIES)] - 1]},
+        'ascendant': angle(chart.cusps[0]),
+        'midheaven': angle(chart.cusps[9]),
+        'aspects': [{'planet1': p1, 'planet2': p2, 'aspect': aspect, 'orb': round(orb, 1)}
+                    for p1, aspect, p2, orb, _, _ in chart_aspects(chart, planets)[:15]],
+        'natal': chart.natal()
+    }
+
+
+def render_stats():
+    return {name: fn.cache_info()._asdict() for name, fn in
+            (('decode', decode), ('text', chart_text), ('json', chart_json))}
@@ -0,0 +1,94 @@
+import functools
+import os
+
+from chart_cache import ChartCache, make_chart_key
+from chart_model import Chart, decode
+from geocoding import load_geocoder
+from log import log
+from metrics import time_stage
+
+PLANET_ATTRIBUTES = ('sun', 'moon', 'mercury', 'venus', 'mars', 'jupiter', 'saturn', 'uranus', 'neptune', 'pluto')
+
+HOUSE_ATTRIBUTES = ('first', 'second', 'third', 'fourth', 'fifth', 'sixth',
+                    'seventh', 'eighth', 'ninth', 'tenth', 'eleventh', 'twelfth')
+
+# Kerykeion house names ('First_House') to the 1-based codes Chart stores.
+HOUSE_INDEX = {f"{h.capitalize()}_House": i + 1 for i, h in enumerate(HOUSE_ATTRIBUTES)}
+
+
+# Kerykeion is imported on first use (or by warm_chart_stack) rather than here: its
+# import costs more than the rest of the app, and sample-chart users never need it.
+def compute_chart_body(year, month, day, hour, minute, lat, lng, tz_str):
+    """Name-independent chart record for a resolved birth moment."""
+    from kerykeion import AstrologicalSubject
+
+    with time_stage('ephemeris'):
+        subject = AstrologicalSubject("Chart", year, month, day, hour, minute, lng=lng, lat=lat, tz_str=tz_str,
+                                      online=False)
+
+    points = [getattr(subject, p) for p in PLANET_ATTRIBUTES] + [subject.true_north_lunar_node]
+    retrograde = 0
+    for i, p in enumerate(points[:len(PLANET_ATTRIBUTES)]):
+        if p.retrograde:
+            retrograde |= 1 << i
+
+    return Chart(
+        '', '', (year, month, day, hour, minute),
+        [p.abs_pos for p in points],
+        [getattr(subject, f"{h}_house").abs_pos for h in HOUSE_ATTRIBUTES],
+        [HOUSE_INDEX[p.house] for p in points],
+        retrograde
+    )
+
+
+def warm_chart_stack():
+    """Import Kerykeion and compute one chart, bypassing the cache, so the first user does not pay for it."""
+    compute_chart_body(2000, 1, 1, 12, 0, 51.4769, 0.0005, 'Europe/London')
+
+
+GEONAMES_USERNAME = os.environ.get('GEONAMES_USERNAME', 'century.boy')
+
+chart_cache = ChartCache(
+    max_entries=int(os.environ.get('CHART_CACHE_SIZE', '4096')),
+    disk_path=os.environ.get('CHART_CACHE_PATH') or None
+)
+
+
+geocoder = load_geocoder()
+
+
+@functools.lru_cache(maxsize=4096)
+def resolve_location(city, nation=''):
+    if geocoder is not None:
+        place = geocoder.lookup(city, nation)
+        if place:
+            return place['lat'], place['lng'], place['tz']
+        log.warning(f"City not in geocoding index, trying geonames: {city}")
+
+    from kerykeion.fetch_geonames import FetchGeonames
+
+    city_data = FetchGeonames(city, nation, username=GEONAMES_USERNAME).get_serialized_data()
+    if not all(k in city_data for k in ('lat', 'lng', 'timezonestr')):
+        raise ValueError(f"Could not resolve location: {city} {nation}".strip())
+    return round(float(city_data['lat']), 4), round(float(city_data['lng']), 4), city_data['timezonestr']
+
+
+def compute_chart(name, year, month, day, hour, minute, city, nation='', location=None):
+    try:
+        if location is None:
+            with time_stage('geocode'):
+                location = resolve_location(city.strip(), nation.strip())
+        lat, lng, tz_str = location
+
+        key = make_chart_key(year, month, day, hour, minute, lat, lng, tz_str)
+        encoded = chart_cache.get(key)
+        if encoded is None:
+            encoded = chart_cache.put(key, compute_chart_body(year, month, day, hour, minute, lat, lng, tz_str).encode())
+        chart = decode(encoded).renamed(name, city)
+
+        log.info(f"Chart computed successfully for {name}")
+        return chart
+
+    except Exception as e:
+        log.exception(f"Error computing chart: {str(e)}")
+        return None
@@ -0,0 +1,305 @@
+"""Bitmap index of chart placements for cohort queries.
+
+Every indexed user gets a dense ordinal, and every feature is a row of
+uint64 words with one bit per ordinal:
+
+    sign        a body (the planets, North Node, Ascendant, Midheaven) in a sign
+    house       a body (the planets, North Node) in a house
+    aspect      an aspect between two planets (aspects.DEFAULT_ASPECTS orbs)
+    stellium    three or more planets in one house, or in one sign
+    retrograde  a retrograde planet
+
+Queries are JSON trees of leaves combined with and/or/not; evaluating one
+is a handful of vectorized word operations, so cost grows with users / 64
+rather than with chart records. Rows are dense (users / 8 bytes each, about
+75 MB for the ~600 rows at a million users); at about one user in twelve
+per leaf, compressed bitmaps would save little.
+
+    {"and": [{"planet": "Moon", "sign": "Cancer"}, {"planet": "Moon", "house": 12}]}
+    {"or": [{"stellium": {"house": 12}}, {"not": {"retrograde": "Mercury"}}]}
+    {"aspect": "square", "planets": ["Sun", "Moon"]}      (omit "aspect" for any)
+"""
+import threading
+import time
+
+import numpy as np
+
+import chart_model
+from aspects import DEFAULT_ASPECTS, PLANET_BODIES, aspect_engine
+from log import log
+from transits import SIGNS
+
+SIGN_BODIES = chart_model.BODIES + ('Ascendant', 'Midheaven')
+HOUSE_BODIES = chart_model.BODIES
+ASPECT_NAMES = tuple(name for name, _, _ in DEFAULT_ASPECTS)
+PAIRS = [(i, j) for i in range(len(PLANET_BODIES)) for j in range(i + 1, len(PLANET_BODIES))]
+
+# Row layout: a presence row, then each feature family in a contiguous block.
+PRESENT = 0
+SIGN_ROWS = 1
+HOUSE_ROWS = SIGN_ROWS + len(SIGN_BODIES) * 12
+ASPECT_ROWS = HOUSE_ROWS + len(HOUSE_BODIES) * 12
+HOUSE_STELLIUM_ROWS = ASPECT_ROWS + len(PAIRS) * len(ASPECT_NAMES)
+SIGN_STELLIUM_ROWS = HOUSE_STELLIUM_ROWS + 12
+RETROGRADE_ROWS = SIGN_STELLIUM_ROWS + 12
+ROWS = RETROGRADE_ROWS + len(PLANET_BODIES)
+
+PAIR_INDEX = np.full((len(PLANET_BODIES), len(PLANET_BODIES)), -1, dtype=np.int64)
+PAIR_INDEX[tuple(np.array(PAIRS).T)] = PAIR_INDEX[tuple(np.array(PAIRS).T[::-1])] = np.arange(len(PAIRS))
+
+BODY_NAMES = {name.lower(): name for name in SIGN_BODIES}
+SIGN_NAMES = {name.lower(): i for i, name in enumerate(SIGNS)}
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+else:
+    POPCOUNT16 = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+
+    def popcount(words):
+        return int(POPCOUNT16[words.view(np.uint16)].sum(dtype=np.int64))
+
+
+def chart_features(charts):
+    """(chart positions, feature rows) arrays setting every feature of a list of decoded charts."""
+    n = len(charts)
+    longitudes = np.array([c.longitudes for c in charts], dtype=np.float64).reshape(n, len(chart_model.BODIES))
+    angles = np.array([(c.cusps[0], c.cusps[9]) for c in charts], dtype=np.float64).reshape(n, 2)
+    houses = np.frombuffer(b''.join(c.houses for c in charts), dtype=np.uint8).reshape(n, len(HOUSE_BODIES))
+    retrograde = np.array([c.retrograde for c in charts], dtype=np.int64)
+
+    signs = (np.concatenate([longitudes, angles], axis=1) // 30.0).astype(np.int64) % 12
+    planet_signs, planet_houses = signs[:, :len(PLANET_BODIES)], houses[:, :len(PLANET_BODIES)].astype(np.int64) - 1
+    chart_ids, rows = [], []
+
+    def add(ids, feature_rows):
+        chart_ids.append(np.asarray(ids, dtype=np.int64).ravel())
+        rows.append(np.asarray(feature_rows, dtype=np.int64).ravel())
+
+    everyone = np.arange(n)
+    add(everyone, np.full(n, PRESENT))
+    add(np.repeat(everyone, len(SIGN_BODIES)), SIGN_ROWS + np.arange(len(SIGN_BODIES)) * 12 + signs)
+    add(np.repeat(everyone, len(HOUSE_BODIES)),
+        HOUSE_ROWS + np.arange(len(HOUSE_BODIES)) * 12 + houses.astype(np.int64) - 1)
+
+    chart, i, j, kind, _ = aspect_engine.batch(longitudes[:, :len(PLANET_BODIES)])
+    add(chart, ASPECT_ROWS + PAIR_INDEX[i, j] * len(ASPECT_NAMES) + kind)
+
+    for base, groups in ((HOUSE_STELLIUM_ROWS, planet_houses), (SIGN_STELLIUM_ROWS, planet_signs)):
+        counts = np.zeros((n, 12), dtype=np.int64)
+        np.add.at(counts, (np.repeat(everyone, len(PLANET_BODIES)), groups.ravel()), 1)
+        chart, group = np.nonzero(counts >= 3)
+        add(chart, base + group)
+
+    chart, planet = np.nonzero((retrograde[:, None] >> np.arange(len(PLANET_BODIES))) & 1)
+    add(chart, RETROGRADE_ROWS + planet)
+    return np.concatenate(chart_ids), np.concatenate(rows)
+
+
+def body_name(value, allowed):
+    name = BODY_NAMES.get(str(value).lower())
+    if name not in allowed:
+        raise ValueError(f"Unknown body for this query: {value}")
+    return name
+
+
+def sign_index(value):
+    index = SIGN_NAMES.get(str(value).lower())
+    if index is None:
+        raise ValueError(f"Unknown sign: {value}")
+    return index
+
+
+def house_index(value):
+    try:
+        house = int(str(value).rstrip('stndrh'))
+    except ValueError:
+        house = 0
+    if not 1 <= house <= 12:
+        raise ValueError(f"Unknown house: {value}")
+    return house - 1
+
+
+def compile_query(query):
+    """Nested ('rows'|'and'|'or'|'not', ...) plan for a query tree; ValueError on anything malformed.
+
+    ('rows', mode, [row, ...]) is a leaf over one or more feature rows,
+    combined with mode 'and' or 'or'.
+    """
+    if not isinstance(query, dict) or not query:
+        raise ValueError('A query is a non-empty JSON object')
+    if 'and' in query or 'or' in query:
+        op = 'and' if 'and' in query else 'or'
+        parts = query[op]
+        if not isinstance(parts, list) or not parts:
+            raise ValueError(f"'{op}' takes a non-empty list")
+        return (op, [compile_query(part) for part in parts])
+    if 'not' in query:
+        return ('not', compile_query(query['not']))
+
+    if 'planet' in query:
+        if 'sign' not in query and 'house' not in query:
+            raise ValueError("A planet query needs 'sign' and/or 'house'")
+        rows = []
+        if 'sign' in query:
+            body = SIGN_BODIES.index(body_name(query['planet'], SIGN_BODIES))
+            rows.append(SIGN_ROWS + body * 12 + sign_index(query['sign']))
+        if 'house' in query:
+            body = HOUSE_BODIES.index(body_name(query['planet'], HOUSE_BODIES))
+            rows.append(HOUSE_ROWS + body * 12 + house_index(query['house']))
+        return ('rows', 'and', rows)
+
+    if 'planets' in query or 'aspect' in query:
+        planets = query.get('planets')
+        if not isinstance(planets, list) or len(planets) != 2:
+            raise ValueError("An aspect query needs 'planets': [two planets]")
+        i, j = (PLANET_BODIES.index(body_name(p, PLANET_BODIES)) for p in planets)
+        if i == j:
+            raise ValueError('An aspect needs two different planets')
+        base = ASPECT_ROWS + int(PAIR_INDEX[i, j]) * len(ASPECT_NAMES)
+        aspect = query.get('aspect')
+        if aspect is None:
+            return ('rows', 'or', [base + k for k in range(len(ASPECT_NAMES))])
+        if aspect not in ASPECT_NAMES:
+            raise ValueError(f"Unknown aspect: {aspect}")
+        return ('rows', 'and', [base + ASPECT_NAMES.index(aspect)])
+
+    if 'stellium' in query:
+        where = query['stellium']
+        if isinstance(where, dict) and 'house' in where:
+            return ('rows', 'and', [HOUSE_STELLIUM_ROWS + house_index(where['house'])])
+        if isinstance(where, dict) and 'sign' in where:
+            return ('rows', 'and', [SIGN_STELLIUM_ROWS + sign_index(where['sign'])])
+        raise ValueError("A stellium query is {'stellium': {'house': n}} or {'stellium': {'sign': name}}")
+
+    if 'retrograde' in query:
+        return ('rows', 'and', [RETROGRADE_ROWS + PLANET_BODIES.index(body_name(query['retrograde'], PLANET_BODIES))])
+
+    raise ValueError(f"Unknown query: {sorted(query)}")
+
+
+class PlacementIndex:
+    """Bit-array index of users' chart features, updated incrementally and queried with compiled plans.
+
+    Re-adding a user (a recomputed chart) clears their previous bits first.
+    Ordinals are never reused; removed users just leave a cleared column.
+    """
+
+    def __init__(self, capacity=4096):
+        self.bits = np.zeros((ROWS, max(1, capacity // 64)), dtype=np.uint64)
+        self.ordinals = {}
+        self.user_ids = []
+        self.synced_seq = 0
+        self.complete = False
+        self.lock = threading.Lock()
+
+    def grow(self, size):
+        words = self.bits.shape[1]
+        if size <= words * 64:
+            return
+        while words * 64 < size:
+            words *= 2
+        bits = np.zeros((ROWS, words), dtype=np.uint64)
+        bits[:, :self.bits.shape[1]] = self.bits
+        self.bits = bits
+
+    def add_many(self, entries):
+        """Index (user_id, encoded chart) pairs; returns how many were indexed."""
+        charts = [(user_id, chart_model.decode(chart)) for user_id, chart in entries if chart_model.is_encoded(chart)]
+        if not charts:
+            return 0
+        chart_ids, rows = chart_features([chart for _, chart in charts])
+        with self.lock:
+            ordinals = []
+            for user_id, _ in charts:
+                ordinal = self.ordinals.get(user_id)
+                if ordinal is None:
+                    ordinal = self.ordinals[user_id] = len(self.user_ids)
+                    self.user_ids.append(user_id)
+                else:
+                    self.clear(ordinal)
+                ordinals.append(ordinal)
+            self.grow(len(self.user_ids))
+            ordinals = np.array(ordinals, dtype=np.int64)[chart_ids]
+            np.bitwise_or.at(self.bits, (rows, ordinals >> 6),
+                             np.left_shift(np.uint64(1), (ordinals & 63).astype(np.uint64)))
+        return len(charts)
+
+    def add(self, user_id, chart):
+        return self.add_many([(user_id, chart)])
+
+    def clear(self, ordinal):
+        self.bits[:, ordinal >> 6] &= ~np.uint64(1 << (ordinal & 63))
+
+    def remove(self, user_id):
+        with self.lock:
+            ordinal = self.ordinals.get(user_id)
+            if ordinal is not None:
+                self.clear(ordinal)
+
+    def evaluate(self, plan, words):
+        op = plan[0]
+        if op == 'rows':
+            _, mode, rows = plan
+            selected = self.bits[rows, :words]
+            return np.bitwise_and.reduce(selected, axis=0) if mode == 'and' else np.bitwise_or.reduce(selected, axis=0)
+        if op == 'not':
+            return self.bits[PRESENT, :words] & ~self.evaluate(plan[1], words)
+        parts = [self.evaluate(part, words) for part in plan[1]]
+        result = parts[0].copy()
+        for part in parts[1:]:
+            if op == 'and':
+                result &= part
+            else:
+                result |= part
+        return result
+
+    def query(self, query, limit=0):
+        """(count, up to limit matching user ids in ordinal order) for a query tree."""
+        plan = compile_query(query)
+        with self.lock:
+            words = (len(self.user_ids) + 63) // 64
+            matches = self.evaluate(plan, words)
+            count = popcount(matches)
+            user_ids = []
+            if limit > 0 and count:
+                found = np.flatnonzero(np.unpackbits(matches.view(np.uint8), bitorder='little'))[:limit]
+                user_ids = [self.user_ids[i] for i in found.tolist()]
+        return count, user_ids
+
+    def sync(self, store, chunk_size=1024):
+        """Index users written to the store since the last sync (by other workers too, for SQLite)."""
+        indexed = 0
+        chunk = []
+        for seq, user_id, user in store.iter_users(after=self.synced_seq):
+            chunk.append((user_id, user.get('chart')))
+            self.synced_seq = seq
+            if len(chunk) >= chunk_size:
+                indexed += self.add_many(chunk)
+                chunk = []
+        if chunk:
+            indexed += self.add_many(chunk)
+        self.complete = True
+        return indexed
+
+    def stats(self):
+        with self.lock:
+            return {'users': popcount(self.bits[PRESENT, :(len(self.user_ids) + 63) // 64]),
+                    'ordinals': len(self.user_ids), 'rows': ROWS, 'bytes': self.bits.nbytes,
+                    'complete': self.complete}
+
+
+def keep_synced(index, store, interval, run=lambda fn, *args: fn(*args)):
+    """Thread body: a full sync, then one every interval seconds to pick up other workers' writes."""
+    started = time.perf_counter()
+    while True:
+        try:
+            indexed = run(index.sync, store)
+            if started is not None:
+                log.info(f"Cohort index built: {indexed} charts in {time.perf_counter() - started:.2f}s")
+                started = None
+        except Exception as e:
+            log.error(f"Cohort index sync failed: {str(e)}")
+        if interval <= 0:
+            return
+        time.sleep(interval)
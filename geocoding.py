@@ -0,0 +1,250 @@
+"""Offline city geocoder backed by a memory-mapped index built from a GeoNames dump.
+
+Build the index once from any GeoNames cities file (cities500.txt, cities15000.txt, ...):
+
+    python geocoding.py build cities15000.txt data/geonames.idx
+
+Index layout (little endian):
+    header   magic, version, record count, key count, timezone count, section offsets
+    records  one fixed-size struct per city (lat, lng, population, tz id, country, admin1)
+    keys     (string offset, length, record id) sorted by normalized name bytes
+    strings  normalized names and timezone names, utf-8
+"""
+import argparse
+import bisect
+import difflib
+import mmap
+import os
+import re
+import struct
+import unicodedata
+
+from log import log
+
+MAGIC = b'OGEO'
+VERSION = 1
+HEADER = struct.Struct('<4sHIII III')
+RECORD = struct.Struct('<ffIH2s4s')
+KEY = struct.Struct('<IHI')
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'geonames.idx')
+
+GEONAMES_COLUMNS = {
+    'name': 1, 'asciiname': 2, 'alternatenames': 3, 'lat': 4, 'lng': 5,
+    'feature_class': 6, 'country': 8, 'admin1': 10, 'population': 14, 'timezone': 17
+}
+
+
+def normalize_name(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", ' ', text.casefold())
+    return ' '.join(text.split())
+
+
+def build_index(source_path, index_path, include_alternate_names=False):
+    """Convert a GeoNames tab-separated dump into the binary index format."""
+    records = []
+    keys = {}
+    timezones = {}
+
+    with open(source_path, encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) <= GEONAMES_COLUMNS['timezone'] or cols[GEONAMES_COLUMNS['feature_class']] != 'P':
+                continue
+            tz = cols[GEONAMES_COLUMNS['timezone']]
+            if not tz:
+                continue
+            tz_id = timezones.setdefault(tz, len(timezones))
+            record_id = len(records)
+            records.append(RECORD.pack(
+                float(cols[GEONAMES_COLUMNS['lat']]),
+                float(cols[GEONAMES_COLUMNS['lng']]),
+                min(int(cols[GEONAMES_COLUMNS['population']] or 0), 0xFFFFFFFF),
+                tz_id,
+                cols[GEONAMES_COLUMNS['country']].encode('ascii', 'ignore')[:2],
+                cols[GEONAMES_COLUMNS['admin1']].encode('ascii', 'ignore')[:4]
+            ))
+
+            names = {cols[GEONAMES_COLUMNS['name']], cols[GEONAMES_COLUMNS['asciiname']]}
+            if include_alternate_names:
+                names.update(n for n in cols[GEONAMES_COLUMNS['alternatenames']].split(',') if n)
+            for name in names:
+                key = normalize_name(name)
+                if key:
+                    keys.setdefault(key.encode(), []).append(record_id)
+
+    strings = bytearray()
+    key_entries = []
+    for key in sorted(keys):
+        offset = len(strings)
+        strings += key
+        for record_id in keys[key]:
+            key_entries.append(KEY.pack(offset, len(key), record_id))
+
+    tz_offsets = []
+    for tz in sorted(timezones, key=timezones.get):
+        encoded = tz.encode()
+        tz_offsets.append(KEY.pack(len(strings), len(encoded), 0))
+        strings += encoded
+
+    records_offset = HEADER.size
+    keys_offset = records_offset + len(records) * RECORD.size
+    tz_offset = keys_offset + len(key_entries) * KEY.size
+    strings_offset = tz_offset + len(tz_offsets) * KEY.size
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    with open(index_path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(records), len(key_entries), len(timezones),
+                              keys_offset, tz_offset, strings_offset))
+        out.writelines(records)
+        out.writelines(key_entries)
+        out.writelines(tz_offsets)
+        out.write(strings)
+
+    return len(records), len(key_entries)
+
+
+class Geocoder:
+    """Exact, prefix and fuzzy city lookups against a memory-mapped index."""
+
+    def __init__(self, index_path):
+        self.file = open(index_path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.record_count, self.key_count, tz_count,
+         self.keys_offset, tz_offset, self.strings_offset) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported geocoding index: {index_path}")
+
+        self.timezones = []
+        for i in range(tz_count):
+            offset, length, _ = KEY.unpack_from(self.data, tz_offset + i * KEY.size)
+            start = self.strings_offset + offset
+            self.timezones.append(self.data[start:start + length].decode())
+
+        self.keys = KeyView(self)
+
+    def key_entry(self, i):
+        offset, length, record_id = KEY.unpack_from(self.data, self.keys_offset + i * KEY.size)
+        start = self.strings_offset + offset
+        return self.data[start:start + length], record_id
+
+    def record(self, record_id):
+        lat, lng, population, tz_id, country, admin1 = RECORD.unpack_from(
+            self.data, HEADER.size + record_id * RECORD.size
+        )
+        return {
+            'lat': round(lat, 4), 'lng': round(lng, 4), 'tz': self.timezones[tz_id],
+            'population': population,
+            'country': country.rstrip(b'\0').decode(),
+            'admin1': admin1.rstrip(b'\0').decode()
+        }
+
+    def key_range(self, prefix):
+        encoded = prefix.encode()
+        lo = bisect.bisect_left(self.keys, encoded)
+        hi = bisect.bisect_left(self.keys, encoded + b'\xff', lo)
+        return lo, hi
+
+    def candidates(self, lo, hi, limit=None):
+        seen = {}
+        for i in range(lo, hi):
+            key, record_id = self.key_entry(i)
+            if record_id not in seen:
+                seen[record_id] = key.decode()
+            if limit and len(seen) >= limit:
+                break
+        return seen
+
+    def exact(self, name):
+        key = normalize_name(name).encode()
+        lo = bisect.bisect_left(self.keys, key)
+        record_ids = []
+        for i in range(lo, self.key_count):
+            k, record_id = self.key_entry(i)
+            if k != key:
+                break
+            record_ids.append(record_id)
+        return record_ids
+
+    def prefix(self, text, limit=10):
+        lo, hi = self.key_range(normalize_name(text))
+        matches = [self.record(r) | {'name': k} for r, k in self.candidates(lo, hi, limit=500).items()]
+        matches.sort(key=lambda m: -m['population'])
+        return matches[:limit]
+
+    def fuzzy(self, name, cutoff=0.8):
+        key = normalize_name(name)
+        if len(key) < 2:
+            return []
+        lo, hi = self.key_range(key[:2])
+        by_name = {}
+        for i in range(lo, hi):
+            k, record_id = self.key_entry(i)
+            by_name.setdefault(k.decode(), []).append(record_id)
+        close = difflib.get_close_matches(key, by_name, n=5, cutoff=cutoff)
+        return [record_id for k in close for record_id in by_name[k]]
+
+    def lookup(self, city, nation=''):
+        """Best match for free text like "Paris", "Austin, TX" or "Sao Paulo, BR"."""
+        parts = [p.strip() for p in city.split(',') if p.strip()]
+        if not parts:
+            return None
+        qualifiers = {normalize_name(q).upper() for q in parts[1:] + [nation] if q}
+
+        record_ids = self.exact(parts[0]) or self.fuzzy(parts[0])
+        if not record_ids:
+            return None
+
+        def rank(record):
+            qualified = record['country'] in qualifiers or record['admin1'] in qualifiers
+            return (qualified, record['population'])
+
+        return max((self.record(r) for r in record_ids), key=rank)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class KeyView:
+    """Sequence of index keys so bisect can search the mmap directly."""
+
+    def __init__(self, geocoder):
+        self.geocoder = geocoder
+
+    def __len__(self):
+        return self.geocoder.key_count
+
+    def __getitem__(self, i):
+        return self.geocoder.key_entry(i)[0]
+
+
+def load_geocoder(index_path=None):
+    index_path = index_path or os.environ.get('GEOCODING_INDEX', DEFAULT_INDEX_PATH)
+    if not os.path.exists(index_path):
+        log.warning(f"Geocoding index not found at {index_path}, using online lookups")
+        return None
+    geocoder = Geocoder(index_path)
+    log.info(f"Geocoding index loaded: {geocoder.record_count} places")
+    return geocoder
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build an index from a GeoNames dump')
+    build.add_argument('source')
+    build.add_argument('index', nargs='?', default=DEFAULT_INDEX_PATH)
+    build.add_argument('--alternate-names', action='store_true', help='also index alternate names')
+    lookup = commands.add_parser('lookup', help='resolve a city name')
+    lookup.add_argument('city')
+    lookup.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count, key_count = build_index(args.source, args.index, include_alternate_names=args.alternate_names)
+        print(f"Wrote {args.index}: {count} places, {key_count} name keys")
+    else:
+        print(Geocoder(args.index).lookup(args.city))
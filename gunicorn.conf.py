@@ -0,0 +1,34 @@
+import os
+
+# Async serving mode: `gunicorn app:app`
+# gevent workers make the MiniMax calls cooperative, so a single worker can hold
+# hundreds of slow chats open while /health and other routes keep answering.
+# Users, conversations and chart jobs live in the SQLite store (the default
+# STORE_BACKEND), which every worker shares, so GUNICORN_WORKERS can go above 1.
+# STORE_BACKEND=memory needs a single worker. Rate limits and turn locks are
+# per worker unless RATE_LIMIT_BACKEND=sqlite, and LLM_MAX_INFLIGHT applies
+# to each worker separately.
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '2000'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '180'))
+keepalive = 5
+
+# Prefork chart stack: GUNICORN_PRELOAD_CHARTS=1 imports Kerykeion and builds the
+# transit table once in the master, and workers inherit both copy-on-write.
+# Only the chart stack is preloaded: the app itself (store, job queue and
+# their threads) is still imported in each worker after the fork.
+preload_charts = os.environ.get('GUNICORN_PRELOAD_CHARTS') == '1'
+
+if preload_charts and worker_class == 'gevent':
+    # Kerykeion imports ssl and requests, which gevent must patch before they
+    # load; the workers would otherwise patch them too late.
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def on_starting(server):
+    if preload_charts:
+        import warmup
+        warmup.preload(int(os.environ.get('TRANSIT_LOOKAHEAD_DAYS', '180')))
@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from log import log
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    # BPE tokenizers average roughly four bytes of English per token; good
+    # enough for budgeting without shipping the provider's tokenizer.
+    return len(text.encode('utf-8')) // 4 + 1
+
+
+def count_message_tokens(messages):
+    return sum(estimate_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def extractive_summary(previous_summary, messages, max_questions=12):
+    """Cheap summary used when the model is unavailable: the questions asked so far."""
+    questions = [m['content'].strip().replace('\n', ' ')[:160] for m in messages if m['role'] == 'user']
+    lines = [previous_summary] if previous_summary else []
+    if questions:
+        lines.append("Earlier the user asked: " + "; ".join(questions[-max_questions:]))
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """Fits conversation history into a token budget.
+
+    The last keep_turns user/assistant turns are sent verbatim (fewer if they
+    alone exceed the budget). Everything older is folded into a per-user
+    running summary that is refreshed on a background thread, so the request
+    path only ever reads the latest finished summary. Older turns the summary
+    does not cover yet go in as an extractive summary until the refresh
+    lands, and only messages after the summary are loaded.
+    """
+
+    def __init__(self, summarize, token_budget=6000, keep_turns=3, max_summaries=10000, workers=2):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.max_summaries = max_summaries
+        self.summaries = OrderedDict()
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='history-summary')
+
+    def prepare(self, user_id, load):
+        """Return (messages to send, token stats); load(after) returns the stored messages with ids above after."""
+        with self.lock:
+            cached = self.summaries.get(user_id)
+            if cached is not None:
+                self.summaries.move_to_end(user_id)
+        messages = load(cached[0] if cached else 0)
+        split = max(0, len(messages) - self.keep_turns * 2)
+        while split < len(messages) - 2 and count_message_tokens(messages[split:]) > self.token_budget:
+            split += 2
+        older, recent = messages[:split], messages[split:]
+
+        summary = cached[1] if cached else None
+        if older:
+            self.schedule(user_id, older, cached)
+            summary = extractive_summary(summary, older)
+
+        prepared = []
+        if summary:
+            prepared.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        prepared.extend({"role": m['role'], "content": m['content']} for m in recent)
+
+        return prepared, {
+            'historyTokens': count_message_tokens(prepared),
+            'loadedMessages': len(messages),
+            'verbatimMessages': len(recent),
+            'unsummarizedMessages': len(older)
+        }
+
+    def schedule(self, user_id, older, cached):
+        with self.lock:
+            if user_id in self.in_flight:
+                return
+            self.in_flight.add(user_id)
+
+        covered_id = cached[0] if cached else 0
+        previous = cached[1] if cached else None
+        pending = [m for m in older if m['id'] > covered_id]
+        self.executor.submit(self.refresh, user_id, previous, pending, older[-1]['id'])
+
+    def refresh(self, user_id, previous, pending, covered_id):
+        try:
+            summary = self.summarize(previous, pending) or extractive_summary(previous, pending)
+            with self.lock:
+                self.summaries[user_id] = (covered_id, summary)
+                self.summaries.move_to_end(user_id)
+                while len(self.summaries) > self.max_summaries:
+                    self.summaries.popitem(last=False)
+            log.info(f"Conversation summary refreshed for {user_id[:8]}: {len(pending)} messages folded")
+        except Exception as e:
+            log.error(f"Error summarizing conversation: {str(e)}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(user_id)
+
+    def stats(self):
+        with self.lock:
+            return {'summaries': len(self.summaries), 'refreshing': len(self.in_flight)}
@@ -0,0 +1,183 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from log import log
+
+
+class JobQueue:
+    """Persistent work queue in SQLite, drained by a few local worker threads.
+
+    Jobs survive restarts: anything still pending, or claimed by a worker
+    whose lease ran out, is picked up again. Several processes can share one
+    queue file; a job is claimed inside an immediate transaction so only one
+    worker runs it. handler(kind, payload) returns a JSON-serializable result
+    or raises, in which case the job is retried up to max_attempts times;
+    on_failed(kind, payload, error) is then called once the last attempt fails.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, job_key TEXT NOT NULL, '
+        'payload TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, '
+        'result TEXT, error TEXT, lease_until REAL NOT NULL DEFAULT 0, '
+        'created_at TEXT NOT NULL, updated_at TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)',
+        'CREATE INDEX IF NOT EXISTS jobs_key ON jobs (job_key, id)',
+    )
+
+    def __init__(self, path, handler, workers=2, max_attempts=3, lease=300.0, poll_interval=1.0, on_failed=None):
+        self.path = path
+        self.handler = handler
+        self.on_failed = on_failed
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.local = threading.local()
+        self.changed = threading.Condition()
+        self.processed = 0
+
+        db = self.connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        for statement in self.SCHEMA:
+            db.execute(statement)
+        db.commit()
+
+        self.workers = [
+            threading.Thread(target=self.work_loop, name=f'job-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def enqueue(self, kind, job_key, payload):
+        now = datetime.now().isoformat()
+        cursor = self.connect().execute(
+            'INSERT INTO jobs (kind, job_key, payload, status, created_at, updated_at) '
+            "VALUES (?, ?, ?, 'pending', ?, ?)",
+            (kind, job_key, json.dumps(payload), now, now)
+        )
+        self.notify()
+        return cursor.lastrowid
+
+    def notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def claim(self):
+        db = self.connect()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                "SELECT id, kind, payload, attempts FROM jobs WHERE status = 'pending' "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY id LIMIT 1", (now,)
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                    'WHERE id = ?', (now + self.lease, datetime.now().isoformat(), row[0])
+                )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return {'id': row[0], 'kind': row[1], 'payload': json.loads(row[2]), 'attempts': row[3] + 1}
+
+    def finish(self, job, result=None, error=None):
+        if error is None:
+            status = 'done'
+        elif job['attempts'] < self.max_attempts:
+            status = 'pending'
+        else:
+            status = 'failed'
+        self.connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = 0, updated_at = ? WHERE id = ?',
+            (status, json.dumps(result) if result is not None else None, error,
+             datetime.now().isoformat(), job['id'])
+        )
+        return status
+
+    def work_loop(self):
+        while True:
+            try:
+                job = self.claim()
+            except Exception as e:
+                log.error(f"Job queue claim failed: {str(e)}")
+                job = None
+
+            if job is None:
+                with self.changed:
+                    self.changed.wait(self.poll_interval)
+                continue
+
+            started = time.monotonic()
+            try:
+                result = self.handler(job['kind'], job['payload'])
+                status = self.finish(job, result=result)
+                self.processed += 1
+            except Exception as e:
+                status = self.finish(job, error=str(e))
+                if status == 'failed' and self.on_failed is not None:
+                    try:
+                        self.on_failed(job['kind'], job['payload'], str(e))
+                    except Exception as callback_error:
+                        log.error(f"Job {job['id']} failure handler failed: {str(callback_error)}")
+            log.info(f"Job {job['id']} ({job['kind']}) {status} in {time.monotonic() - started:.2f}s")
+            self.notify()
+
+    def latest(self, job_key):
+        row = self.connect().execute(
+            'SELECT id, kind, status, attempts, result, error, created_at, updated_at FROM jobs '
+            'WHERE job_key = ? ORDER BY id DESC LIMIT 1', (job_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0], 'kind': row[1], 'status': row[2], 'attempts': row[3],
+            'result': json.loads(row[4]) if row[4] else None, 'error': row[5],
+            'createdAt': row[6], 'updatedAt': row[7]
+        }
+
+    def wait(self, job_key, timeout):
+        """Block until the key's latest job is done or failed, or timeout expires.
+
+        Completions in this process wake waiters immediately; jobs finished by
+        another process are noticed within poll_interval.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.latest(job_key)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in ('done', 'failed') or remaining <= 0:
+                return job
+            with self.changed:
+                self.changed.wait(min(remaining, self.poll_interval))
+
+    def depth(self):
+        return self.connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+        ).fetchone()[0]
+
+    def stats(self):
+        counts = dict(self.connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {
+            'pending': counts.get('pending', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'workers': len(self.workers),
+            'processedHere': self.processed
+        }
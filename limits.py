@@ -0,0 +1,313 @@
+"""Rate limits, per-user turn serialization and upstream admission control.
+
+Token buckets and turn locks live in process memory, or in SQLite when
+several workers must share them (RATE_LIMIT_BACKEND=sqlite). Admission
+control is per process, like the upstream connection pool it protects.
+Every refusal raises RateLimited, which the app turns into a 429 with a
+Retry-After hint.
+"""
+import math
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class RateLimited(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class MemoryBuckets:
+    """Token buckets in a dict; buckets that have refilled are pruned as the dict grows."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take one token; returns 0 when allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (burst, now, now))
+            tokens = refill(tokens, updated, now, rate, burst)
+            wait = 0.0 if tokens >= 1.0 else (1.0 - tokens) / rate
+            if wait == 0.0:
+                tokens -= 1.0
+            self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(self.buckets) > self.max_keys:
+                self.prune(now)
+            return wait
+
+    def prune(self, now):
+        for key in [k for k, (_, _, full_at) in self.buckets.items() if full_at <= now]:
+            del self.buckets[key]
+
+    def stats(self):
+        return {'backend': 'memory', 'keys': len(self.buckets)}
+
+
+class MemoryTurnLocks:
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key, timeout, lease):
+        with self.lock:
+            entry = self.locks.get(key)
+            if entry is None:
+                entry = self.locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        if entry[0].acquire(timeout=timeout):
+            return entry
+        self.forget(key, entry)
+        return None
+
+    def release(self, key, token):
+        token[0].release()
+        self.forget(key, token)
+
+    def forget(self, key, entry):
+        with self.lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[key]
+
+    def stats(self):
+        return {'held': len(self.locks)}
+
+
+class SQLiteLimits:
+    """Buckets and turn leases shared by every worker on the host through one SQLite file."""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS rate_buckets ('
+        'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS turn_locks (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)',
+    )
+
+    def __init__(self, path, poll_interval=0.05, prune_every=1000):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.prune_every = prune_every
+        self.takes = 0
+        self.local = threading.local()
+        db = self.connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        for statement in self.SCHEMA:
+            db.execute(statement)
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def take(self, key, rate, burst):
+        # Wall clock, since the rows are shared between processes.
+        now = time.time()
+        db = self.connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = refill(row[0], row[1], now, rate, burst) if row else burst
+            wait = 0.0 if tokens >= 1.0 else (1.0 - tokens) / rate
+            if wait == 0.0:
+                tokens -= 1.0
+            db.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                       (key, tokens, now, now + (burst - tokens) / rate))
+            self.takes += 1
+            if self.takes % self.prune_every == 0:
+                db.execute('DELETE FROM rate_buckets WHERE full_at <= ?', (now,))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire(self, key, timeout, lease):
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        db = self.connect()
+        while True:
+            now = time.time()
+            cursor = db.execute(
+                'INSERT INTO turn_locks (key, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires '
+                'WHERE turn_locks.expires < ?', (key, owner, now + lease, now)
+            )
+            if cursor.rowcount == 1:
+                return owner
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def release(self, key, token):
+        self.connect().execute('DELETE FROM turn_locks WHERE key = ? AND owner = ?', (key, token))
+
+    def stats(self):
+        db = self.connect()
+        return {
+            'backend': 'sqlite',
+            'keys': db.execute('SELECT COUNT(*) FROM rate_buckets').fetchone()[0],
+            'held': db.execute('SELECT COUNT(*) FROM turn_locks WHERE expires >= ?', (time.time(),)).fetchone()[0]
+        }
+
+
+class RateLimiter:
+    """Token bucket per key: rate_per_minute sustained, burst requests at once."""
+
+    def __init__(self, buckets, name, rate_per_minute, burst):
+        self.buckets = buckets
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = float(burst)
+        self.rejected = 0
+
+    def check(self, key):
+        if self.rate <= 0:
+            return
+        wait = self.buckets.take(f"{self.name}:{key}", self.rate, self.burst)
+        if wait > 0:
+            self.rejected += 1
+            raise RateLimited(f"{self.name}_rate", wait)
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: the first runs fn, the rest wait for its result."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Returns (result, shared); shared is True for callers that joined a call already running."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result'], True
+
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+        return call['result'], False
+
+
+class TurnGate:
+    """One chat turn at a time per user, so history appends keep their order."""
+
+    def __init__(self, locks, wait, lease):
+        self.locks = locks
+        self.wait = wait
+        self.lease = lease
+        self.rejected = 0
+
+    def acquire(self, user_id, retry_after):
+        token = self.locks.acquire(f"turn:{user_id}", self.wait, self.lease)
+        if token is None:
+            self.rejected += 1
+            raise RateLimited('turn_in_progress', retry_after)
+        return token
+
+    def release(self, user_id, token):
+        self.locks.release(f"turn:{user_id}", token)
+
+
+class AdmissionController:
+    """Bounds upstream calls: max_inflight run, up to max_queue wait for a slot, the rest are shed.
+
+    acquire() takes the queue place and the slot in one call, and raises
+    RateLimited both when the queue is full and when the wait for a slot
+    times out. retry_after estimates how long the queue ahead takes to drain
+    from an EWMA of recent call durations.
+    """
+
+    def __init__(self, max_inflight, max_queue, queue_timeout, gauge=None, initial_seconds=10.0):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.gauge = gauge
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.avg_seconds = initial_seconds
+        self.shed = 0
+
+    def retry_after(self):
+        return self.avg_seconds * (self.waiting + 1) / self.max_inflight
+
+    def acquire(self):
+        with self.lock:
+            if self.running + self.waiting >= self.max_inflight + self.max_queue:
+                self.shed += 1
+                raise RateLimited('upstream_saturated', self.retry_after())
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=self.queue_timeout)
+        with self.lock:
+            self.waiting -= 1
+            if acquired:
+                self.running += 1
+            else:
+                self.shed += 1
+                retry_after = self.retry_after()
+        if not acquired:
+            raise RateLimited('upstream_saturated', retry_after)
+        if self.gauge is not None:
+            self.gauge.inc()
+
+    def try_acquire(self):
+        """Take a slot only if one is free now and no call is queued for it; never waits."""
+        with self.lock:
+            acquired = not self.waiting and self.slots.acquire(blocking=False)
+            if acquired:
+                self.running += 1
+        if acquired and self.gauge is not None:
+            self.gauge.inc()
+        return acquired
+
+    def release(self, seconds):
+        with self.lock:
+            self.running -= 1
+            self.avg_seconds += 0.2 * (seconds - self.avg_seconds)
+        if self.gauge is not None:
+            self.gauge.dec()
+        self.slots.release()
+
+    def stats(self):
+        return {'running': self.running, 'waiting': self.waiting, 'maxInflight': self.max_inflight,
+                'maxQueue': self.max_queue, 'avgSeconds': round(self.avg_seconds, 2), 'shed': self.shed}
+
+
+def open_limits(backend, path):
+    """(bucket store, turn lock store) for RATE_LIMIT_BACKEND."""
+    if backend == 'memory':
+        return MemoryBuckets(), MemoryTurnLocks()
+    if backend == 'sqlite':
+        shared = SQLiteLimits(path)
+        return shared, shared
+    raise ValueError(f"Unknown rate limit backend: {backend}")
@@ -0,0 +1,334 @@
+"""Latency-aware routing and hedged requests over OpenAI-compatible chat backends.
+
+Each Backend has its own pooled MiniMaxClient and circuit breaker, and
+tracks an EWMA of time to first streamed event, an EWMA error rate and a
+window of recent first-event times. A request goes to the available
+backend with the lowest expected latency (a backend with no samples yet is
+tried first). A streamed request that has produced nothing by the
+backend's p95 fires one hedge at the next best backend, or the same one
+when it is the only one available. The first attempt to produce data wins
+and the others are closed, which stops their generation upstream. Hedges
+are capped at max_hedge_ratio of requests, so average token spend grows by
+at most that share. With an admission controller, a hedge also holds an
+upstream slot of its own until it finishes or is cancelled, and is skipped
+when none is free. An attempt that fails before its first event fails
+over to an untried backend.
+
+    LLM_BACKENDS='[{"name": "minimax", "url": "https://api.minimax.io/v1/chat/completions",
+                    "model": "MiniMax-M2.1", "apiKeyEnv": "MINIMAX_API_KEY"}, ...]'
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from log import log
+from minimax_client import UpstreamError, UpstreamStatusError
+
+# Score of a backend that has only failed, per unit of error rate.
+UNPROVEN_FAILURE_SECONDS = 60.0
+
+
+class Backend:
+    def __init__(self, name, url, model, client, api_key_env='MINIMAX_API_KEY', alpha=0.2, window=200):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.client = client
+        self.api_key_env = api_key_env
+        self.alpha = alpha
+        self.first_event_ewma = None
+        self.error_ewma = 0.0
+        self.first_events = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {os.environ.get(self.api_key_env)}",
+            "Content-Type": "application/json"
+        }
+
+    def observe(self, seconds, failed=False):
+        """Record a first-event time (a lower bound for a cancelled attempt) and whether the attempt failed."""
+        with self.lock:
+            self.error_ewma += self.alpha * (float(failed) - self.error_ewma)
+            if seconds is not None:
+                self.first_events.append(seconds)
+                if self.first_event_ewma is None:
+                    self.first_event_ewma = seconds
+                else:
+                    self.first_event_ewma += self.alpha * (seconds - self.first_event_ewma)
+
+    def score(self):
+        """Expected seconds to a first event: the EWMA, inflated by the error rate.
+
+        A backend with no samples scores 0 so it gets tried, unless all it has
+        done so far is fail.
+        """
+        with self.lock:
+            if self.first_event_ewma is None:
+                return UNPROVEN_FAILURE_SECONDS * self.error_ewma
+            return self.first_event_ewma / max(0.05, 1.0 - self.error_ewma)
+
+    def percentile(self, pct, min_samples):
+        with self.lock:
+            if len(self.first_events) < min_samples:
+                return None
+            ordered = sorted(self.first_events)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def stats(self):
+        with self.lock:
+            ewma, errors, samples = self.first_event_ewma, self.error_ewma, len(self.first_events)
+        return {'model': self.model, 'firstEventEwma': ewma, 'errorRate': round(errors, 4), 'samples': samples,
+                'p95': self.percentile(95, 1), **self.client.stats()}
+
+
+class Attempt:
+    def __init__(self, backend, body, role):
+        self.backend = backend
+        self.body = body
+        self.role = role
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        self.response = None
+        self.finished = False
+
+    def cancel(self):
+        self.cancelled.set()
+        response = self.response
+        if response is not None:
+            # Closing the connection is what stops the backend generating.
+            response.close()
+
+
+class HedgedStream:
+    """Iterates the SSE data payloads of whichever attempt produces data first.
+
+    backend and ttfb describe the winning attempt once the first payload
+    has been yielded. close() (or abandoning the iterator) cancels every
+    attempt still running.
+    """
+
+    def __init__(self, router, build_body, hedge):
+        self.router = router
+        self.build_body = build_body
+        self.hedge = hedge
+        self.events = queue.Queue()
+        self.attempts = []
+        self.backend = None
+        self.ttfb = None
+
+    def start(self, backend, role):
+        attempt = Attempt(backend, self.build_body(backend), role)
+        self.attempts.append(attempt)
+        threading.Thread(target=self.run, args=(attempt,), name=f'llm-{backend.name}', daemon=True).start()
+        return attempt
+
+    def run(self, attempt):
+        try:
+            self.receive(attempt)
+        finally:
+            if attempt.role == 'hedge':
+                self.router.release_hedge(time.monotonic() - attempt.started)
+
+    def receive(self, attempt):
+        try:
+            response = attempt.backend.client.post(attempt.body, attempt.backend.headers(), stream=True)
+        except Exception as e:
+            self.events.put((attempt, 'error', e))
+            return
+        attempt.response = response
+        if attempt.cancelled.is_set():
+            response.close()
+            return
+        if response.status_code != 200:
+            self.events.put((attempt, 'status', UpstreamStatusError(response.status_code, response.text)))
+            response.close()
+            return
+        try:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if attempt.cancelled.is_set():
+                        return
+                    if line and line.startswith('data:'):
+                        self.events.put((attempt, 'data', line[len('data:'):].strip()))
+        except Exception as e:
+            if not attempt.cancelled.is_set():
+                self.events.put((attempt, 'error', e))
+            return
+        self.events.put((attempt, 'end', None))
+
+    def __iter__(self):
+        try:
+            yield from self.relay()
+        finally:
+            self.close()
+
+    def relay(self):
+        router = self.router
+        primary = router.select()
+        if primary is None:
+            raise UpstreamError('Every LLM backend circuit breaker is open')
+        router.count('requests')
+        self.start(primary, 'primary')
+        live = 1
+        deadline = time.monotonic() + router.hedge_delay(primary) if self.hedge and router.hedging else None
+        winner = None
+        failure = None
+
+        while winner is None:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                attempt, kind, value = self.events.get(timeout=timeout)
+            except queue.Empty:
+                deadline = None
+                tried = {a.backend for a in self.attempts}
+                backend = router.select(exclude=tried) or router.select()
+                if backend is not None and router.take_hedge():
+                    self.start(backend, 'hedge')
+                    live += 1
+                    log.info(f"Hedging LLM request on {backend.name} after {router.hedge_delay(primary):.2f}s")
+                continue
+
+            elapsed = time.monotonic() - attempt.started
+            if kind == 'data':
+                winner = attempt
+                attempt.backend.observe(elapsed)
+                for other in self.attempts:
+                    if other is not attempt and not other.finished:
+                        other.cancel()
+                        other.backend.observe(time.monotonic() - other.started)
+                if attempt.role == 'hedge':
+                    router.count('hedgesWon')
+                self.backend = attempt.backend
+                self.ttfb = attempt.response.elapsed.total_seconds()
+                yield value
+                break
+
+            attempt.finished = True
+            attempt.backend.observe(None, failed=True)
+            failure = None if kind == 'end' else value
+            live -= 1
+            if live:
+                continue
+            tried = {a.backend for a in self.attempts}
+            backend = router.select(exclude=tried)
+            if backend is None:
+                if failure is not None:
+                    raise failure
+                return
+            log.warning(f"LLM backend {attempt.backend.name} failed before its first event, trying {backend.name}")
+            router.count('failovers')
+            self.start(backend, 'failover')
+            live = 1
+
+        while True:
+            attempt, kind, value = self.events.get()
+            if attempt is not winner:
+                continue
+            if kind == 'data':
+                yield value
+            elif kind == 'end':
+                return
+            else:
+                raise value
+
+    def close(self):
+        for attempt in self.attempts:
+            attempt.cancel()
+
+
+class Router:
+    def __init__(self, backends, hedging=True, hedge_percentile=95.0, initial_hedge_delay=10.0,
+                 min_hedge_delay=0.25, max_hedge_delay=60.0, min_samples=20, max_hedge_ratio=0.1,
+                 admission=None):
+        self.backends = backends
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.admission = admission
+        self.counters = {'requests': 0, 'hedges': 0, 'hedgesSkipped': 0, 'hedgesWon': 0, 'failovers': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def select(self, exclude=()):
+        """The available backend with the lowest score, in configured order on ties; None if all are down."""
+        candidates = [b for b in self.backends if b not in exclude and b.client.breaker.available()]
+        return min(candidates, key=Backend.score) if candidates else None
+
+    def hedge_delay(self, backend):
+        delay = backend.percentile(self.hedge_percentile, self.min_samples)
+        if delay is None:
+            return self.initial_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, delay))
+
+    def take_hedge(self):
+        """Whether a hedge may fire: under max_hedge_ratio, and holding a free admission slot if any."""
+        with self.lock:
+            if self.counters['hedges'] + 1 > self.max_hedge_ratio * self.counters['requests'] or \
+                    (self.admission is not None and not self.admission.try_acquire()):
+                self.counters['hedgesSkipped'] += 1
+                return False
+            self.counters['hedges'] += 1
+            return True
+
+    def release_hedge(self, seconds):
+        if self.admission is not None:
+            self.admission.release(seconds)
+
+    def stream(self, build_body, hedge=True):
+        """HedgedStream of SSE data payloads; build_body(backend) returns the streaming request body."""
+        return HedgedStream(self, build_body, hedge)
+
+    def post(self, build_body):
+        """Non-streamed request on the best backend, failing over to the others on transport errors."""
+        tried = set()
+        while True:
+            backend = self.select(exclude=tried)
+            if backend is None:
+                raise UpstreamError('Every LLM backend circuit breaker is open')
+            tried.add(backend)
+            try:
+                return backend.client.post(build_body(backend), backend.headers())
+            except Exception:
+                backend.observe(None, failed=True)
+                if len(tried) == len(self.backends):
+                    raise
+                self.count('failovers')
+
+    def available(self):
+        return any(b.client.breaker.available() for b in self.backends)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {'counters': counters, 'backends': {b.name: b.stats() for b in self.backends}}
+
+
+def load_backends(config, default, make_client):
+    """Backends from the LLM_BACKENDS JSON list, or the single default entry when it is unset.
+
+    Entries have name, url, model and optionally apiKeyEnv. make_client(url)
+    returns the MiniMaxClient for a backend.
+    """
+    entries = json.loads(config) if config else [default]
+    backends = []
+    for i, entry in enumerate(entries):
+        backends.append(Backend(
+            entry.get('name') or f"backend{i}", entry['url'], entry.get('model') or default['model'],
+            make_client(entry['url']), api_key_env=entry.get('apiKeyEnv') or default['apiKeyEnv']
+        ))
+    if len({b.name for b in backends}) != len(backends):
+        raise ValueError('LLM_BACKENDS names must be unique')
+    return backends
+
@@ -0,0 +1,70 @@
+"""Queued logging: request threads only enqueue records, a listener thread writes them.
+
+    from log import log
+    log.info(f"Chart ready for {user_id[:8]}")
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: when the queue is full the record is dropped and counted."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logger(name='oracool'):
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter(os.environ.get('LOG_FORMAT', '%(message)s')))
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+
+    def start_listener():
+        listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+        listener.start()
+        atexit.register(listener.stop)
+
+    def restart_in_child():
+        # A forked child (a gunicorn worker whose master preloaded the chart
+        # stack) inherits the queue but not the listener thread draining it.
+        # Records still queued belong to the parent, which writes them itself;
+        # under gevent the parent's listener greenlet survives the fork, so
+        # empty the old queue before it can write them a second time.
+        inherited, handler.queue = handler.queue, queue.Queue(LOG_QUEUE_SIZE)
+        while not inherited.empty():
+            inherited.get_nowait()
+        start_listener()
+
+    start_listener()
+    os.register_at_fork(after_in_child=restart_in_child)
+
+    logger.addHandler(handler)
+    logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+    logger.queue_handler = handler
+    return logger
+
+
+def log_stats():
+    handler = log.queue_handler
+    return {'queued': handler.queue.qsize(), 'dropped': handler.dropped}
+
+
+log = setup_logger()
@@ -0,0 +1,20 @@
+"""Development server: python main.py (python app.py hands off to this).
+
+Everything happens under the __main__ guard. ChartEngine's spawned workers
+re-import the main script as __mp_main__, and this keeps that import from
+re-running app.py's start-up (store writer, job workers, warm-up, cohort
+index) in every pool child.
+"""
+import os
+
+if __name__ == '__main__':
+    from app import app
+    from log import log
+
+    log.info("=" * 50)
+    log.info("ORACOOL BACKEND STARTING...")
+    log.info("=" * 50)
+    log.info("Flask app initialized")
+    log.info(f"MiniMax API key: {'SET' if os.environ.get('MINIMAX_API_KEY') else 'MISSING!'}")
+    log.info("=" * 50)
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('REPL_SLUG') is not None)
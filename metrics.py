@@ -0,0 +1,180 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Each process keeps its own registry; under gunicorn with several workers
+scrape every worker (or run one) since nothing is aggregated across them.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name, format_labels(self.labels, key), value) for key, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        out = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                out.append((f'{self.name}_bucket', format_labels(self.labels, key, [('le', format_value(bound))]),
+                            cumulative))
+            out.append((f'{self.name}_bucket', format_labels(self.labels, key, [('le', '+Inf')]), count))
+            out.append((f'{self.name}_sum', format_labels(self.labels, key), total))
+            out.append((f'{self.name}_count', format_labels(self.labels, key), count))
+        return out
+
+
+class Registry:
+    """Named metrics plus collectors that read existing stats() at scrape time."""
+
+    def __init__(self, prefix='oracool_'):
+        self.prefix = prefix
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.add(Gauge(self.prefix + name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self, name, kind, help, read, labels=()):
+        """Expose read() at scrape time; read returns a value or {label values tuple: value}."""
+        self.collectors.append((self.prefix + name, kind, help, read, tuple(labels)))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {format_value(value)}')
+        for name, kind, help, read, labels in self.collectors:
+            try:
+                values = read()
+            except Exception as e:
+                lines.append(f'# {name} unavailable: {str(e)}')
+                continue
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            if not isinstance(values, dict):
+                values = {(): values}
+            for key, value in values.items():
+                lines.append(f'{name}{format_labels(labels, key)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'stage_duration_seconds', 'Time spent in each hot-path stage.', labels=('stage',)
+)
+http_request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'Request handling time by endpoint.', labels=('endpoint', 'method')
+)
+http_responses = registry.counter(
+    'http_responses_total', 'Responses by endpoint and status code.', labels=('endpoint', 'status')
+)
+fallbacks = registry.counter(
+    'fallback_responses_total', 'Fallback readings served instead of a model answer.', labels=('reason',)
+)
+upstream_timeouts = registry.counter('upstream_timeouts_total', 'MiniMax calls that timed out.')
+llm_inflight = registry.gauge('llm_inflight', 'MiniMax calls currently holding an in-flight slot.')
+rate_limited = registry.counter('rate_limited_total', 'Requests refused with a 429.', labels=('reason',))
+
+
+def time_stage(stage):
+    return stage_seconds.time(stage=stage)
@@ -0,0 +1,199 @@
+import email.utils
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from log import log
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class UpstreamStatusError(UpstreamError):
+    """Every attempt ended with an HTTP error status."""
+
+    def __init__(self, status, text=''):
+        super().__init__(f"Upstream returned {status}")
+        self.status = status
+        self.text = text
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, then lets one trial through."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opens = 0
+        self.short_circuits = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self.trial_in_flight = False
+            if self.state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.short_circuits += 1
+            return False
+
+    def available(self):
+        """Whether allow() would let a request through, without claiming the half-open trial."""
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not self.trial_in_flight
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.opens += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+    def stats(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutiveFailures': self.failures,
+                'opens': self.opens,
+                'shortCircuits': self.short_circuits
+            }
+
+
+class MiniMaxClient:
+    """Shared keep-alive session for the chat completions API.
+
+    Connection errors, timeouts, 429 and 5xx responses are retried with
+    jittered exponential backoff (honoring Retry-After) up to max_retries
+    times. Everything goes through a CircuitBreaker so a degraded upstream
+    is skipped immediately instead of holding a worker for the full timeout.
+    """
+
+    def __init__(self, url, pool_size=32, max_retries=2, backoff_base=0.5, backoff_cap=8.0,
+                 connect_timeout=5.0, read_timeout=120.0, breaker=None):
+        self.url = url
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.counters = {'requests': 0, 'attempts': 0, 'retries': 0, 'successes': 0, 'failures': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def backoff_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def post(self, body, headers, stream=False):
+        """POST a chat completion request, returning the final requests.Response.
+
+        body is either a dict to JSON-encode or already encoded bytes.
+
+        Raises UpstreamError when the breaker is open, or the last transport
+        exception when every attempt failed without a response.
+        """
+        self.count('requests')
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise UpstreamError('MiniMax circuit breaker is open')
+
+            self.count('attempts')
+            try:
+                response = self.session.post(self.url, headers=headers, timeout=self.timeout, stream=stream,
+                                             **({'data': body} if isinstance(body, bytes) else {'json': body}))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    self.count('failures')
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    self.breaker.record_success()
+                    self.count('successes')
+                    return response
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    self.count('failures')
+                    return response
+                delay = self.backoff_delay(attempt, response)
+                response.close()
+
+            attempt += 1
+            self.count('retries')
+            log.warning(f"Retrying MiniMax request in {delay:.2f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+
+    def pool_stats(self):
+        pools = self.adapter.poolmanager.pools
+        connections = 0
+        requests_sent = 0
+        for key in pools.keys():
+            pool = pools[key]
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+        return {'maxSize': self.pool_size, 'connectionsOpened': connections, 'requestsSent': requests_sent}
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            'counters': counters,
+            'breaker': self.breaker.stats(),
+            'pool': self.pool_stats()
+        }
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
@@ -0,0 +1,128 @@
+"""Response encoding: fast JSON, Accept-Encoding compression and conditional GET.
+
+orjson and brotli are optional (pip install .[fast]); without them the
+stdlib json encoder and gzip are used.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'orjson' if orjson else 'json')
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html', 'application/x-ndjson')
+
+ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson else 0
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson when JSON_ENCODER=orjson.
+
+    Output keeps Flask's sorted keys so ETags computed from bodies are stable;
+    anything orjson cannot handle goes through DefaultJSONProvider.default.
+    """
+
+    use_orjson = JSON_ENCODER == 'orjson' and orjson is not None
+
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not self.use_orjson:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def dumps(obj):
+    """Compact JSON text for SSE and NDJSON lines."""
+    if FastJSONProvider.use_orjson:
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=ORJSON_OPTIONS).decode()
+    return json.dumps(obj, default=DefaultJSONProvider.default)
+
+
+def loads(text):
+    if FastJSONProvider.use_orjson:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def make_etag(*parts):
+    return hashlib.sha256('\x1f'.join(str(p) for p in parts).encode()).hexdigest()[:32]
+
+
+def not_modified(etag, cache_control):
+    """A 304 for a matching If-None-Match, checked before the payload is built; None otherwise."""
+    matched = next((tag for tag in (etag, f"{etag}-br", f"{etag}-gzip") if tag in request.if_none_match), None)
+    if matched is None:
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(matched)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def tagged(response, etag, cache_control):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """after_request hook: compress buffered bodies the client accepts. Streams (SSE) pass through."""
+    if response.direct_passthrough or response.is_streamed or response.status_code != 200:
+        return response
+    if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+    # The representation changed, so a strong validator must change with it.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
@@ -0,0 +1,233 @@
+import hashlib
+import math
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_VERSION = 1
+
+
+def normalize_question(text):
+    text = re.sub(r"[^\w\s]", ' ', text.casefold())
+    return ' '.join(text.split())
+
+
+def question_ngrams(normalized, n=3):
+    padded = f" {normalized} "
+    if len(padded) <= n:
+        return frozenset([padded])
+    return frozenset(sys.intern(padded[i:i + n]) for i in range(len(padded) - n + 1))
+
+
+# "don't"/"isn't" normalize to "don t"/"isn t", hence the bare "t".
+NEGATIONS = frozenset(('no', 'not', 'never', 'nor', 'none', 'nothing', 'cannot', 'without', 't'))
+
+
+def question_guard(normalized):
+    """Numbers and negations a near match must share: "happy in 2026" is not "happy in 2027"."""
+    words = normalized.split()
+    return tuple(w for w in words if w.isdigit()), frozenset(w for w in words if w in NEGATIONS)
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def probe_count(size, threshold):
+    """How many of a question's grams must be probed to find every match.
+
+    A stored question with Jaccard >= threshold shares at least
+    threshold * size of the query's grams, so it contains at least one of
+    any size - ceil(threshold * size) + 1 of them.
+    """
+    return size - math.ceil(threshold * size) + 1
+
+
+def make_response_key(chart_hash, normalized, first_turn):
+    raw = f"v{CACHE_VERSION}|{chart_hash}|{int(first_turn)}|{normalized}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Caches model answers by (chart hash, normalized question, history-empty flag).
+
+    The chart hash covers the whole system prompt the answer was generated
+    for: the chart text and that day's transits. Users of a sample profile
+    share answers within a day; a birth chart carries its owner's name, so
+    its answers are never served to anyone else.
+
+    Lookups try the exact key first, then the closest stored question for the
+    same chart and flag by character n-gram Jaccard similarity, provided both
+    carry the same numbers and negations (off unless similarity is above 0).
+    Entries expire after ttl seconds and the least recently used are evicted
+    beyond max_entries. Only first turns are cached unless cache_followups is
+    set, since later answers depend on the conversation. An optional SQLite
+    file keeps entries across restarts and workers.
+    """
+
+    def __init__(self, max_entries=10000, ttl=7 * 86400.0, similarity=0.0, cache_followups=False, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.cache_followups = cache_followups
+        self.entries = OrderedDict()
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.stats_counts = {'hits': 0, 'nearHits': 0, 'diskHits': 0, 'misses': 0,
+                             'stores': 0, 'evictions': 0, 'expirations': 0}
+        self.db = None
+        if disk_path:
+            self.db = sqlite3.connect(disk_path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, chart_hash TEXT NOT NULL, first_turn INTEGER NOT NULL, '
+                'question TEXT NOT NULL, response TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            self.db.commit()
+            self.load()
+
+    def chart_hash(self, system_prompt):
+        """Key for the chart an answer belongs to: the exact system prompt it was generated for."""
+        return hashlib.sha256(system_prompt.encode()).hexdigest()
+
+    def cacheable(self, first_turn):
+        return self.max_entries > 0 and (first_turn or self.cache_followups)
+
+    def load(self):
+        rows = self.db.execute(
+            'SELECT key, chart_hash, first_turn, question, response, expires FROM response_cache '
+            'WHERE expires > ? ORDER BY expires DESC LIMIT ?', (time.time(), self.max_entries)
+        ).fetchall()
+        with self.lock:
+            for key, chart_hash, first_turn, question, response, expires in reversed(rows):
+                self.remember(key, (chart_hash, bool(first_turn)), question, response, expires)
+
+    def get(self, system_prompt, question, first_turn):
+        if not self.cacheable(first_turn):
+            return None
+        chart_hash = self.chart_hash(system_prompt)
+        normalized = normalize_question(question)
+        key = make_response_key(chart_hash, normalized, first_turn)
+        now = time.time()
+
+        with self.lock:
+            entry = self.live_entry(key, now)
+            if entry is not None:
+                self.stats_counts['hits'] += 1
+                return entry['response']
+
+            if self.db is not None:
+                row = self.db.execute(
+                    'SELECT response, expires FROM response_cache WHERE key = ? AND expires > ?', (key, now)
+                ).fetchone()
+                if row is not None:
+                    self.remember(key, (chart_hash, first_turn), normalized, row[0], row[1])
+                    self.stats_counts['diskHits'] += 1
+                    return row[0]
+
+            if self.similarity > 0:
+                near_key = self.nearest(self.buckets.get((chart_hash, first_turn)), normalized)
+                entry = self.live_entry(near_key, now) if near_key else None
+                if entry is not None:
+                    self.stats_counts['nearHits'] += 1
+                    return entry['response']
+
+            self.stats_counts['misses'] += 1
+            return None
+
+    def put(self, system_prompt, question, first_turn, response):
+        if not self.cacheable(first_turn):
+            return
+        chart_hash = self.chart_hash(system_prompt)
+        normalized = normalize_question(question)
+        key = make_response_key(chart_hash, normalized, first_turn)
+        expires = time.time() + self.ttl
+
+        with self.lock:
+            self.remember(key, (chart_hash, first_turn), normalized, response, expires)
+            self.stats_counts['stores'] += 1
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO response_cache '
+                    '(key, chart_hash, first_turn, question, response, expires) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, chart_hash, int(first_turn), normalized, response, expires)
+                )
+                self.db.commit()
+
+    def nearest(self, bucket, normalized):
+        if not bucket:
+            return None
+        grams = question_ngrams(normalized)
+        index = bucket['index']
+        rarest = sorted(grams, key=lambda g: len(index.get(g, ())))[:probe_count(len(grams), self.similarity)]
+        candidates = set()
+        for gram in rarest:
+            candidates.update(index.get(gram, ()))
+        guard = question_guard(normalized)
+        best_key, best_score = None, self.similarity
+        for key in candidates:
+            if bucket['guards'][key] != guard:
+                continue
+            score = jaccard(grams, bucket['grams'][key])
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def live_entry(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires'] <= now:
+            self.forget(key)
+            self.stats_counts['expirations'] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def remember(self, key, bucket_key, normalized, response, expires):
+        if key in self.entries:
+            self.forget(key)
+        self.entries[key] = {'bucket': bucket_key, 'response': response, 'expires': expires}
+        if self.similarity > 0:
+            bucket = self.buckets.setdefault(bucket_key, {'grams': {}, 'guards': {}, 'index': {}})
+            grams = question_ngrams(normalized)
+            bucket['grams'][key] = grams
+            bucket['guards'][key] = question_guard(normalized)
+            for gram in grams:
+                bucket['index'].setdefault(gram, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self.forget(next(iter(self.entries)))
+            self.stats_counts['evictions'] += 1
+
+    def forget(self, key):
+        entry = self.entries.pop(key)
+        bucket = self.buckets.get(entry['bucket'])
+        if bucket is None:
+            return
+        grams = bucket['grams'].pop(key)
+        del bucket['guards'][key]
+        for gram in grams:
+            keys = bucket['index'][gram]
+            keys.discard(key)
+            if not keys:
+                del bucket['index'][gram]
+        if not bucket['grams']:
+            del self.buckets[entry['bucket']]
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.stats_counts)
+            stats['size'] = len(self.entries)
+            stats['charts'] = len(self.buckets)
+            stats['maxEntries'] = self.max_entries
+            stats['diskEnabled'] = self.db is not None
+        hits = stats['hits'] + stats['nearHits'] + stats['diskHits']
+        lookups = hits + stats['misses']
+        stats['hitRate'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,161 @@
+"""Speculative first readings for the suggestion-chip questions.
+
+While a new user looks at their chart, a few background workers generate
+answers to the top suggested questions. A first chat turn asking one of
+them gets the stored answer (or joins the generation still running); any
+other first question cancels the user's speculations. A rolling token
+budget and a capacity check keep speculation from competing with real
+traffic.
+
+    hit rate            served / completed speculations
+    wasted token ratio  tokens of speculations never served / all speculative tokens
+"""
+import queue
+import threading
+import time
+
+from log import log
+from response_cache import normalize_question
+
+
+class Speculator:
+    def __init__(self, generate, has_capacity, workers=2, token_budget=200000, budget_window=3600.0,
+                 ttl=3600.0, expected_tokens=1200):
+        """generate(chart_data, system_prompt, question, cancelled) returns (answer or None, tokens spent)."""
+        self.generate = generate
+        self.has_capacity = has_capacity
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self.ttl = ttl
+        self.expected_tokens = float(expected_tokens)
+        self.tasks = queue.Queue()
+        self.users = {}
+        self.lock = threading.Lock()
+        self.window = []
+        self.counters = {'scheduled': 0, 'started': 0, 'completed': 0, 'served': 0, 'cancelled': 0,
+                         'expired': 0, 'skipped': 0, 'failed': 0}
+        self.tokens = {'generated': 0, 'served': 0}
+        self.workers = [
+            threading.Thread(target=self.work_loop, name=f'speculator-{i}', daemon=True) for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def schedule(self, user_id, chart_data, system_prompt, questions):
+        now = time.monotonic()
+        entries = {}
+        for question in questions:
+            entries[normalize_question(question)] = {
+                'question': question, 'state': 'queued', 'answer': None, 'tokens': 0,
+                'done': threading.Event(), 'cancel': threading.Event(), 'expires': now + self.ttl
+            }
+        with self.lock:
+            self.prune(now)
+            self.cancel_entries(self.users.pop(user_id, {}))
+            self.users[user_id] = entries
+            self.counters['scheduled'] += len(entries)
+        for entry in entries.values():
+            self.tasks.put((user_id, chart_data, system_prompt, entry))
+
+    def budget_left(self, now):
+        self.window = [(t, n) for t, n in self.window if now - t < self.budget_window]
+        return self.token_budget - sum(n for _, n in self.window)
+
+    def spend(self, tokens):
+        with self.lock:
+            self.window.append((time.monotonic(), tokens))
+            self.tokens['generated'] += tokens
+
+    def work_loop(self):
+        while True:
+            user_id, chart_data, system_prompt, entry = self.tasks.get()
+            with self.lock:
+                if entry['cancel'].is_set():
+                    continue
+                if self.budget_left(time.monotonic()) < self.expected_tokens or not self.has_capacity():
+                    entry['state'] = 'skipped'
+                    self.counters['skipped'] += 1
+                    entry['done'].set()
+                    continue
+                entry['state'] = 'running'
+                self.counters['started'] += 1
+
+            try:
+                answer, tokens = self.generate(chart_data, system_prompt, entry['question'], entry['cancel'])
+            except Exception as e:
+                log.error(f"Speculative reading failed: {str(e)}")
+                answer, tokens = None, 0
+            self.spend(tokens)
+
+            with self.lock:
+                entry['tokens'] = tokens
+                if entry['cancel'].is_set():
+                    entry['state'] = 'cancelled'
+                elif answer is None:
+                    entry['state'] = 'failed'
+                    self.counters['failed'] += 1
+                else:
+                    entry['state'] = 'done'
+                    entry['answer'] = answer
+                    self.counters['completed'] += 1
+                    self.expected_tokens += 0.2 * (tokens - self.expected_tokens)
+            entry['done'].set()
+            log.debug(f"Speculative reading for {user_id[:8]} {entry['state']} ({tokens} tokens)")
+
+    def take(self, user_id, question, timeout):
+        """Answer for a user's first question if it was speculated; cancels the user's other speculations.
+
+        A generation still running is waited for up to timeout; one still
+        queued is cancelled, since asking directly is no slower.
+        """
+        with self.lock:
+            entries = self.users.pop(user_id, None)
+            if not entries:
+                return None
+            match = entries.pop(normalize_question(question), None)
+            self.cancel_entries(entries)
+            if match is not None and match['state'] in ('queued', 'skipped'):
+                self.cancel_entries({'match': match})
+                match = None
+        if match is None:
+            return None
+
+        match['done'].wait(timeout)
+        with self.lock:
+            if match['state'] != 'done':
+                self.cancel_entries({'match': match})
+                return None
+            self.counters['served'] += 1
+            self.tokens['served'] += match['tokens']
+        return match['answer']
+
+    def discard(self, user_id):
+        """The user's first turn was answered some other way."""
+        with self.lock:
+            self.cancel_entries(self.users.pop(user_id, {}))
+
+    def cancel_entries(self, entries):
+        for entry in entries.values():
+            if entry['state'] in ('queued', 'running'):
+                entry['cancel'].set()
+                self.counters['cancelled'] += 1
+
+    def prune(self, now):
+        expired = [user_id for user_id, entries in self.users.items()
+                   if all(e['expires'] < now for e in entries.values())]
+        for user_id in expired:
+            entries = self.users.pop(user_id)
+            self.counters['expired'] += sum(1 for e in entries.values() if e['state'] == 'done')
+            self.cancel_entries(entries)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            tokens = dict(self.tokens)
+            budget_left = self.budget_left(time.monotonic())
+            users = len(self.users)
+        return dict(
+            counters, tokens=tokens, users=users, queued=self.tasks.qsize(), budgetLeft=budget_left,
+            hitRate=round(counters['served'] / counters['completed'], 4) if counters['completed'] else 0.0,
+            wastedTokenRatio=round(1 - tokens['served'] / tokens['generated'], 4) if tokens['generated'] else 0.0
+        )
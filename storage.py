@@ -0,0 +1,427 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from log import log
+
+
+class SessionCache:
+    """LRU of recently active users and their message lists.
+
+    Entries expire ttl seconds after they were stored, however often they
+    are read, so a user rewritten by another worker is re-read within ttl.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=900.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry['expires'] < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return entry
+
+    def put(self, user_id, user, messages=None):
+        with self.lock:
+            entry = {'user': user, 'messages': messages, 'expires': time.monotonic() + self.ttl}
+            self.entries[user_id] = entry
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_sessions:
+                self.entries.popitem(last=False)
+            return entry
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class MemoryStore:
+    """Process-local store; state is lost on restart and not shared between workers."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.users = {}
+        self.conversations = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def create_user(self, user_id, user):
+        with self.lock:
+            self.users[user_id] = user
+            self.conversations[user_id] = []
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def update_user(self, user_id, user):
+        with self.lock:
+            self.users[user_id] = user
+
+    def append_messages(self, user_id, messages):
+        with self.lock:
+            stored = []
+            now = datetime.now().isoformat()
+            for msg in messages:
+                stored.append({'id': self.next_id, 'role': msg['role'], 'content': msg['content'], 'createdAt': now})
+                self.next_id += 1
+            self.conversations.setdefault(user_id, []).extend(stored)
+            return stored
+
+    def get_messages(self, user_id, limit=None, before=None, after=None):
+        messages = self.conversations.get(user_id, [])
+        if after is not None:
+            messages = [m for m in messages if m['id'] > after]
+        if before is not None:
+            messages = [m for m in messages if m['id'] < before]
+        if limit is not None:
+            messages = messages[-limit:]
+        return list(messages)
+
+    def count_messages(self, user_id):
+        return len(self.conversations.get(user_id, []))
+
+    def iter_users(self, after=0):
+        """(sequence, user_id, user) in creation order, for sequence numbers above after."""
+        with self.lock:
+            users = list(self.users.items())
+        for seq, (user_id, user) in enumerate(users[after:], start=after + 1):
+            yield seq, user_id, user
+
+    def iter_messages(self, after=0):
+        """Every user's messages with ids above after, in id order."""
+        with self.lock:
+            messages = [dict(m, userId=user_id) for user_id, conversation in self.conversations.items()
+                        for m in conversation if m['id'] > after]
+        messages.sort(key=lambda m: m['id'])
+        yield from messages
+
+    def import_batch(self, users, messages, overwrite=False):
+        """Add (user_id, user) pairs and messages, which get new ids here.
+
+        Existing users are kept unless overwrite is set. A message already in
+        its user's conversation (same role, content and createdAt) is
+        skipped. Returns (users written, messages written).
+        """
+        with self.lock:
+            users_written = 0
+            for user_id, user in users:
+                if overwrite or user_id not in self.users:
+                    self.users[user_id] = user
+                    users_written += 1
+                self.conversations.setdefault(user_id, [])
+            known = {}
+            written = 0
+            for msg in messages:
+                conversation = self.conversations.setdefault(msg['userId'], [])
+                keys = known.get(msg['userId'])
+                if keys is None:
+                    keys = known[msg['userId']] = {(m['role'], m['content'], m.get('createdAt')) for m in conversation}
+                key = (msg['role'], msg['content'], msg['createdAt'])
+                if key in keys:
+                    continue
+                keys.add(key)
+                conversation.append({'id': self.next_id, 'role': msg['role'], 'content': msg['content'],
+                                     'createdAt': msg['createdAt']})
+                self.next_id += 1
+                written += 1
+            return users_written, written
+
+    def pending_writes(self):
+        return 0
+
+    def stats(self):
+        return {'backend': self.name, 'users': len(self.users), 'activeConversations': len(self.conversations)}
+
+
+class SQLiteStore:
+    """SQLite (WAL) store shared by every worker process on the host.
+
+    Users and messages are written by a single writer thread that commits
+    whatever has queued up since the last commit in one transaction, so
+    concurrent chat turns share an fsync. Callers block until their rows are
+    committed. Messages are append-only and read back by (user_id, id).
+    Active sessions are served from a SessionCache that is revalidated
+    against the latest message id, so other workers' writes are never missed.
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS users ('
+        'id TEXT PRIMARY KEY, data TEXT NOT NULL, created_at TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS messages ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, role TEXT NOT NULL, '
+        'content TEXT NOT NULL, created_at TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS messages_user_id ON messages (user_id, id)',
+    )
+
+    def __init__(self, path, batch_size=256, cache_size=10000, cache_ttl=900.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.cache = SessionCache(cache_size, cache_ttl)
+        self.local = threading.local()
+
+        db = self.connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        for statement in self.SCHEMA:
+            db.execute(statement)
+        db.commit()
+
+        self.writes = queue.Queue()
+        self.batches = 0
+        self.writer = threading.Thread(target=self.write_loop, name='sqlite-store-writer', daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def write_loop(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute('PRAGMA synchronous=NORMAL')
+        while True:
+            batch = [self.writes.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            # One transaction per batch; a failing write only undoes its own
+            # savepoint, so the rest of the batch still commits.
+            results = []
+            try:
+                with db:
+                    db.execute('BEGIN')
+                    for kind, args, _, _ in batch:
+                        results.append(self.apply_savepoint(db, kind, args))
+                error = None
+            except Exception as e:
+                log.error(f"Store write batch failed: {str(e)}")
+                error = e
+            self.batches += 1
+
+            for i, (_, _, done, outcome) in enumerate(batch):
+                outcome['result'], outcome['error'] = results[i] if error is None else (None, error)
+                done.set()
+
+    def apply_savepoint(self, db, kind, args):
+        """(result, None) for an applied write, or (None, error) once that write alone is rolled back."""
+        db.execute('SAVEPOINT write')
+        try:
+            result = self.apply_write(db, kind, args)
+        except Exception as e:
+            log.error(f"Store write failed: {str(e)}")
+            db.execute('ROLLBACK TO write')
+            db.execute('RELEASE write')
+            return None, e
+        db.execute('RELEASE write')
+        return result, None
+
+    def apply_write(self, db, kind, args):
+        if kind == 'import':
+            return self.apply_import(db, *args)
+        now = datetime.now().isoformat()
+        if kind == 'user':
+            user_id, user = args
+            db.execute('INSERT OR REPLACE INTO users (id, data, created_at) VALUES (?, ?, ?)',
+                       (user_id, json.dumps(user), user.get('createdAt', now)))
+            return None
+
+        user_id, messages = args
+        stored = []
+        for msg in messages:
+            cursor = db.execute('INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)',
+                                (user_id, msg['role'], msg['content'], now))
+            stored.append({'id': cursor.lastrowid, 'role': msg['role'], 'content': msg['content'], 'createdAt': now})
+        return stored
+
+    def apply_import(self, db, users, messages, overwrite):
+        now = datetime.now().isoformat()
+        before = db.total_changes
+        db.executemany(f"INSERT OR {'REPLACE' if overwrite else 'IGNORE'} INTO users (id, data, created_at) "
+                       'VALUES (?, ?, ?)',
+                       [(user_id, json.dumps(user), user.get('createdAt', now)) for user_id, user in users])
+        users_written = db.total_changes - before
+        # New ids from this table's sequence; the (user_id, created_at, role,
+        # content) check makes re-importing the same messages a no-op.
+        before = db.total_changes
+        db.executemany(
+            'INSERT INTO messages (user_id, role, content, created_at) SELECT ?, ?, ?, ? WHERE NOT EXISTS '
+            '(SELECT 1 FROM messages WHERE user_id = ? AND created_at = ? AND role = ? AND content = ?)',
+            [(m['userId'], m['role'], m['content'], m['createdAt'], m['userId'], m['createdAt'], m['role'],
+              m['content']) for m in messages]
+        )
+        return users_written, db.total_changes - before
+
+    def submit(self, kind, args):
+        done = threading.Event()
+        outcome = {}
+        self.writes.put((kind, args, done, outcome))
+        done.wait()
+        if outcome['error'] is not None:
+            raise outcome['error']
+        return outcome['result']
+
+    def create_user(self, user_id, user):
+        self.submit('user', (user_id, user))
+        self.cache.put(user_id, user, [])
+
+    def get_user(self, user_id):
+        entry = self.cache.get(user_id)
+        # Users whose chart is still being computed may be updated by another
+        # worker at any moment, so they are always re-read.
+        if entry is not None and entry['user'].get('chartStatus') != 'pending':
+            return entry['user']
+        row = self.connect().execute('SELECT data FROM users WHERE id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        user = json.loads(row[0])
+        if entry is not None:
+            entry['user'] = user
+        else:
+            self.cache.put(user_id, user)
+        return user
+
+    def update_user(self, user_id, user):
+        self.submit('user', (user_id, user))
+        entry = self.cache.get(user_id)
+        if entry is not None:
+            entry['user'] = user
+        else:
+            self.cache.put(user_id, user)
+
+    def append_messages(self, user_id, messages):
+        stored = self.submit('messages', (user_id, messages))
+        entry = self.cache.get(user_id)
+        if entry is not None and entry['messages'] is not None and stored:
+            last_id = entry['messages'][-1]['id'] if entry['messages'] else 0
+            missed = self.connect().execute(
+                'SELECT COUNT(*) FROM messages WHERE user_id = ? AND id > ? AND id < ?',
+                (user_id, last_id, stored[0]['id'])
+            ).fetchone()[0]
+            entry['messages'] = entry['messages'] + stored if missed == 0 else None
+        return stored
+
+    def latest_message_id(self, user_id):
+        row = self.connect().execute('SELECT MAX(id) FROM messages WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] or 0
+
+    def get_messages(self, user_id, limit=None, before=None, after=None):
+        if before is None:
+            entry = self.cache.get(user_id)
+            if entry is not None and entry['messages'] is not None:
+                cached = entry['messages']
+                if (cached[-1]['id'] if cached else 0) == self.latest_message_id(user_id):
+                    if after is not None:
+                        cached = [m for m in cached if m['id'] > after]
+                    return list(cached[-limit:] if limit is not None else cached)
+
+        query = 'SELECT id, role, content, created_at FROM messages WHERE user_id = ?'
+        params = [user_id]
+        if after is not None:
+            query += ' AND id > ?'
+            params.append(after)
+        if before is not None:
+            query += ' AND id < ?'
+            params.append(before)
+        query += ' ORDER BY id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        rows = self.connect().execute(query, params).fetchall()
+        messages = [{'id': r[0], 'role': r[1], 'content': r[2], 'createdAt': r[3]} for r in reversed(rows)]
+
+        if before is None and limit is None and after is None:
+            entry = self.cache.get(user_id)
+            if entry is not None:
+                entry['messages'] = messages
+        return list(messages)
+
+    def count_messages(self, user_id):
+        return self.connect().execute('SELECT COUNT(*) FROM messages WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+    def iter_users(self, after=0, page_size=1000):
+        """(rowid, user_id, user) for rows above after, oldest first.
+
+        Writes replace the whole row, so an updated user reappears with a new
+        rowid and polling from the last rowid seen picks up every change.
+        Rows are read a page at a time so no read transaction stays open
+        while the caller works through them.
+        """
+        db = self.connect()
+        while True:
+            rows = db.execute('SELECT rowid, id, data FROM users WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                              (after, page_size)).fetchall()
+            for rowid, user_id, data in rows:
+                yield rowid, user_id, json.loads(data)
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
+
+    def iter_messages(self, after=0, page_size=1000):
+        """Every user's messages with ids above after, in id order, read a page at a time."""
+        db = self.connect()
+        while True:
+            rows = db.execute('SELECT id, user_id, role, content, created_at FROM messages WHERE id > ? '
+                              'ORDER BY id LIMIT ?', (after, page_size)).fetchall()
+            for message_id, user_id, role, content, created_at in rows:
+                yield {'id': message_id, 'userId': user_id, 'role': role, 'content': content,
+                       'createdAt': created_at}
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
+
+    def import_batch(self, users, messages, overwrite=False):
+        """Add (user_id, user) pairs and messages in one transaction; messages get new ids here.
+
+        Existing users are kept unless overwrite is set. A message already
+        stored for its user (same created_at, role and content) is skipped,
+        so re-importing a chunk is harmless. Returns (users written, messages
+        written).
+        """
+        written = self.submit('import', (users, messages, overwrite))
+        for user_id in {user_id for user_id, _ in users} | {m['userId'] for m in messages}:
+            self.cache.discard(user_id)
+        return written
+
+    def pending_writes(self):
+        return self.writes.qsize()
+
+    def stats(self):
+        db = self.connect()
+        return {
+            'backend': self.name,
+            'users': db.execute('SELECT COUNT(*) FROM users').fetchone()[0],
+            'cachedSessions': len(self.cache),
+            'pendingWrites': self.writes.qsize(),
+            'writeBatches': self.batches
+        }
+
+
+def open_store(backend, path):
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 'sqlite':
+        return SQLiteStore(path)
+    raise ValueError(f"Unknown store backend: {backend}")
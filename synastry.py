@@ -0,0 +1,125 @@
+"""Chart-to-chart comparison: cross aspects, house overlays, composite midpoints and scoring.
+
+Charts are natal dicts as Chart.natal() returns them ({'positions': {body:
+longitude}, 'cusps': [12 longitudes]}). score_many compares one chart
+against a stacked (charts, points) array in a single broadcast, so
+cohort comparisons cost a few microseconds per pair.
+"""
+import numpy as np
+
+from aspects import PLANET_BODIES, AspectEngine
+from transits import HOUSE_NAMES, house_of, sign_position, whole_sign_cusps
+
+POINTS = PLANET_BODIES + ('Ascendant', 'Medium_Coeli')
+
+# Synastry orbs are a little tighter than natal ones.
+SYNASTRY_ASPECTS = (
+    ('conjunction', 0.0, 8.0),
+    ('opposition', 180.0, 8.0),
+    ('trine', 120.0, 6.0),
+    ('sextile', 60.0, 4.0),
+    ('square', 90.0, 6.0),
+)
+ASPECT_TONE = {'conjunction': 0.8, 'trine': 1.0, 'sextile': 0.6, 'square': -0.8, 'opposition': -0.5}
+
+# How much a contact between two points matters: luminaries, Venus, Mars
+# and the Ascendant carry relationship synastry, outer planets barely do.
+POINT_WEIGHT = {
+    'Sun': 1.0, 'Moon': 1.0, 'Mercury': 0.6, 'Venus': 1.0, 'Mars': 0.9, 'Jupiter': 0.5, 'Saturn': 0.6,
+    'Uranus': 0.2, 'Neptune': 0.2, 'Pluto': 0.2, 'Ascendant': 0.9, 'Medium_Coeli': 0.4
+}
+
+synastry_engine = AspectEngine(SYNASTRY_ASPECTS)
+TONES = np.array([ASPECT_TONE[name] for name in synastry_engine.names] + [0.0])
+WEIGHTS = np.array([POINT_WEIGHT[p] for p in POINTS])
+PAIR_WEIGHTS = np.outer(WEIGHTS, WEIGHTS)
+
+
+def natal_vector(natal):
+    """Longitudes in POINTS order, NaN where the chart lacks a point."""
+    positions = natal['positions']
+    return np.array([positions.get(p, np.nan) for p in POINTS], dtype=np.float64)
+
+
+def stack(natals):
+    return np.array([natal_vector(n) for n in natals], dtype=np.float64).reshape(-1, len(POINTS))
+
+
+def contact_scores(kind, orb):
+    """Per-contact signed strength: aspect tone x point weights x orb tightness."""
+    tone = TONES[kind]
+    tightness = 1.0 - orb / synastry_engine.orbs[np.maximum(kind, 0)]
+    return np.where(kind >= 0, tone * PAIR_WEIGHTS * tightness, 0.0)
+
+
+def summarize(strength):
+    """(score 0-100, harmony, tension) over the last two axes."""
+    harmony = np.where(strength > 0, strength, 0.0).sum(axis=(-2, -1))
+    tension = -np.where(strength < 0, strength, 0.0).sum(axis=(-2, -1))
+    score = 50.0 + 50.0 * np.tanh((harmony - tension) / 4.0)
+    return score, harmony, tension
+
+
+def score_many(natal, others):
+    """Compatibility of one natal chart against a (charts, points) array of others."""
+    a = natal_vector(natal)
+    kind, orb = synastry_engine.cross_matrix(a, others)
+    kind = np.where(np.isnan(orb), -1, kind)
+    orb = np.nan_to_num(orb)
+    return summarize(contact_scores(kind, orb))
+
+
+def house_overlays(natal, other):
+    """Houses of other's chart that each of natal's planets falls in."""
+    cusps = other.get('cusps')
+    if not cusps and 'Ascendant' in other['positions']:
+        cusps = whole_sign_cusps(other['positions']['Ascendant'])
+    if not cusps:
+        return []
+    return [
+        {'planet': point, 'house': HOUSE_NAMES[house_of(natal['positions'][point], cusps) - 1]}
+        for point in PLANET_BODIES if point in natal['positions']
+    ]
+
+
+def composite_midpoints(natal, other):
+    """Shorter-arc midpoint of each point both charts have."""
+    composite = {}
+    for point in POINTS:
+        a = natal['positions'].get(point)
+        b = other['positions'].get(point)
+        if a is None or b is None:
+            continue
+        midpoint = (a + ((b - a + 180.0) % 360.0 - 180.0) / 2.0) % 360.0
+        sign, position = sign_position(midpoint)
+        composite[point.replace('Medium_Coeli', 'Midheaven')] = {'sign': sign, 'position': position}
+    return composite
+
+
+def compare(natal, other, max_aspects=20):
+    """Full synastry report for two natal charts."""
+    b = natal_vector(other)
+    kind, orb = synastry_engine.cross_matrix(natal_vector(natal), b)
+    kind = np.where(np.isnan(orb), -1, kind)
+    orb = np.nan_to_num(orb)
+    strength = contact_scores(kind, orb)
+    score, harmony, tension = summarize(strength)
+
+    i, j = np.nonzero(kind >= 0)
+    order = np.argsort(-np.abs(strength[i, j]))[:max_aspects]
+    aspects = [{
+        'planet1': POINTS[i[k]].replace('Medium_Coeli', 'Midheaven'),
+        'planet2': POINTS[j[k]].replace('Medium_Coeli', 'Midheaven'),
+        'aspect': synastry_engine.names[kind[i[k], j[k]]],
+        'orb': round(float(orb[i[k], j[k]]), 1),
+        'strength': round(float(strength[i[k], j[k]]), 3)
+    } for k in order.tolist()]
+
+    return {
+        'score': round(float(score), 1),
+        'harmony': round(float(harmony), 3),
+        'tension': round(float(tension), 3),
+        'aspects': aspects,
+        'houseOverlays': {'firstInSecond': house_overlays(natal, other), 'secondInFirst': house_overlays(other, natal)},
+        'composite': composite_midpoints(natal, other)
+    }
@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The app module, imported once with an in-memory store, a throwaway job queue and no rate limits."""
+    os.environ.update(STORE_BACKEND='memory', JOBS_PATH=os.path.join(tempfile.mkdtemp(), 'jobs.db'),
+                      WARMUP='lazy', LOG_LEVEL='WARNING', IP_RATE_PER_MINUTE='0', USER_RATE_PER_MINUTE='0')
+    import app
+    return app
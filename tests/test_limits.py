@@ -0,0 +1,232 @@
+import threading
+import time
+
+import pytest
+
+import limits
+from limits import (AdmissionController, MemoryBuckets, MemoryTurnLocks, RateLimited, RateLimiter, SingleFlight,
+                    SQLiteLimits, TurnGate)
+
+
+class FakeClock:
+    """Stands in for the time module inside limits, so refill can be tested without sleeping."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(limits, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, tmp_path, clock):
+    if request.param == 'memory':
+        return MemoryBuckets()
+    return SQLiteLimits(str(tmp_path / 'limits.db'))
+
+
+def test_bucket_allows_burst_then_waits_for_refill(buckets, clock):
+    # One token per second, three at once.
+    assert [buckets.take('k', 1.0, 3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take('k', 1.0, 3) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert buckets.take('k', 1.0, 3) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert buckets.take('k', 1.0, 3) == 0.0
+
+
+def test_bucket_refills_only_up_to_burst(buckets, clock):
+    buckets.take('k', 1.0, 2)
+    clock.now += 3600
+    assert [buckets.take('k', 1.0, 2) for _ in range(3)][-1] > 0
+
+
+def test_buckets_are_per_key(buckets):
+    assert buckets.take('a', 1.0, 1) == 0.0
+    assert buckets.take('a', 1.0, 1) > 0
+    assert buckets.take('b', 1.0, 1) == 0.0
+
+
+def test_rate_limiter_raises_with_retry_after(clock):
+    limiter = RateLimiter(MemoryBuckets(), 'user', rate_per_minute=60, burst=1)
+    limiter.check('u1')
+    with pytest.raises(RateLimited) as raised:
+        limiter.check('u1')
+    assert raised.value.reason == 'user_rate'
+    assert raised.value.retry_after == 1
+    assert limiter.rejected == 1
+
+
+def test_rate_limiter_with_zero_rate_is_off():
+    limiter = RateLimiter(MemoryBuckets(), 'ip', rate_per_minute=0, burst=0)
+    for _ in range(100):
+        limiter.check('1.2.3.4')
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_turn_gate_serializes_a_users_turns(backend, tmp_path):
+    locks = MemoryTurnLocks() if backend == 'memory' else SQLiteLimits(str(tmp_path / 'limits.db'),
+                                                                         poll_interval=0.01)
+    gate = TurnGate(locks, wait=0.05, lease=60)
+    token = gate.acquire('u1', retry_after=7)
+    with pytest.raises(RateLimited) as raised:
+        gate.acquire('u1', retry_after=7)
+    assert raised.value.reason == 'turn_in_progress'
+    assert raised.value.retry_after == 7
+    other = gate.acquire('u2', retry_after=7)
+
+    gate.release('u1', token)
+    gate.release('u2', other)
+    gate.release('u1', gate.acquire('u1', retry_after=7))
+
+
+def test_sqlite_turn_lock_lease_expires(tmp_path, clock):
+    locks = SQLiteLimits(str(tmp_path / 'limits.db'))
+    assert locks.acquire('turn:u1', timeout=0, lease=30) is not None
+    assert locks.acquire('turn:u1', timeout=0, lease=30) is None
+    clock.now += 31
+    assert locks.acquire('turn:u1', timeout=0, lease=30) is not None
+
+
+def test_single_flight_shares_the_leaders_result():
+    flight = SingleFlight()
+    started, finish = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        return 'answer'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+    follower.start()
+    while flight.coalesced == 0:
+        time.sleep(0.001)
+    finish.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert sorted(results) == [('answer', False), ('answer', True)]
+    assert len(calls) == 1
+    assert flight.calls == {}
+
+
+def test_single_flight_propagates_the_leaders_error():
+    flight = SingleFlight()
+    started, finish = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        finish.wait(5)
+        raise ValueError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('k', failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.coalesced == 0:
+        time.sleep(0.001)
+    finish.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ['upstream down', 'upstream down']
+    # The failed call is forgotten, so the next one runs again.
+    assert flight.do('k', lambda: 'retried') == ('retried', False)
+
+
+def test_admission_sheds_when_the_queue_is_full():
+    admission = AdmissionController(max_inflight=1, max_queue=0, queue_timeout=5)
+    admission.acquire()
+    with pytest.raises(RateLimited) as raised:
+        admission.acquire()
+    assert raised.value.reason == 'upstream_saturated'
+    assert admission.stats()['shed'] == 1
+    admission.release(1.0)
+    admission.acquire()
+    admission.release(1.0)
+
+
+def test_admission_raises_when_the_queue_wait_times_out():
+    admission = AdmissionController(max_inflight=1, max_queue=1, queue_timeout=0.05)
+    admission.acquire()
+    with pytest.raises(RateLimited):
+        admission.acquire()
+    assert admission.running == 1
+    assert admission.waiting == 0
+    assert admission.shed == 1
+    admission.release(1.0)
+
+
+def test_admission_queued_caller_gets_the_released_slot():
+    admission = AdmissionController(max_inflight=1, max_queue=1, queue_timeout=5)
+    admission.acquire()
+    acquired = threading.Event()
+
+    def queued():
+        admission.acquire()
+        acquired.set()
+
+    waiter = threading.Thread(target=queued)
+    waiter.start()
+    while admission.waiting == 0:
+        time.sleep(0.001)
+    assert not acquired.is_set()
+    admission.release(2.0)
+    assert acquired.wait(5)
+    waiter.join(5)
+    assert admission.running == 1
+    admission.release(2.0)
+
+
+def test_admission_try_acquire_never_waits_or_jumps_the_queue():
+    admission = AdmissionController(max_inflight=2, max_queue=2, queue_timeout=5)
+    assert admission.try_acquire()
+    assert admission.running == 1
+    admission.acquire()
+    assert not admission.try_acquire()
+
+    admission.release(1.0)
+    admission.waiting += 1  # someone is queued for the freed slot
+    assert not admission.try_acquire()
+    admission.waiting -= 1
+    assert admission.try_acquire()
+    admission.release(1.0)
+    admission.release(1.0)
+    assert admission.running == 0
+
+
+def test_admission_retry_after_tracks_call_durations():
+    admission = AdmissionController(max_inflight=2, max_queue=2, queue_timeout=5, initial_seconds=10.0)
+    assert admission.retry_after() == pytest.approx(5.0)
+    admission.acquire()
+    admission.release(20.0)
+    assert admission.avg_seconds == pytest.approx(12.0)
@@ -0,0 +1,207 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+from limits import AdmissionController
+from llm_router import Backend, Router
+from minimax_client import UpstreamStatusError
+
+
+class FakeBreaker:
+    def __init__(self, available=True):
+        self.open = not available
+
+    def available(self):
+        return not self.open
+
+
+class FakeResponse:
+    """A streamed upstream response: waits delay seconds, then sends the given data lines."""
+
+    def __init__(self, delay, lines, status_code=200):
+        self.delay = delay
+        self.lines = lines
+        self.status_code = status_code
+        self.text = '' if status_code == 200 else 'upstream error'
+        self.elapsed = datetime.timedelta(seconds=delay)
+        self.closed = threading.Event()
+
+    def iter_lines(self, decode_unicode=True):
+        if self.closed.wait(self.delay):
+            raise ConnectionError('closed')
+        for line in self.lines:
+            if self.closed.is_set():
+                raise ConnectionError('closed')
+            yield line
+
+    def close(self):
+        self.closed.set()
+
+    def json(self):
+        return {'choices': [{'message': {'content': 'ok'}}]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeClient:
+    def __init__(self, delay=0.0, lines=('data: hello', 'data: [DONE]'), status_code=200, error=None):
+        self.delay = delay
+        self.lines = list(lines)
+        self.status_code = status_code
+        self.error = error
+        self.breaker = FakeBreaker()
+        self.responses = []
+
+    def post(self, body, headers, stream=False):
+        if self.error is not None:
+            raise self.error
+        response = FakeResponse(self.delay, self.lines, self.status_code)
+        self.responses.append(response)
+        return response
+
+    def stats(self):
+        return {}
+
+
+def make_router(*clients, **options):
+    backends = [Backend(f"b{i}", 'http://upstream', 'model', client) for i, client in enumerate(clients)]
+    options.setdefault('initial_hedge_delay', 0.05)
+    return Router(backends, **options), backends
+
+
+def relay(router, hedge=True):
+    return list(router.stream(lambda backend: {'model': backend.model}, hedge=hedge))
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.005)
+
+
+def test_fast_primary_is_not_hedged():
+    router, _ = make_router(FakeClient(), FakeClient(), max_hedge_ratio=1.0)
+    assert relay(router) == ['hello', '[DONE]']
+    assert router.counters['requests'] == 1
+    assert router.counters['hedges'] == 0
+
+
+def test_slow_primary_is_hedged_and_the_loser_is_closed():
+    slow, fast = FakeClient(delay=2.0), FakeClient()
+    router, (slow_backend, _) = make_router(slow, fast, max_hedge_ratio=1.0)
+    # The slow backend looks fastest, so it is the primary and the fast one is the hedge.
+    slow_backend.first_event_ewma = 0.0
+    router.backends[1].first_event_ewma = 1.0
+
+    started = time.monotonic()
+    assert relay(router) == ['hello', '[DONE]']
+    assert time.monotonic() - started < 1.0
+    assert router.counters['hedges'] == 1
+    assert router.counters['hedgesWon'] == 1
+    assert slow.responses[0].closed.is_set()
+
+
+def test_hedges_are_capped_by_max_hedge_ratio():
+    router, (primary, _) = make_router(FakeClient(delay=0.2), FakeClient(), max_hedge_ratio=0.1)
+    primary.first_event_ewma = 0.0
+    assert relay(router) == ['hello', '[DONE]']
+    assert router.counters['hedges'] == 0
+    assert router.counters['hedgesSkipped'] == 1
+
+
+def test_disabled_hedging_never_hedges():
+    router, (primary, _) = make_router(FakeClient(delay=0.2), FakeClient(), max_hedge_ratio=1.0)
+    primary.first_event_ewma = 0.0
+    assert relay(router, hedge=False) == ['hello', '[DONE]']
+    assert router.counters['hedges'] == 0
+    assert router.counters['hedgesSkipped'] == 0
+
+
+def test_hedge_takes_an_admission_slot_and_releases_it_when_cancelled():
+    admission = AdmissionController(max_inflight=2, max_queue=0, queue_timeout=1)
+    hedge_client = FakeClient(delay=2.0)
+    router, (primary, _) = make_router(FakeClient(delay=0.3), hedge_client, max_hedge_ratio=1.0,
+                                       admission=admission)
+    primary.first_event_ewma = 0.0
+
+    admission.acquire()  # the caller's own slot
+    assert relay(router) == ['hello', '[DONE]']
+    assert router.counters['hedges'] == 1
+    assert router.counters['hedgesWon'] == 0
+    # The losing hedge was cancelled; its thread hands the slot back.
+    wait_for(lambda: admission.running == 1)
+    admission.release(0.0)
+    assert admission.running == 0
+
+
+def test_hedge_releases_its_slot_when_it_wins():
+    admission = AdmissionController(max_inflight=2, max_queue=0, queue_timeout=1)
+    router, (primary, _) = make_router(FakeClient(delay=2.0), FakeClient(), max_hedge_ratio=1.0,
+                                       admission=admission)
+    primary.first_event_ewma = 0.0
+
+    admission.acquire()
+    assert relay(router) == ['hello', '[DONE]']
+    assert router.counters['hedgesWon'] == 1
+    wait_for(lambda: admission.running == 1)
+    admission.release(0.0)
+
+
+def test_hedge_is_skipped_without_a_free_slot():
+    admission = AdmissionController(max_inflight=1, max_queue=0, queue_timeout=1)
+    router, (primary, _) = make_router(FakeClient(delay=0.2), FakeClient(), max_hedge_ratio=1.0,
+                                       admission=admission)
+    primary.first_event_ewma = 0.0
+
+    admission.acquire()
+    assert relay(router) == ['hello', '[DONE]']
+    assert router.counters['hedges'] == 0
+    assert router.counters['hedgesSkipped'] == 1
+    assert admission.running == 1
+    admission.release(0.0)
+
+
+def test_failed_attempt_fails_over_before_the_first_event():
+    broken, healthy = FakeClient(status_code=500), FakeClient()
+    router, (primary, _) = make_router(broken, healthy, hedging=False)
+    primary.first_event_ewma = 0.0
+    assert relay(router) == ['hello', '[DONE]']
+    assert router.counters['failovers'] == 1
+    assert primary.error_ewma > 0
+
+
+def test_every_backend_failing_raises_the_last_error():
+    router, _ = make_router(FakeClient(status_code=500), FakeClient(status_code=503), hedging=False)
+    with pytest.raises(UpstreamStatusError):
+        relay(router)
+
+
+def test_select_prefers_the_fastest_available_backend():
+    router, (slow, fast, down) = make_router(FakeClient(), FakeClient(), FakeClient())
+    slow.observe(2.0)
+    fast.observe(0.5)
+    down.observe(0.1)
+    down.client.breaker.open = True
+    assert router.select() is fast
+    assert router.select(exclude={fast}) is slow
+    fast.client.breaker.open = True
+    slow.client.breaker.open = True
+    assert router.select() is None
+    assert not router.available()
+
+
+def test_post_fails_over_on_transport_errors():
+    router, (first, second) = make_router(FakeClient(error=ConnectionError('reset')), FakeClient())
+    first.first_event_ewma = 0.0
+    second.first_event_ewma = 1.0
+    response = router.post(lambda backend: {})
+    assert response.status_code == 200
+    assert router.counters['failovers'] == 1
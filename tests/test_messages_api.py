@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def user_id(app_module, client):
+    user_id = client.post('/api/create-user', json={'quizAnswers': {'q1': 'career_pressure'}}).get_json()['userId']
+    app_module.store.append_messages(user_id, [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"m{i}"}
+                                               for i in range(7)])
+    return user_id
+
+
+def test_cursor_pagination_walks_the_whole_history_once(client, user_id):
+    seen = []
+    url = f"/api/messages/{user_id}?limit=3"
+    while url:
+        page = client.get(url).get_json()
+        seen = [m['content'] for m in page['messages']] + seen
+        url = f"/api/messages/{user_id}?limit=3&before={page['nextCursor']}" if page['nextCursor'] else None
+    assert seen == [f"m{i}" for i in range(7)]
+
+
+def test_pages_carry_created_at(client, user_id):
+    messages = client.get(f"/api/messages/{user_id}").get_json()['messages']
+    assert all(message['createdAt'] for message in messages)
+
+
+@pytest.mark.parametrize('query', ['before=abc', 'before=', 'before=1.5', 'limit=ten'])
+def test_invalid_paging_parameters_are_rejected(client, user_id, query):
+    response = client.get(f"/api/messages/{user_id}?{query}")
+    assert response.status_code == 400
+
+
+def test_unchanged_page_revalidates_with_304(client, user_id):
+    first = client.get(f"/api/messages/{user_id}?limit=3")
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    assert client.get(f"/api/messages/{user_id}?limit=3", headers={'If-None-Match': etag}).status_code == 304
+
+    older = client.get(f"/api/messages/{user_id}?limit=3&before={first.get_json()['nextCursor']}")
+    assert 'immutable' in older.headers['Cache-Control']
@@ -0,0 +1,172 @@
+import threading
+import time
+import types
+
+import pytest
+
+import storage
+from storage import SessionCache, SQLiteStore, open_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    return open_store(request.param, str(tmp_path / 'store.db'))
+
+
+def chat(store, user_id, *contents):
+    return store.append_messages(user_id, [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': content}
+                                           for i, content in enumerate(contents)])
+
+
+def test_users_round_trip(store):
+    assert store.get_user('nobody') is None
+    store.create_user('u1', {'profile': 'sarah', 'chartStatus': 'pending'})
+    assert store.get_user('u1') == {'profile': 'sarah', 'chartStatus': 'pending'}
+    store.update_user('u1', {'profile': 'sarah', 'chartStatus': 'ready'})
+    assert store.get_user('u1')['chartStatus'] == 'ready'
+
+
+def test_messages_are_returned_in_order_with_the_same_shape(store):
+    store.create_user('u1', {})
+    stored = chat(store, 'u1', 'hello', 'hi there')
+    assert [m['content'] for m in stored] == ['hello', 'hi there']
+
+    messages = store.get_messages('u1')
+    assert [(m['role'], m['content']) for m in messages] == [('user', 'hello'), ('assistant', 'hi there')]
+    assert all(set(m) == {'id', 'role', 'content', 'createdAt'} for m in messages)
+    assert messages[0]['id'] < messages[1]['id']
+    assert store.count_messages('u1') == 2
+    assert store.get_messages('someone-else') == []
+
+
+def test_get_messages_pages_with_limit_before_and_after(store):
+    store.create_user('u1', {})
+    ids = [m['id'] for m in chat(store, 'u1', *[f"m{i}" for i in range(10)])]
+
+    assert [m['id'] for m in store.get_messages('u1', limit=3)] == ids[-3:]
+    assert [m['id'] for m in store.get_messages('u1', limit=3, before=ids[-3])] == ids[-6:-3]
+    assert [m['id'] for m in store.get_messages('u1', limit=3, before=ids[1])] == ids[:1]
+    assert [m['id'] for m in store.get_messages('u1', after=ids[6])] == ids[7:]
+    assert [m['id'] for m in store.get_messages('u1', after=ids[2], before=ids[5])] == ids[3:5]
+
+
+def test_messages_from_concurrent_turns_are_all_kept(store):
+    for i in range(8):
+        store.create_user(f"u{i}", {})
+    threads = [threading.Thread(target=chat, args=(store, f"u{i}", 'q', 'a')) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert all(store.count_messages(f"u{i}") == 2 for i in range(8))
+
+
+def test_iter_messages_after_a_cursor(store):
+    store.create_user('a', {})
+    store.create_user('b', {})
+    first = chat(store, 'a', 'a1')[0]['id']
+    chat(store, 'b', 'b1')
+    chat(store, 'a', 'a2')
+    assert [(m['userId'], m['content']) for m in store.iter_messages(after=first)] == [('b', 'b1'), ('a', 'a2')]
+    assert [user_id for _, user_id, _ in store.iter_users()] == ['a', 'b']
+
+
+def test_import_batch_keeps_existing_users_and_skips_duplicate_messages(store):
+    store.create_user('u1', {'profile': 'local'})
+    chat(store, 'u1', 'already here')
+    users = [('u1', {'profile': 'imported'}), ('u2', {'profile': 'imported'})]
+    messages = [{'userId': 'u2', 'role': 'user', 'content': 'hi', 'createdAt': '2026-01-01T00:00:00'},
+                {'userId': 'u2', 'role': 'assistant', 'content': 'hello', 'createdAt': '2026-01-01T00:00:01'}]
+
+    assert store.import_batch(users, messages) == (1, 2)
+    assert store.get_user('u1') == {'profile': 'local'}
+    assert [m['content'] for m in store.get_messages('u2')] == ['hi', 'hello']
+    # New ids from this store, after the ones it already had.
+    assert min(m['id'] for m in store.get_messages('u2')) > store.get_messages('u1')[-1]['id']
+
+    assert store.import_batch(users, messages) == (0, 0)
+    assert store.import_batch(users, [], overwrite=True) == (2, 0)
+    assert store.get_user('u1') == {'profile': 'imported'}
+
+
+def test_open_store_rejects_unknown_backends(tmp_path):
+    with pytest.raises(ValueError):
+        open_store('redis', str(tmp_path / 'x.db'))
+
+
+def test_failing_write_only_fails_its_own_caller(tmp_path, monkeypatch):
+    store = SQLiteStore(str(tmp_path / 'store.db'))
+    writing, gate = threading.Event(), threading.Event()
+    apply_write = store.apply_write
+
+    def flaky_write(db, kind, args):
+        if kind == 'user' and args[0] == 'blocker':
+            writing.set()
+            gate.wait(5)  # hold the writer so the next writes queue into one batch
+        if kind == 'user' and args[0] == 'bad':
+            raise ValueError('bad row')
+        return apply_write(db, kind, args)
+
+    monkeypatch.setattr(store, 'apply_write', flaky_write)
+    outcomes = {}
+
+    def write(user_id):
+        try:
+            store.create_user(user_id, {})
+            outcomes[user_id] = 'ok'
+        except ValueError as e:
+            outcomes[user_id] = str(e)
+
+    blocker = threading.Thread(target=write, args=('blocker',))
+    blocker.start()
+    assert writing.wait(5)
+    batch = [threading.Thread(target=write, args=(user_id,)) for user_id in ('before', 'bad', 'after')]
+    for thread in batch:
+        thread.start()
+    while store.writes.qsize() < 3:
+        time.sleep(0.001)
+    batches = store.batches
+    gate.set()
+    for thread in [blocker] + batch:
+        thread.join(10)
+
+    assert outcomes == {'blocker': 'ok', 'before': 'ok', 'bad': 'bad row', 'after': 'ok'}
+    assert store.batches == batches + 2
+    store.cache = SessionCache()
+    assert store.get_user('before') == {} and store.get_user('after') == {}
+    assert store.get_user('bad') is None
+
+
+def test_sqlite_store_sees_writes_made_through_another_handle(tmp_path):
+    path = str(tmp_path / 'store.db')
+    first, second = SQLiteStore(path), SQLiteStore(path)
+    first.create_user('u1', {})
+    chat(first, 'u1', 'hello')
+    assert [m['content'] for m in second.get_messages('u1')] == ['hello']
+    chat(second, 'u1', 'again')
+    # The session cache is revalidated against the latest message id.
+    assert [m['content'] for m in first.get_messages('u1')] == ['hello', 'again']
+
+
+def test_session_cache_expires_a_fixed_time_after_insert(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    clock.monotonic = lambda: clock.now
+    monkeypatch.setattr(storage, 'time', clock)
+    cache = SessionCache(max_sessions=2, ttl=10.0)
+    cache.put('u1', {'n': 1})
+    clock.now += 6
+    assert cache.get('u1') is not None
+    # Reading it did not extend its life.
+    clock.now += 6
+    assert cache.get('u1') is None
+
+
+def test_session_cache_evicts_least_recently_used():
+    cache = SessionCache(max_sessions=2)
+    cache.put('a', {})
+    cache.put('b', {})
+    cache.get('a')
+    cache.put('c', {})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
@@ -0,0 +1,35 @@
+import pytest
+
+
+def strip(app_module, chunks):
+    stripper = app_module.ThinkTagStripper()
+    return ''.join(stripper.feed(chunk) for chunk in chunks) + stripper.flush()
+
+
+REPLY = "<think>The user asks about Saturn.</think>\n\nYour Saturn return asks for structure."
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 7, 8, 13, len(REPLY)])
+def test_think_block_is_removed_at_any_chunk_size(app_module, size):
+    chunks = [REPLY[i:i + size] for i in range(0, len(REPLY), size)]
+    assert strip(app_module, chunks) == "Your Saturn return asks for structure."
+
+
+def test_text_around_and_between_think_blocks_is_kept(app_module):
+    chunks = ['Before <thi', 'nk>hidden</th', 'ink> middle <think>', 'more</think>', ' after']
+    assert strip(app_module, chunks) == 'Before middle after'
+
+
+def test_partial_tag_that_is_not_a_tag_is_released(app_module):
+    stripper = app_module.ThinkTagStripper()
+    assert stripper.feed('a <thin') == 'a '
+    assert stripper.feed('g> b') == '<thing> b'
+    assert stripper.flush() == ''
+
+
+def test_unterminated_think_block_is_dropped(app_module):
+    assert strip(app_module, ['visible <think>never closed']) == 'visible '
+
+
+def test_trailing_partial_tag_is_flushed(app_module):
+    assert strip(app_module, ['ends with <']) == 'ends with <'
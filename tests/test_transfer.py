@@ -0,0 +1,129 @@
+import gzip
+import io
+
+import pytest
+
+import chart_model
+from payloads import loads
+from storage import open_store
+from transfer import encode_records, export_records, format_cursor, import_records, parse_cursor, read_lines
+
+
+def make_chart(i):
+    bodies = len(chart_model.BODIES)
+    return chart_model.Chart(f"User {i}", 'Nowhere', (1990, 1, 1 + i % 28, 12, 0),
+                             [(37.0 * i + 11.0 * k) % 360.0 for k in range(bodies)],
+                             [(30.0 * k + i) % 360.0 for k in range(12)],
+                             bytes(1 + (i + k) % 12 for k in range(bodies)), i % 1024).encode()
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def source(request, tmp_path):
+    store = open_store(request.param, str(tmp_path / 'source.db'))
+    for i in range(5):
+        user_id = f"user-{i}"
+        store.create_user(user_id, {'profile': 'sarah', 'chart': make_chart(i), 'chartStatus': 'ready'})
+        store.append_messages(user_id, [{'role': 'user', 'content': f"question {i}"},
+                                        {'role': 'assistant', 'content': f"answer {i}"}])
+    return store
+
+
+def export_body(store, cursor=None, chunk_size=4, compress=True):
+    return b''.join(encode_records(export_records(store, cursor, chunk_size=chunk_size), compress=compress))
+
+
+def records(body):
+    return [loads(line) for line in read_lines(io.BytesIO(body))]
+
+
+def conversations(store):
+    return {user_id: [(m['role'], m['content'], m['createdAt']) for m in store.get_messages(user_id)]
+            for _, user_id, _ in store.iter_users()}
+
+
+@pytest.mark.parametrize('target_backend', ['memory', 'sqlite'])
+def test_round_trip_reproduces_users_and_conversations(source, target_backend, tmp_path):
+    body = export_body(source)
+    assert body[:2] == b'\x1f\x8b'
+
+    target = open_store(target_backend, str(tmp_path / 'target.db'))
+    stats = import_records(target, read_lines(io.BytesIO(body)), chunk_size=3)
+    assert (stats['users'], stats['messages'], stats['skippedUsers'], stats['skippedMessages']) == (5, 10, 0, 0)
+    assert stats['chunks'] == 5
+
+    assert {user_id: user for _, user_id, user in target.iter_users()} == \
+        {user_id: user for _, user_id, user in source.iter_users()}
+    assert conversations(target) == conversations(source)
+    assert stats['cursor'] == records(body)[-1]['cursor']
+
+
+def test_export_layout_and_cursors(source):
+    exported = records(export_body(source, compress=False))
+    assert exported[0]['type'] == 'export'
+    kinds = [r['type'] for r in exported[1:]]
+    # Users first, then messages, with a cursor after every 4 records and at the end.
+    assert kinds[:4] == ['user'] * 4 and kinds[4] == 'cursor'
+    assert kinds.count('user') == 5 and kinds.count('message') == 10
+    assert kinds[-1] == 'cursor' and kinds.count('cursor') == 4
+    messages = [r for r in exported if r['type'] == 'message']
+    assert [m['id'] for m in messages] == sorted(m['id'] for m in messages)
+
+
+def test_export_resumes_after_a_cursor(source):
+    exported = records(export_body(source, compress=False))
+    cursor = [r['cursor'] for r in exported if r['type'] == 'cursor'][1]
+    resumed = records(export_body(source, cursor=cursor, compress=False))
+    tail = exported[[r.get('cursor') for r in exported].index(cursor) + 1:]
+    assert resumed[1:] == tail
+
+
+def test_incremental_export_picks_up_new_messages(source):
+    final = records(export_body(source, compress=False))[-1]['cursor']
+    source.append_messages('user-2', [{'role': 'user', 'content': 'later'}])
+    added = [r for r in records(export_body(source, cursor=final, compress=False)) if r['type'] == 'message']
+    assert [(m['userId'], m['content']) for m in added] == [('user-2', 'later')]
+
+
+def test_reimport_is_a_no_op_and_keeps_existing_users(source, tmp_path):
+    body = export_body(source)
+    target = open_store('sqlite', str(tmp_path / 'target.db'))
+    target.create_user('user-0', {'profile': 'local'})
+    first = import_records(target, read_lines(io.BytesIO(body)))
+    again = import_records(target, read_lines(io.BytesIO(body)))
+    assert (first['users'], first['skippedUsers']) == (4, 1)
+    assert target.get_user('user-0') == {'profile': 'local'}
+    assert (again['users'], again['messages'], again['skippedMessages']) == (0, 0, 10)
+
+    overwritten = import_records(target, read_lines(io.BytesIO(body)), overwrite=True)
+    assert overwritten['users'] == 5
+    assert target.get_user('user-0')['profile'] == 'sarah'
+
+
+def test_cut_off_gzip_export_decodes_up_to_its_last_cursor(source):
+    body = export_body(source)
+    lines = []
+    with pytest.raises(EOFError):
+        for line in read_lines(io.BytesIO(body[:len(body) * 2 // 3])):
+            lines.append(loads(line))
+    assert any(r['type'] == 'cursor' for r in lines)
+    assert gzip.decompress(body).count(b'\n') == len(records(body))
+
+
+def test_import_rejects_bad_lines_and_keeps_what_came_before(tmp_path):
+    target = open_store('memory', str(tmp_path / 'target.db'))
+    lines = ['{"type": "export", "version": 1, "startedAt": "2026-01-01T00:00:00"}',
+             '{"type": "user", "id": "u1", "user": {"profile": "sarah"}}',
+             '{"type": "message", "userId": "u1", "role": "user"}']
+    with pytest.raises(ValueError, match="Line 3: missing field 'content'"):
+        import_records(target, lines)
+    assert target.get_user('u1') == {'profile': 'sarah'}
+
+    with pytest.raises(ValueError, match='unsupported export version'):
+        import_records(target, ['{"type": "export", "version": 99}'])
+
+
+def test_cursor_format():
+    assert parse_cursor(format_cursor(120, 3410)) == (120, 3410)
+    assert parse_cursor(None) == (0, 0)
+    with pytest.raises(ValueError):
+        parse_cursor('m1.u2')
@@ -0,0 +1,206 @@
+"""Streaming NDJSON export and bulk import of users and conversations.
+
+    python transfer.py export oracool.ndjson.gz [--cursor u120.m3410] [--charts]
+    python transfer.py import oracool.ndjson.gz [--chunk-size 1000] [--overwrite]
+
+Both use the store configured by STORE_BACKEND / STORE_PATH and are safe to
+run against the SQLite store while the app is serving. An export is one JSON
+object per line, gzip-compressed unless the output path ends in .ndjson:
+
+    {"type": "export", "version": 1, "backend": "sqlite", "startedAt": ...}
+    {"type": "user", "id": ..., "user": {...}}             chart as its encoded record
+    {"type": "message", "id": 17, "userId": ..., "role": ..., "content": ..., "createdAt": ...}
+    {"type": "cursor", "cursor": "u120.m3410"}
+
+Users come first in write order, then messages in id order. A cursor line
+follows every chunk_size records and ends the export; the gzip stream is
+flushed there, so a cut-off download decodes up to its last cursor. Passing
+that cursor back resumes the export, and the final cursor of one export
+starts the next incremental one: users written since (new or updated) and
+messages added since. With --charts each user line also carries the
+rendered chart JSON for analytics.
+
+Imports run one store transaction per chunk. Messages get new ids from the
+target store (the exported ids are only the export's cursor positions) and
+are skipped when the user already has one with the same createdAt, role and
+content, so importing the same file twice changes nothing. Users already in
+the target are left alone unless overwrite is set, which an incremental sync
+of updated users needs.
+"""
+import argparse
+import gzip
+import io
+import os
+import sys
+import time
+import zlib
+from datetime import datetime
+
+import chart_model
+from payloads import dumps, loads
+
+EXPORT_VERSION = 1
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def parse_cursor(cursor):
+    """(user sequence, message id) from a 'u<seq>.m<id>' cursor; (0, 0) for none."""
+    if not cursor:
+        return 0, 0
+    try:
+        users, messages = cursor.split('.')
+        if users[0] != 'u' or messages[0] != 'm':
+            raise ValueError
+        return int(users[1:]), int(messages[1:])
+    except (ValueError, IndexError):
+        raise ValueError(f"Invalid export cursor: {cursor}") from None
+
+
+def format_cursor(user_seq, message_id):
+    return f"u{user_seq}.m{message_id}"
+
+
+def export_records(store, cursor=None, charts=False, chunk_size=1000):
+    """Export records as dicts, read from the store a page at a time."""
+    user_seq, message_id = parse_cursor(cursor)
+    yield {'type': 'export', 'version': EXPORT_VERSION, 'backend': store.name,
+           'startedAt': datetime.now().isoformat(), 'after': format_cursor(user_seq, message_id)}
+    count = 0
+    for user_seq, user_id, user in store.iter_users(after=user_seq):
+        record = {'type': 'user', 'id': user_id, 'user': user}
+        if charts and chart_model.is_encoded(user.get('chart')):
+            # Not through the render LRU, which holds the charts live users are chatting about.
+            record['chart'] = chart_model.chart_json.__wrapped__(user['chart'])
+        yield record
+        count += 1
+        if count % chunk_size == 0:
+            yield {'type': 'cursor', 'cursor': format_cursor(user_seq, message_id)}
+    for message in store.iter_messages(after=message_id):
+        message_id = message['id']
+        yield dict(message, type='message')
+        count += 1
+        if count % chunk_size == 0:
+            yield {'type': 'cursor', 'cursor': format_cursor(user_seq, message_id)}
+    if count % chunk_size or not count:
+        yield {'type': 'cursor', 'cursor': format_cursor(user_seq, message_id)}
+
+
+def encode_records(records, compress=True, level=6):
+    """NDJSON bytes for an iterable of records; gzip output is flushed after every cursor record."""
+    if not compress:
+        for record in records:
+            yield (dumps(record) + "\n").encode()
+        return
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for record in records:
+        data = compressor.compress((dumps(record) + "\n").encode())
+        if record['type'] == 'cursor':
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def read_lines(stream):
+    """Text lines from a binary stream of NDJSON, gunzipped when it starts with the gzip magic."""
+    stream = io.BufferedReader(stream) if not hasattr(stream, 'peek') else stream
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def import_records(store, lines, chunk_size=1000, overwrite=False):
+    """Load export lines into the store; returns counts and the last cursor seen.
+
+    Raises ValueError for a line that is not a known record, naming the line.
+    Records before it stay imported.
+    """
+    stats = {'users': 0, 'skippedUsers': 0, 'messages': 0, 'skippedMessages': 0, 'chunks': 0, 'cursor': None}
+    users, messages = [], []
+    # Messages exported without a timestamp are stamped with the export's,
+    # which keeps re-imports of the same file idempotent.
+    exported_at = None
+
+    def flush():
+        if not users and not messages:
+            return
+        written_users, written_messages = store.import_batch(users, messages, overwrite)
+        stats['users'] += written_users
+        stats['skippedUsers'] += len(users) - written_users
+        stats['messages'] += written_messages
+        stats['skippedMessages'] += len(messages) - written_messages
+        stats['chunks'] += 1
+        users.clear()
+        messages.clear()
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+            kind = record['type']
+            if kind == 'user':
+                if not isinstance(record['user'], dict):
+                    raise ValueError('user must be an object')
+                users.append((str(record['id']), record['user']))
+            elif kind == 'message':
+                messages.append({'userId': str(record['userId']), 'role': record['role'], 'content': record['content'],
+                                 'createdAt': record.get('createdAt') or exported_at or ''})
+            elif kind == 'cursor':
+                stats['cursor'] = record['cursor']
+            elif kind == 'export':
+                if record.get('version') != EXPORT_VERSION:
+                    raise ValueError(f"unsupported export version {record.get('version')}")
+                exported_at = record.get('startedAt')
+            else:
+                raise ValueError(f"unknown record type {kind}")
+        except KeyError as e:
+            flush()
+            raise ValueError(f"Line {number}: missing field {e}") from None
+        except (TypeError, ValueError) as e:
+            flush()
+            raise ValueError(f"Line {number}: {str(e) or type(e).__name__}") from None
+        if len(users) + len(messages) >= chunk_size:
+            flush()
+    flush()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write users and conversations as NDJSON')
+    export.add_argument('path', help="output file, '-' for stdout")
+    export.add_argument('--cursor', help='resume after this cursor')
+    export.add_argument('--charts', action='store_true', help='add rendered chart JSON to user lines')
+    export.add_argument('--chunk-size', type=int, default=1000, help='records between cursor lines')
+    load = commands.add_parser('import', help='load an export into the store')
+    load.add_argument('path', help="input file (gzip or plain), '-' for stdin")
+    load.add_argument('--chunk-size', type=int, default=1000, help='records per transaction')
+    load.add_argument('--overwrite', action='store_true', help='replace users that already exist')
+    args = parser.parse_args()
+    if args.command == 'export':
+        try:
+            parse_cursor(args.cursor)
+        except ValueError as e:
+            parser.error(str(e))
+
+    from storage import open_store
+    store = open_store(os.environ.get('STORE_BACKEND', 'sqlite'), os.environ.get('STORE_PATH', 'oracool.db'))
+    started = time.perf_counter()
+
+    if args.command == 'export':
+        records = export_records(store, args.cursor, args.charts, args.chunk_size)
+        output = sys.stdout.buffer if args.path == '-' else open(args.path, 'wb')
+        with output:
+            for chunk in encode_records(records, compress=not args.path.endswith('.ndjson')):
+                output.write(chunk)
+        print(f"Exported to {args.path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    else:
+        source = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+        with source:
+            stats = import_records(store, read_lines(source), args.chunk_size, args.overwrite)
+        print(f"Imported {stats['users']} users ({stats['skippedUsers']} existing users kept) and "
+              f"{stats['messages']} messages ({stats['skippedMessages']} duplicates skipped) "
+              f"in {time.perf_counter() - started:.1f}s, "
+              f"last cursor {stats['cursor']}", file=sys.stderr)
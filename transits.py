@@ -0,0 +1,304 @@
+"""Daily ephemeris table and vectorized transits to natal positions.
+
+The table holds one row per day (positions at 12:00 UT) of ecliptic
+longitude and daily speed for the ten planets. It is built with the Swiss
+Ephemeris when first needed, or memory-mapped from a file built once:
+
+    python transits.py build data/ephemeris.bin --start 2020-01-01 --years 30
+
+File layout (little endian): header (magic, version, first day ordinal,
+day count, body count) followed by float32 longitudes (days, bodies) and
+float32 speeds (days, bodies).
+"""
+import argparse
+import os
+import re
+import struct
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from aspects import PLANET_BODIES
+from log import log
+
+MAGIC = b'OEPH'
+VERSION = 1
+HEADER = struct.Struct('<4sHIIH')
+
+DEFAULT_EPHEMERIS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ephemeris.bin')
+
+SIGNS = ('Aries', 'Taurus', 'Gemini', 'Cancer', 'Leo', 'Virgo',
+         'Libra', 'Scorpio', 'Sagittarius', 'Capricorn', 'Aquarius', 'Pisces')
+HOUSE_NAMES = ('1st', '2nd', '3rd', '4th', '5th', '6th', '7th', '8th', '9th', '10th', '11th', '12th')
+
+# Slow movers only: the Sun, Moon and inner planets would add dozens of
+# day-long windows that drown out the ones worth a TIMING section.
+TRANSIT_BODIES = ('Mars', 'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto')
+NATAL_TARGETS = PLANET_BODIES + ('Ascendant', 'Medium_Coeli')
+
+TRANSIT_ASPECTS = (
+    ('conjunction', 0.0, 2.0),
+    ('opposition', 180.0, 2.0),
+    ('square', 90.0, 2.0),
+    ('trine', 120.0, 2.0),
+    ('sextile', 60.0, 1.5),
+)
+
+NATAL_LINE = re.compile(r"^(Sun|Moon|Mercury|Venus|Mars|Jupiter|Saturn|Uranus|Neptune|Pluto) in (\w+) \((\d+)°(\d+)'",
+                        re.MULTILINE)
+ANGLE_LINE = re.compile(r"^(Rising Sign|Midheaven)[^:]*: (\w+) \((\d+)°(\d+)'", re.MULTILINE)
+TRANSITS_BLOCK = re.compile(r"\n*CURRENT TRANSITS[^\n]*:\n(?:- [^\n]*(?:\n|$))*")
+
+
+def compute_table(start, days):
+    """(longitudes, speeds) float32 arrays shaped (days, planets) from the Swiss Ephemeris."""
+    import swisseph as swe
+    import kerykeion
+
+    swe.set_ephe_path(os.path.join(os.path.dirname(kerykeion.__file__), 'sweph'))
+    flags = swe.FLG_SWIEPH | swe.FLG_SPEED
+    bodies = [getattr(swe, name.upper()) for name in PLANET_BODIES]
+    first_jd = swe.julday(start.year, start.month, start.day, 12.0)
+
+    longitudes = np.empty((days, len(bodies)), dtype=np.float32)
+    speeds = np.empty((days, len(bodies)), dtype=np.float32)
+    try:
+        for day in range(days):
+            for i, body in enumerate(bodies):
+                position = swe.calc_ut(first_jd + day, body, flags)[0]
+                longitudes[day, i] = position[0]
+                speeds[day, i] = position[3]
+    finally:
+        # Like Kerykeion after each chart: no open ephemeris files are left
+        # behind, so a process that forks after building the table is safe.
+        swe.close()
+    return longitudes, speeds
+
+
+class Ephemeris:
+    """Daily planet longitudes and speeds from start for a number of days."""
+
+    def __init__(self, start, longitudes, speeds):
+        self.start = start
+        self.longitudes = longitudes
+        self.speeds = speeds
+        self.days = longitudes.shape[0]
+
+    @classmethod
+    def build(cls, start, days):
+        return cls(start, *compute_table(start, days))
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            magic, version, first_day, days, bodies = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or bodies != len(PLANET_BODIES):
+            raise ValueError(f"Unsupported ephemeris file: {path}")
+        table = np.memmap(path, dtype='<f4', mode='r', offset=HEADER.size, shape=(2, days, bodies))
+        return cls(date.fromordinal(first_day), table[0], table[1])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, VERSION, self.start.toordinal(), self.days, len(PLANET_BODIES)))
+            out.write(np.ascontiguousarray(self.longitudes, dtype='<f4').tobytes())
+            out.write(np.ascontiguousarray(self.speeds, dtype='<f4').tobytes())
+
+    def covers(self, first, days):
+        offset = (first - self.start).days
+        return offset >= 0 and offset + days <= self.days
+
+    def rows(self, first, days):
+        offset = (first - self.start).days
+        if offset < 0 or offset >= self.days:
+            raise ValueError(f"{first} is outside the ephemeris table ({self.start} + {self.days} days)")
+        return slice(offset, min(offset + days, self.days))
+
+
+def sign_position(longitude):
+    longitude = float(longitude) % 360.0
+    degrees = longitude % 30.0
+    whole = int(degrees)
+    minutes = int(round((degrees - whole) * 60))
+    if minutes == 60:
+        whole, minutes = whole + 1, 0
+    return SIGNS[int(longitude // 30) % 12], f"{whole}°{minutes:02d}'"
+
+
+def house_of(longitude, cusps):
+    """1-based house for a longitude given twelve cusp longitudes."""
+    for i in range(12):
+        start, end = cusps[i], cusps[(i + 1) % 12]
+        if (longitude - start) % 360.0 < (end - start) % 360.0:
+            return i + 1
+    return 1
+
+
+def whole_sign_cusps(ascendant):
+    first = (ascendant // 30.0) * 30.0
+    return [(first + 30.0 * i) % 360.0 for i in range(12)]
+
+
+def natal_from_text(chart_text):
+    """Natal longitudes parsed from chart text ("Sun in Pisces (24°52')..."), for charts without stored positions."""
+    positions = {}
+    for name, sign, degrees, minutes in NATAL_LINE.findall(chart_text):
+        if sign in SIGNS and name not in positions:
+            positions[name] = SIGNS.index(sign) * 30.0 + int(degrees) + int(minutes) / 60.0
+    for label, sign, degrees, minutes in ANGLE_LINE.findall(chart_text):
+        if sign in SIGNS:
+            key = 'Ascendant' if label == 'Rising Sign' else 'Medium_Coeli'
+            positions[key] = SIGNS.index(sign) * 30.0 + int(degrees) + int(minutes) / 60.0
+    if not positions:
+        return None
+    cusps = whole_sign_cusps(positions['Ascendant']) if 'Ascendant' in positions else None
+    return {'positions': positions, 'cusps': cusps}
+
+
+class TransitEngine:
+    """Transits of the slow planets to a natal chart over a range of days.
+
+    Every (day, transiting body, natal point, aspect) deviation is computed
+    in one broadcast, then contiguous in-orb runs along the day axis become
+    activation windows with their exact (closest) day.
+    """
+
+    def __init__(self, ephemeris, bodies=TRANSIT_BODIES, aspects=TRANSIT_ASPECTS):
+        self.ephemeris = ephemeris
+        self.bodies = bodies
+        self.columns = [PLANET_BODIES.index(b) for b in bodies]
+        self.aspect_names = [name for name, _, _ in aspects]
+        self.angles = np.array([angle for _, angle, _ in aspects], dtype=np.float32)
+        self.orbs = np.array([orb for _, _, orb in aspects], dtype=np.float32)
+
+    def positions(self, day):
+        """Transiting bodies on a day: (name, longitude, retrograde)."""
+        row = self.ephemeris.rows(day, 1).start
+        return [(name, float(self.ephemeris.longitudes[row, col]), bool(self.ephemeris.speeds[row, col] < 0))
+                for name, col in zip(self.bodies, self.columns)]
+
+    def windows(self, natal_positions, first, days):
+        """Activation windows starting from first, ordered by exact date."""
+        names = [n for n in NATAL_TARGETS if n in natal_positions]
+        natal = np.array([natal_positions[n] for n in names], dtype=np.float32)
+        rows = self.ephemeris.rows(first, days)
+        # Day axis last so each (body, point, aspect) series is contiguous.
+        transiting = np.ascontiguousarray(self.ephemeris.longitudes[rows][:, self.columns].T)
+        speeds = self.ephemeris.speeds[rows][:, self.columns]
+
+        distance = np.abs(transiting[:, None, :] - natal[None, :, None]) % np.float32(360.0)
+        distance = np.minimum(distance, np.float32(360.0) - distance)
+        deviation = np.abs(distance[:, :, None, :] - self.angles[None, None, :, None])
+        span = deviation.shape[-1]
+        deviation = deviation.reshape(-1, span)
+        within = deviation <= np.tile(self.orbs, len(self.bodies) * len(names))[:, None]
+
+        active = np.flatnonzero(within.any(axis=1))
+        edges = np.diff(np.pad(within[active], ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        start_row, start_day = np.nonzero(edges == 1)
+        _, end_day = np.nonzero(edges == -1)
+
+        shape = (len(self.bodies), len(names), len(self.aspect_names))
+        found = []
+        for row, s, e in zip(active[start_row].tolist(), start_day.tolist(), end_day.tolist()):
+            exact = s + int(deviation[row, s:e].argmin())
+            t, n, a = np.unravel_index(row, shape)
+            found.append({
+                'transit': self.bodies[t],
+                'natal': names[n],
+                'aspect': self.aspect_names[a],
+                'start': first + timedelta(days=s),
+                'exact': first + timedelta(days=exact),
+                'end': first + timedelta(days=e - 1),
+                'orb': round(float(deviation[row, exact]), 2),
+                'retrograde': bool(speeds[exact, t] < 0),
+                'ongoing': s == 0,
+                'continues': e == span
+            })
+        found.sort(key=lambda w: (w['exact'], self.bodies.index(w['transit'])))
+        return found
+
+    def describe(self, natal, today, lookahead=180, max_windows=12):
+        """CURRENT TRANSITS / UPCOMING ACTIVATION WINDOWS text for a natal chart."""
+        positions = natal['positions']
+        cusps = natal.get('cusps')
+        lines = [f"CURRENT TRANSITS (as of {today.isoformat()}):"]
+        for name, longitude, retrograde in self.positions(today):
+            sign, degree = sign_position(longitude)
+            retro = ', retrograde' if retrograde else ''
+            house = f" transiting your {HOUSE_NAMES[house_of(longitude, cusps) - 1]} House" if cusps else ''
+            lines.append(f"- {name} in {sign} ({degree}{retro}){house}")
+
+        # Look back a little so windows already in orb today report their
+        # real start and exact date instead of being clipped to today.
+        lookback = max(0, min(30, (today - self.ephemeris.start).days))
+        windows = [w for w in self.windows(positions, today - timedelta(days=lookback), lookahead + lookback)
+                   if w['end'] >= today]
+        lines.append("")
+        lines.append(f"UPCOMING ACTIVATION WINDOWS (next {lookahead} days, exact dates from the ephemeris):")
+        if not windows:
+            lines.append("- No major slow-planet transits to natal placements in this period")
+        for w in windows[:max_windows]:
+            natal_name = w['natal'].replace('Medium_Coeli', 'Midheaven')
+            start = f"before {w['start'].isoformat()}" if w['ongoing'] else w['start'].isoformat()
+            end = f"{w['end'].isoformat()}+" if w['continues'] else w['end'].isoformat()
+            retro = ', retrograde pass' if w['retrograde'] else ''
+            lines.append(f"- {w['transit']} {w['aspect']} natal {natal_name}: {start} to {end}, "
+                         f"exact {w['exact'].isoformat()} (orb {w['orb']:.1f}°{retro})")
+        return "\n".join(lines)
+
+
+def chart_with_transits(chart_text, natal, engine, today, lookahead=180):
+    """Chart text with any hardcoded transit block replaced by computed transits."""
+    natal = natal or natal_from_text(chart_text)
+    if engine is None or not natal or not engine.ephemeris.covers(today, lookahead):
+        return chart_text
+    base = TRANSITS_BLOCK.sub("\n", chart_text).rstrip()
+    return f"{base}\n\n{engine.describe(natal, today, lookahead)}"
+
+
+def load_transit_engine(path=None, lookahead=180, table_days=None):
+    """Memory-map the ephemeris file if it covers today plus lookahead, else build a table in memory."""
+    path = path or os.environ.get('TRANSIT_EPHEMERIS_PATH', DEFAULT_EPHEMERIS_PATH)
+    today = date.today()
+    if os.path.exists(path):
+        ephemeris = Ephemeris.open(path)
+        if ephemeris.covers(today, lookahead):
+            log.info(f"Transit ephemeris mapped from {path}: {ephemeris.start} + {ephemeris.days} days")
+            return TransitEngine(ephemeris)
+        log.warning(f"Transit ephemeris at {path} does not cover {today} + {lookahead} days, rebuilding in memory")
+
+    table_days = table_days or max(lookahead, 366) * 2
+    start = today - timedelta(days=30)
+    ephemeris = Ephemeris.build(start, table_days)
+    log.info(f"Transit ephemeris built in memory: {start} + {table_days} days")
+    return TransitEngine(ephemeris)
+
+
+shared_engines = {}
+shared_engines_lock = threading.Lock()
+
+
+def shared_transit_engine(lookahead=180):
+    """load_transit_engine once per process; workers forked after the first call inherit the table."""
+    with shared_engines_lock:
+        engine = shared_engines.get(lookahead)
+        if engine is None:
+            engine = shared_engines[lookahead] = load_transit_engine(lookahead=lookahead)
+        return engine
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build an ephemeris table file')
+    build.add_argument('path', nargs='?', default=DEFAULT_EPHEMERIS_PATH)
+    build.add_argument('--start', default=f"{date.today().year - 1}-01-01")
+    build.add_argument('--years', type=int, default=10)
+    args = parser.parse_args()
+
+    first = date.fromisoformat(args.start)
+    count = (date(first.year + args.years, first.month, first.day) - first).days
+    Ephemeris.build(first, count).save(args.path)
+    print(f"Wrote {args.path}: {first} + {count} days")
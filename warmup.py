@@ -0,0 +1,77 @@
+"""Background warm-up of the chart stack, reported through /health.
+
+The app imports without Kerykeion or the transit table, so /health/live
+answers as soon as the module is loaded. A Warmup then runs the loading
+steps in order on a daemon thread (WARMUP=background), before the app
+serves (eager), or not at all (lazy: each piece loads on first use).
+/health stays 503 until every step has finished.
+
+Under gunicorn, GUNICORN_PRELOAD_CHARTS=1 runs preload() in the master
+before it forks, so workers inherit the imported modules and the transit
+table copy-on-write instead of each loading their own.
+"""
+import threading
+import time
+
+from log import log
+
+MODES = ('background', 'eager', 'lazy')
+
+
+class Warmup:
+    def __init__(self, steps, mode='background'):
+        """steps is a list of (name, fn) run in order."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown warm-up mode: {mode}")
+        self.steps = steps
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.state = {name: {'status': 'pending', 'seconds': None} for name, _ in steps}
+        self.done = threading.Event()
+        if mode == 'lazy':
+            self.done.set()
+        elif mode == 'eager':
+            self.run()
+        else:
+            threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    def run(self):
+        started = time.perf_counter()
+        for name, fn in self.steps:
+            with self.lock:
+                self.state[name]['status'] = 'running'
+            step_started = time.perf_counter()
+            try:
+                fn()
+                status = 'done'
+            except Exception as e:
+                # The step loads again on first use, so a failure only costs that request the time.
+                log.exception(f"Warm-up step {name} failed: {str(e)}")
+                status = 'failed'
+            with self.lock:
+                self.state[name] = {'status': status, 'seconds': round(time.perf_counter() - step_started, 3)}
+        log.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+        self.done.set()
+
+    def ready(self):
+        return self.done.is_set()
+
+    def stats(self):
+        with self.lock:
+            return {'mode': self.mode, 'ready': self.done.is_set(),
+                    'steps': {name: dict(step) for name, step in self.state.items()}}
+
+
+def preload(lookahead):
+    """Load what forked workers can share: Kerykeion's modules and the transit table.
+
+    Only import-time and table memory is shared. Kerykeion and compute_table
+    close the Swiss Ephemeris files after use, so no file handle crosses the fork.
+    """
+    import kerykeion  # noqa: F401
+    from kerykeion import AstrologicalSubject  # noqa: F401
+    from transits import shared_transit_engine
+
+    started = time.perf_counter()
+    shared_transit_engine(lookahead)
+    log.info(f"Chart stack preloaded in {time.perf_counter() - started:.2f}s")